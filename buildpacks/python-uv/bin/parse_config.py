@@ -1,3 +1,5 @@
+import hashlib
+import json
 import sys
 import os
 
@@ -41,10 +43,49 @@ def parse_pyproject():
                 script_name = list(scripts.keys())[0]
                 
         print(f"SCRIPT_NAME={script_name}")
+
+        # Module of the entry point script ("pkg.cli:main" -> "pkg.cli")
+        entry_module = ""
+        if script_name:
+            entry_module = str(scripts[script_name]).split(":")[0].strip()
+        print(f"ENTRY_MODULE={entry_module}")
+
+        # Optional build stages
+        compile_bytecode = str(tool_luban.get("bp-compile-bytecode", False)).lower() == "true"
+        print(f"COMPILE_BYTECODE={'true' if compile_bytecode else 'false'}")
+        importtime = str(tool_luban.get("bp-importtime-profile", False)).lower() == "true"
+        print(f"IMPORTTIME_PROFILE={'true' if importtime else 'false'}")
+
+        # uv installs the project itself when it has a build system,
+        # unless tool.uv.package says otherwise
+        package = data.get("tool", {}).get("uv", {}).get("package")
+        if package is None:
+            package = "build-system" in data
+        print(f"PROJECT_PACKAGE={'true' if package else 'false'}")
         
     except Exception as e:
         print(f"Error parsing pyproject.toml: {e}", file=sys.stderr)
         sys.exit(1)
 
+def uv_settings_hash():
+    """
+    Hash of the pyproject.toml settings that change what `uv sync` installs
+    from an unchanged uv.lock: the [tool.uv] table (default-groups, sources,
+    indexes, build isolation, ...) and [dependency-groups].
+    """
+    data = {}
+    if os.path.exists("pyproject.toml"):
+        with open("pyproject.toml", "rb") as f:
+            data = tomllib.load(f)
+    settings = {
+        "tool.uv": data.get("tool", {}).get("uv", {}),
+        "dependency-groups": data.get("dependency-groups", {}),
+    }
+    encoded = json.dumps(settings, sort_keys=True, default=str).encode("utf-8")
+    print(hashlib.sha256(encoded).hexdigest())
+
 if __name__ == "__main__":
-    parse_pyproject()
+    if sys.argv[1:] == ["--uv-settings"]:
+        uv_settings_hash()
+    else:
+        parse_pyproject()
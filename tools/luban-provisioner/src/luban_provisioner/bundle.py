@@ -0,0 +1,130 @@
+"""
+Single-file template bundles.
+
+A bundle is an uncompressed zip archive of the templates directory with
+sorted entries and fixed timestamps, so the same tree always produces the
+same bytes. Only the central directory is parsed on open; the file is
+memory-mapped and member contents are sliced out of the mapping on first
+use, which is why members must be stored uncompressed. This module only uses
+the standard library so the image build can create a bundle before the
+provisioner's dependencies are installed:
+
+    python -m luban_provisioner.bundle templates templates.zip
+"""
+
+import mmap
+import os
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import zipfile
+
+# Fixed member timestamp, the earliest a zip archive can record.
+_EPOCH = (1980, 1, 1, 0, 0, 0)
+# Local file header: signature ... file name length, extra field length.
+_LOCAL_HEADER = struct.Struct("<4s22xHH")
+
+
+def _fingerprint(st):
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def build_bundle(templates_dir, bundle_path):
+    """Pack every file under templates_dir into bundle_path. Returns the member count."""
+    members = []
+    for root, dirs, files in os.walk(templates_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            members.append((os.path.relpath(path, templates_dir).replace(os.sep, "/"), path))
+
+    tmp = f"{bundle_path}.tmp"
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_STORED) as archive:
+        for rel, path in members:
+            info = zipfile.ZipInfo(rel, _EPOCH)
+            executable = os.stat(path).st_mode & stat.S_IXUSR
+            info.external_attr = (stat.S_IFREG | (0o755 if executable else 0o644)) << 16
+            with open(path, "rb") as f:
+                archive.writestr(info, f.read())
+    os.replace(tmp, bundle_path)
+    return len(members)
+
+
+class TemplateBundle:
+    """A memory-mapped bundle whose members are read lazily."""
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        with open(self.path, "rb") as f:
+            self.fingerprint = _fingerprint(os.fstat(f.fileno()))
+            with zipfile.ZipFile(f) as archive:
+                infos = [info for info in archive.infolist() if not info.is_dir()]
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for info in infos:
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{self.path}: {info.filename} is compressed; rebuild the bundle")
+        self._members = {info.filename: info for info in infos}
+        self._lock = threading.Lock()
+        self._extracted = {}
+
+    def is_current(self):
+        """False once the file on disk was replaced or rewritten."""
+        try:
+            return _fingerprint(os.stat(self.path)) == self.fingerprint
+        except OSError:
+            return False
+
+    def names(self, prefix=""):
+        """Member names under prefix, relative to it, in archive order."""
+        return [name[len(prefix) :] for name in self._members if name.startswith(prefix)]
+
+    def has(self, name):
+        return name in self._members
+
+    def read(self, name):
+        info = self._members[name]
+        signature, name_len, extra_len = _LOCAL_HEADER.unpack_from(self._map, info.header_offset)
+        if signature != b"PK\x03\x04":
+            raise ValueError(f"{self.path}: bad local header for {name}")
+        start = info.header_offset + _LOCAL_HEADER.size + name_len + extra_len
+        return self._map[start : start + info.file_size]
+
+    def executable(self, name):
+        return bool((self._members[name].external_attr >> 16) & stat.S_IXUSR)
+
+    def extract(self, prefix):
+        """Write the members under prefix to a temporary directory once and return it."""
+        with self._lock:
+            target = self._extracted.get(prefix)
+            if target:
+                return target
+            target = tempfile.mkdtemp(prefix="luban-template-")
+            for name, info in self._members.items():
+                if not name.startswith(prefix):
+                    continue
+                path = os.path.join(target, *name[len(prefix) :].split("/"))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(self.read(name))
+                if (info.external_attr >> 16) & stat.S_IXUSR:
+                    os.chmod(path, 0o755)
+            self._extracted[prefix] = target
+            return target
+
+
+def main(argv=None):
+    args = sys.argv[1:] if argv is None else argv
+    if len(args) != 2:
+        print(
+            "usage: python -m luban_provisioner.bundle TEMPLATES_DIR BUNDLE_PATH", file=sys.stderr
+        )
+        return 2
+    count = build_bundle(args[0], args[1])
+    print(f"Bundled {count} template files into {args[1]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from luban_provisioner.commands.gitops import _gitops_impl
+from luban_provisioner.commands.source import _source_impl
+from luban_provisioner.provider_factory import get_git_provider
+from luban_provisioner.providers.http import (
+    DEFAULT_POOL_MAXSIZE,
+    build_session,
+    rate_limit_status,
+)
+from luban_provisioner.utils import (
+    apply_git_https_config,
+    configure_git_https_auth,
+    configure_git_identity,
+    load_config,
+)
+
+GITOPS_KEYS = (
+    "container_port",
+    "service_port",
+    "domain_suffix",
+    "default_image_name",
+    "default_image_tag",
+    "template_type",
+)
+
+
+def _load_manifest(manifest_file):
+    """
+    Load a batch manifest (YAML/JSON):
+
+        defaults:            # optional, merged into every app's source/gitops section
+          gitops: {domain_suffix: example.com}
+        apps:
+          - project_name: team-a
+            application_name: orders
+            source: {template_type: python}          # omit to skip source
+            gitops: {container_port: 8080, service_port: 80, set: {key: value}}
+    """
+    if not os.path.exists(manifest_file):
+        raise click.ClickException(f"Manifest not found: {manifest_file}")
+    manifest = load_config(manifest_file) or {}
+    apps = manifest.get("apps") or []
+    if not isinstance(apps, list) or not apps:
+        raise click.ClickException(f"Manifest {manifest_file} does not list any apps")
+
+    defaults = manifest.get("defaults") or {}
+    entries = []
+    for app in apps:
+        if not app.get("project_name") or not app.get("application_name"):
+            raise click.ClickException(
+                f"Manifest entry is missing project_name/application_name: {app}"
+            )
+        entry = dict(app)
+        for kind in ("source", "gitops"):
+            if kind in app:
+                entry[kind] = {**(defaults.get(kind) or {}), **(app.get(kind) or {})}
+        entries.append(entry)
+    return entries
+
+
+class _ProviderPool:
+    """
+    One provider per project, all sharing a single pooled HTTP session.
+
+    Each provider loads the repository inventory once, so existence checks for
+    every app in the project are served from it.
+    """
+
+    def __init__(self, git_provider, git_token, git_server, git_base_url, organization, session):
+        self._args = (git_provider, git_token, git_server, git_base_url)
+        self._organization = organization
+        self._session = session
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def get(self, project_name):
+        with self._lock:
+            if project_name not in self._providers:
+                git_provider, git_token, git_server, git_base_url = self._args
+                provider = get_git_provider(
+                    git_provider,
+                    git_token,
+                    server=git_server,
+                    organization=self._organization or project_name,
+                    project=project_name,
+                    base_url=git_base_url,
+                    session=self._session,
+                )
+                provider.load_repo_index()
+                self._providers[project_name] = provider
+            return self._providers[project_name]
+
+
+@click.command(name="batch")
+@click.option("--manifest", required=True, help="YAML/JSON manifest listing projects and apps")
+@click.option("--output-dir", required=True, help="Directory to output the rendered templates")
+@click.option("--git-organization", default="metasync", help="Git Organization")
+@click.option("--git-provider", default="github", help="Git Provider")
+@click.option(
+    "--git-username", envvar="GIT_USERNAME", default="git", help="Git Username (env: GIT_USERNAME)"
+)
+@click.option("--git-token", envvar="GIT_TOKEN", required=True, help="Git Token (env: GIT_TOKEN)")
+@click.option(
+    "--git-server", envvar="GIT_SERVER", required=True, help="Git Server Domain (env: GIT_SERVER)"
+)
+@click.option("--webhook-url", required=False, help="Default webhook URL for source repos")
+@click.option("--webhook-secret", envvar="WEBHOOK_SECRET", help="Webhook Secret")
+@click.option("--config-file", required=False, help="Path to configuration file (YAML/JSON)")
+@click.option(
+    "--max-workers", default=4, show_default=True, type=click.IntRange(min=1), help="Parallel apps"
+)
+def batch(
+    manifest,
+    output_dir,
+    git_organization,
+    git_provider,
+    git_username,
+    git_token,
+    git_server,
+    webhook_url,
+    webhook_secret,
+    config_file,
+    max_workers,
+):
+    """Provision source and GitOps repositories for many applications in one run."""
+    entries = _load_manifest(manifest)
+    config = load_config(config_file)
+
+    # Credentials and the HTTP connection pool are set up once for the whole batch.
+    git_base_url = apply_git_https_config(config, git_provider, git_server)
+    configure_git_https_auth(git_username, git_token, git_server)
+    configure_git_identity()
+
+    session = build_session(pool_maxsize=max(DEFAULT_POOL_MAXSIZE, max_workers))
+    providers = _ProviderPool(
+        git_provider, git_token, git_server, git_base_url, git_organization, session
+    )
+    git_args = (git_provider, git_server, git_base_url, git_username, git_token)
+    # Hooked templates are rendered by cookiecutter, which changes the process
+    # working directory; paths used by the workers must not depend on it.
+    output_dir = os.path.abspath(output_dir)
+
+    def provision(entry):
+        project_name = entry["project_name"]
+        application_name = entry["application_name"]
+        provider = providers.get(project_name)
+        org = git_organization or project_name
+        app_output_dir = os.path.join(output_dir, project_name)
+        results = []
+
+        # render -> create -> push, source before gitops for each app
+        for kind in ("source", "gitops"):
+            if kind not in entry:
+                continue
+            spec = dict(entry[kind])
+            extra_context = {k: str(v) for k, v in (spec.pop("set", None) or {}).items()}
+            try:
+                if kind == "source":
+                    status = _source_impl(
+                        provider,
+                        project_name,
+                        application_name,
+                        app_output_dir,
+                        config,
+                        extra_context,
+                        *git_args,
+                        org,
+                        template_type=spec.get("template_type", "python"),
+                        webhook_url=spec.get("webhook_url") or webhook_url,
+                        webhook_secret=webhook_secret,
+                        setup_git_auth=False,
+                    )
+                else:
+                    status = _gitops_impl(
+                        provider,
+                        project_name,
+                        application_name,
+                        app_output_dir,
+                        config,
+                        extra_context,
+                        *git_args,
+                        org,
+                        setup_git_auth=False,
+                        **{k: spec[k] for k in GITOPS_KEYS if spec.get(k) is not None},
+                    )
+            except click.ClickException as e:
+                status = f"failed: {e.format_message()}"
+            except subprocess.CalledProcessError as e:
+                status = f"failed: {e}"
+            except Exception as e:
+                status = f"failed: {type(e).__name__}: {e}"
+            results.append((f"{project_name}/{application_name}", kind, status))
+        return results
+
+    click.echo(f"Provisioning {len(entries)} application(s) with {max_workers} worker(s)...")
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            report = [row for rows in executor.map(provision, entries) for row in rows]
+    finally:
+        session.close()
+
+    click.echo("Batch summary:")
+    width = max(len(name) for name, _, _ in report) if report else 0
+    for name, kind, status in report:
+        click.echo(f"  {name:<{width}}  {kind:<6}  {status}")
+
+    for host, budget in rate_limit_status().items():
+        if budget["remaining"] is not None:
+            click.echo(
+                f"API budget for {host}: {budget['remaining']} request(s) left, "
+                f"pacing at {budget['rate']:.1f}/s"
+            )
+
+    failed = [row for row in report if row[2].startswith("failed")]
+    if failed:
+        click.echo(f"{len(failed)} of {len(report)} provisioning step(s) failed.", err=True)
+        sys.exit(1)
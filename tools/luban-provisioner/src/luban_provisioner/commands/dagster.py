@@ -1,3 +1,4 @@
+import io
 import os
 import shutil
 import subprocess
@@ -7,7 +8,163 @@ import click
 from ruamel.yaml import YAML
 
 from luban_provisioner.provider_factory import get_git_provider, get_remote_url
-from luban_provisioner.utils import configure_git_https_auth, configure_git_identity, run_git
+from luban_provisioner.utils import (
+    GITOPS_EDIT_MODES,
+    clone_git_repo,
+    configure_git_https_auth,
+    configure_git_identity,
+    edit_files_in_tree,
+    run_git,
+)
+
+
+def _workspace_paths(environment):
+    overlay_dir = os.path.join("app", "overlays", environment)
+    return (
+        os.path.join(overlay_dir, "dagster-workspace-cm.yaml"),
+        os.path.join(overlay_dir, "kustomization.yaml"),
+        os.path.join("app", "base", "dagster", "dagster-workspace-cm.yaml"),
+    )
+
+
+def _dump(yaml, data):
+    out = io.StringIO()
+    yaml.dump(data, out)
+    return out.getvalue()
+
+
+def _register_in_workspace(files, environment, location_name, location_host, location_port):
+    """
+    Add or update a grpc_server code location in the overlay workspace.
+
+    files maps the overlay workspace, overlay kustomization and base workspace
+    paths to their text (None when missing); the changed files are returned
+    as {path: new text}. Pure text in and out, so every edit mode shares it.
+    """
+    workspace_file, kustomization_file, base_workspace = _workspace_paths(environment)
+    if files.get(kustomization_file) is None:
+        raise ValueError(f"Environment overlay '{environment}' does not exist in platform repo.")
+
+    yaml = YAML()
+    yaml.preserve_quotes = True
+    changes = {}
+
+    workspace_text = files.get(workspace_file)
+    if workspace_text is None:
+        # The overlay still uses the base workspace: start from a copy of it,
+        # since the env overlay lists all locations of that environment.
+        click.echo(f"Creating {workspace_file}...")
+        workspace_text = files.get(base_workspace) or "load_from: []\n"
+
+        # Regenerate the base 'dagster-workspace' ConfigMap from the overlay file.
+        kust_data = yaml.load(files[kustomization_file])
+        if "configMapGenerator" not in kust_data:
+            kust_data["configMapGenerator"] = []
+
+        gen_found = False
+        for gen in kust_data["configMapGenerator"]:
+            if gen.get("name") == "dagster-workspace":
+                gen_found = True
+                break
+
+        if not gen_found:
+            kust_data["configMapGenerator"].append(
+                {
+                    "name": "dagster-workspace",
+                    "behavior": "merge",  # or replace
+                    "files": ["workspace.yaml=dagster-workspace-cm.yaml"],
+                }
+            )
+            changes[kustomization_file] = _dump(yaml, kust_data)
+
+    workspace_data = yaml.load(workspace_text)
+    if "load_from" not in workspace_data:
+        workspace_data["load_from"] = []
+
+    # Check if location already exists
+    exists = False
+    for entry in workspace_data["load_from"]:
+        if "grpc_server" in entry:
+            if entry["grpc_server"].get("location_name") == location_name:
+                click.echo(f"Code location '{location_name}' already exists. Updating...")
+                entry["grpc_server"]["host"] = location_host
+                entry["grpc_server"]["port"] = location_port
+                exists = True
+                break
+
+    if not exists:
+        click.echo(f"Adding new code location '{location_name}'...")
+        workspace_data["load_from"].append(
+            {
+                "grpc_server": {
+                    "host": location_host,
+                    "port": location_port,
+                    "location_name": location_name,
+                }
+            }
+        )
+
+    workspace_text = _dump(yaml, workspace_data)
+    if workspace_text != files.get(workspace_file):
+        changes[workspace_file] = workspace_text
+    return changes
+
+
+def _read_files(root, paths):
+    files = {}
+    for path in paths:
+        full = os.path.join(root, path)
+        if os.path.exists(full):
+            with open(full, "r", encoding="utf-8") as f:
+                files[path] = f.read()
+        else:
+            files[path] = None
+    return files
+
+
+def _register_with_clone(repo_url, environment, mutate, commit_msg):
+    """Apply mutate to a sparse checkout of develop, then commit and push. Returns True if pushed."""
+    work_dir = tempfile.mkdtemp()
+    try:
+        try:
+            # Only the env overlay and the base workspace config are needed.
+            clone_git_repo(
+                repo_url,
+                work_dir,
+                branch="develop",
+                mode="sparse",
+                sparse_paths=[
+                    os.path.join("app", "overlays", environment),
+                    os.path.join("app", "base", "dagster"),
+                ],
+            )
+        except subprocess.CalledProcessError:
+            click.echo("Failed to clone repository. Check credentials and URL.", err=True)
+            exit(1)
+
+        if not os.path.exists(os.path.join(work_dir, "app", "overlays", environment)):
+            raise ValueError(
+                f"Environment overlay '{environment}' does not exist in platform repo."
+            )
+
+        for path, text in mutate(_read_files(work_dir, _workspace_paths(environment))).items():
+            with open(os.path.join(work_dir, path), "w", encoding="utf-8") as f:
+                f.write(text)
+
+        status = run_git(
+            ["status", "--porcelain"], cwd=work_dir, capture_output=True, text=True, check=False
+        )
+        if not status.stdout.strip():
+            return False
+
+        run_git(["add", "."], cwd=work_dir, check=True)
+        run_git(["commit", "-m", commit_msg], cwd=work_dir, check=True)
+
+        click.echo("Pushing to develop...")
+        run_git(["push", "origin", "develop"], cwd=work_dir, check=True)
+        return True
+    finally:
+        shutil.rmtree(work_dir)
 
 
 @click.group()
@@ -38,6 +195,15 @@ def dagster():
     default="",
     help="Git base URL (optional, supports path prefixes)",
 )
+@click.option(
+    "--edit-mode",
+    type=click.Choice(GITOPS_EDIT_MODES),
+    default="clone",
+    show_default=True,
+    envvar="LUBAN_GITOPS_EDIT_MODE",
+    help="clone: sparse checkout + commit; tree: edit git objects without a checkout; "
+    "api: edit through the provider's file API",
+)
 def register_location(
     platform_project,
     platform_app,
@@ -51,6 +217,7 @@ def register_location(
     git_token,
     git_server,
     git_base_url,
+    edit_mode,
 ):
     """
     Register a Code Location in the Dagster Platform's workspace.yaml.
@@ -59,12 +226,21 @@ def register_location(
         f"Registering code location '{location_name}' in platform '{platform_app}' ({environment})..."
     )
 
-    configure_git_https_auth(git_username, git_token, git_server)
-    configure_git_identity()
+    if edit_mode != "api":
+        configure_git_https_auth(git_username, git_token, git_server)
+        configure_git_identity()
 
-    # 2. Clone Platform GitOps Repo
+    # 2. Resolve Platform GitOps Repo
     platform_repo_name = f"{platform_app}-gitops"
     org = git_organization if git_organization else platform_project
+    provider = get_git_provider(
+        git_provider,
+        git_token,
+        server=git_server,
+        organization=org,
+        project=platform_project,
+        base_url=git_base_url,
+    )
     repo_url = get_remote_url(
         git_provider,
         git_token,
@@ -75,164 +251,38 @@ def register_location(
         base_url=git_base_url,
     )
 
-    work_dir = tempfile.mkdtemp()
-    click.echo(f"Cloning {repo_url} into {work_dir}...")
-
-    try:
-        # Clone develop by default as we likely push to develop for SND and maybe PRD depending on flow
-        # But for PRD setup, we might target main?
-        # Let's follow the standard: changes go to 'develop' -> PR -> 'main'.
-        # However, 'setup' workflow might want to write directly if allowed.
-        # For simplicity in 'setup', we'll try to checkout 'develop'.
-        run_git(["clone", "-b", "develop", repo_url, work_dir], check=True)
-    except subprocess.CalledProcessError:
-        click.echo("Failed to clone repository. Check credentials and URL.", err=True)
-        # Clean up
-        shutil.rmtree(work_dir)
-        exit(1)
+    # Changes go to 'develop' -> PR -> 'main'.
+    commit_msg = f"Register code location '{location_name}' in {environment}"
 
-    cwd = os.getcwd()
-    os.chdir(work_dir)
+    def mutate(files):
+        return _register_in_workspace(
+            files, environment, location_name, location_host, location_port
+        )
 
     try:
-        # 3. Locate/Create Environment Overlay
-        overlay_dir = os.path.join("app", "overlays", environment)
-        workspace_file = os.path.join(overlay_dir, "dagster-workspace-cm.yaml")
-        kustomization_file = os.path.join(overlay_dir, "kustomization.yaml")
-
-        if not os.path.exists(overlay_dir):
-            click.echo(
-                f"Error: Environment overlay '{environment}' does not exist in platform repo.",
-                err=True,
-            )
-            exit(1)
-
-        yaml = YAML()
-        yaml.preserve_quotes = True
-
-        # 4. Check/Create dagster-workspace-cm.yaml in overlay
-        # If it doesn't exist, we need to create it and add it to kustomization
-        if not os.path.exists(workspace_file):
-            click.echo(f"Creating {workspace_file}...")
-            # Create basic structure
-            # We need to see what's in base to know if we are replacing or merging.
-            # Usually, workspace is a replacement because it's a list of locations.
-
-            # Read base to check structure if needed, but we'll just start fresh for the overlay
-            # assuming we want to override the base entirely or extend it.
-            # Best practice for workspace: Define all locations for the env in the env overlay.
-            # But wait, if we have multiple code locations, we want to APPEND.
-
-            # If the file doesn't exist in overlay, it means we are using base currently.
-            # We should copy base content to overlay start with.
-            base_workspace = os.path.join("app", "base", "dagster", "dagster-workspace-cm.yaml")
-            if os.path.exists(base_workspace):
-                shutil.copy(base_workspace, workspace_file)
-            else:
-                # Fallback if base is missing (unlikely)
-                with open(workspace_file, "w") as f:
-                    f.write("load_from: []\n")
-
-            # Update kustomization to use this generator/patch
-            # We need to replace the base generator or patch it.
-            # The template uses configMapGenerator with behavior: merge/replace?
-            # Let's check kustomization.yaml
-
-            with open(kustomization_file, "r") as f:
-                kust_data = yaml.load(f)
-
-            # We need to ensure we are replacing the workspace configmap
-            # The base defines:
-            # configMapGenerator:
-            #   - name: dagster-workspace
-            #     files: [workspace.yaml=dagster-workspace-cm.yaml]
-
-            # In overlay, we want to override this file content.
-            # Standard Kustomize: redefine the generator with 'behavior: replace' or just same name?
-            # If we define the same generator name in overlay, it merges/overrides depending on Kustomize version.
-            # Safer: Use a patch or just redefine generator.
-
-            # Let's check if configMapGenerator exists in overlay kust
-            if "configMapGenerator" not in kust_data:
-                kust_data["configMapGenerator"] = []
-
-            # Check if 'dagster-workspace' generator is already there
-            gen_found = False
-            for gen in kust_data["configMapGenerator"]:
-                if gen.get("name") == "dagster-workspace":
-                    gen_found = True
-                    break
-
-            if not gen_found:
-                kust_data["configMapGenerator"].append(
-                    {
-                        "name": "dagster-workspace",
-                        "behavior": "merge",  # or replace
-                        "files": ["workspace.yaml=dagster-workspace-cm.yaml"],
-                    }
+        # 3-6. Update the overlay workspace (and kustomization) and push develop
+        if edit_mode == "tree":
+            paths = list(_workspace_paths(environment))
+            commit = edit_files_in_tree(repo_url, "develop", paths, mutate, commit_msg)
+            pushed = commit is not None
+        elif edit_mode == "api":
+            paths = list(_workspace_paths(environment))
+            try:
+                commit = provider.update_files(
+                    platform_repo_name, "develop", paths, mutate, commit_msg
                 )
-
-                with open(kustomization_file, "w") as f:
-                    yaml.dump(kust_data, f)
-
-        # 5. Parse and Update Workspace Config
-        with open(workspace_file, "r") as f:
-            workspace_data = yaml.load(f)
-
-        if "load_from" not in workspace_data:
-            workspace_data["load_from"] = []
-
-        # Check if location already exists
-        exists = False
-        for entry in workspace_data["load_from"]:
-            if "grpc_server" in entry:
-                if entry["grpc_server"].get("location_name") == location_name:
-                    click.echo(f"Code location '{location_name}' already exists. Updating...")
-                    entry["grpc_server"]["host"] = location_host
-                    entry["grpc_server"]["port"] = location_port
-                    exists = True
-                    break
-
-        if not exists:
-            click.echo(f"Adding new code location '{location_name}'...")
-            workspace_data["load_from"].append(
-                {
-                    "grpc_server": {
-                        "host": location_host,
-                        "port": location_port,
-                        "location_name": location_name,
-                    }
-                }
-            )
-
-        with open(workspace_file, "w") as f:
-            yaml.dump(workspace_data, f)
-
-        # 6. Commit and Push
-        status = run_git(["status", "--porcelain"], capture_output=True, text=True, check=False)
-        if not status.stdout.strip():
+            except RuntimeError as e:
+                raise ValueError(str(e))
+            pushed = commit is not None
+        else:
+            pushed = _register_with_clone(repo_url, environment, mutate, commit_msg)
+        if not pushed:
             click.echo("No changes to register.")
             return
 
-        commit_msg = f"Register code location '{location_name}' in {environment}"
-        run_git(["add", "."], check=True)
-        run_git(["commit", "-m", commit_msg], check=True)
-
-        click.echo("Pushing to develop...")
-        run_git(["push", "origin", "develop"], check=True)
-
         if environment == "prd":
             click.echo("Environment is PRD. Creating Pull Request to merge changes to 'main'...")
 
-            provider = get_git_provider(
-                git_provider,
-                git_token,
-                server=git_server,
-                organization=org,
-                project=platform_project,
-                base_url=git_base_url,
-            )
-
             pr_title = f"Register Code Location: {location_name}"
             pr_body = (
                 f"Automated registration of Dagster Code Location '{location_name}'.\n\n"
@@ -254,12 +304,12 @@ def register_location(
                 click.echo(f"Warning: Failed to create Pull Request: {pr_err}", err=True)
                 # Don't fail the whole workflow, as the push to develop succeeded.
 
+    except ValueError as e:
+        click.echo(f"Error: {e}", err=True)
+        exit(1)
     except Exception as e:
         click.echo(f"Error registering location: {e}", err=True)
         exit(1)
-    finally:
-        os.chdir(cwd)
-        shutil.rmtree(work_dir)
 
 
 dagster.add_command(register_location)
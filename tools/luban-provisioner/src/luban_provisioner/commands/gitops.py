@@ -1,9 +1,10 @@
 import os
-import sys
 
 import click
 
+from luban_provisioner import templating
 from luban_provisioner.provider_factory import get_git_provider, get_remote_url
+from luban_provisioner.providers.aio import AsyncGitProvider, run_concurrently
 from luban_provisioner.utils import (
     apply_git_https_config,
     configure_git_https_auth,
@@ -72,6 +73,68 @@ def gitops(
         else:
             click.echo(f"Warning: Invalid set option '{item}'. Must be key=value", err=True)
 
+    org = git_organization if git_organization else project_name
+
+    git_base_url = apply_git_https_config(config, git_provider, git_server)
+    provider = get_git_provider(
+        git_provider,
+        git_token,
+        server=git_server,
+        organization=org,
+        project=project_name,
+        base_url=git_base_url,
+    )
+
+    _gitops_impl(
+        provider,
+        project_name,
+        application_name,
+        output_dir,
+        config,
+        cli_extra_context,
+        git_provider,
+        git_server,
+        git_base_url,
+        git_username,
+        git_token,
+        org,
+        container_port=container_port,
+        service_port=service_port,
+        domain_suffix=domain_suffix,
+        default_image_name=default_image_name,
+        default_image_tag=default_image_tag,
+        template_type=template_type,
+    )
+
+
+def _gitops_impl(
+    provider,
+    project_name,
+    application_name,
+    output_dir,
+    config,
+    cli_extra_context,
+    git_provider,
+    git_server,
+    git_base_url,
+    git_username,
+    git_token,
+    org,
+    container_port=None,
+    service_port=None,
+    domain_suffix=None,
+    default_image_name=None,
+    default_image_tag=None,
+    template_type="standard",
+    setup_git_auth=True,
+):
+    """
+    Render, create and push one GitOps repository.
+
+    Returns "created" or "exists"; raises click.ClickException on failure.
+    Set setup_git_auth=False when git credentials are already configured.
+    """
+    output_dir = os.path.abspath(output_dir)
     # Merge config with CLI args (CLI args take precedence if provided, otherwise fallback to config)
     # Note: For optional args, we check if they are None from CLI
 
@@ -89,46 +152,33 @@ def gitops(
     is_dagster_code_location = template_type == "dagster-code-location"
 
     if not container_port and not is_dagster:
-        click.echo(
-            "Error: --container-port is required (or must be in config file) for standard templates",
-            err=True,
+        raise click.ClickException(
+            "--container-port is required (or must be in config file) for standard templates"
         )
-        sys.exit(1)
     if not service_port and not is_dagster:
-        click.echo(
-            "Error: --service-port is required (or must be in config file) for standard templates",
-            err=True,
+        raise click.ClickException(
+            "--service-port is required (or must be in config file) for standard templates"
         )
-        sys.exit(1)
     if not domain_suffix and not is_dagster_code_location:
-        click.echo("Error: --domain-suffix is required (or must be in config file)", err=True)
-        sys.exit(1)
+        raise click.ClickException("--domain-suffix is required (or must be in config file)")
 
     # Git Provider Logic - Pre-check
-    org = git_organization if git_organization else project_name
     repo_name = f"{application_name}-gitops"
 
-    git_base_url = apply_git_https_config(config, git_provider, git_server)
-    provider = get_git_provider(
-        git_provider,
-        git_token,
-        server=git_server,
-        organization=org,
-        project=project_name,
-        base_url=git_base_url,
-    )
-
     if provider.repo_exists(repo_name):
         click.echo(f"Repository {repo_name} already exists. Skipping.")
-        sys.exit(0)
+        return "exists"
 
     # Template Selection
     if template_type == "dagster-platform":
-        template_path = "/app/templates/gitops/luban-dagster-platform-gitops-template"
+        template_name = "gitops/luban-dagster-platform-gitops-template"
     elif template_type.startswith("dagster") and "code-location" in template_type:
-        template_path = "/app/templates/gitops/luban-dagster-code-location-gitops-template"
+        template_name = "gitops/luban-dagster-code-location-gitops-template"
     else:
-        template_path = "/app/templates/gitops/luban-gitops-template"
+        template_name = "gitops/luban-gitops-template"
+    template_path = templating.resolve_template(template_name)
+    if template_path is None:
+        raise click.ClickException(f"Template {template_name} not found")
 
     package_name = application_name.replace("-", "_")
 
@@ -158,38 +208,36 @@ def gitops(
     try:
         render_template(template_path, output_dir, extra_context)
     except Exception:
-        click.echo(f"Error: Failed to render template to {output_dir}", err=True)
-        sys.exit(1)
+        raise click.ClickException(f"Failed to render template to {output_dir}")
 
-    # Inflate Helm Chart if necessary (for Dagster Platform)
-    # This logic detects if we used the dagster platform template and runs helm template
-    repo_name = f"{application_name}-gitops"
     repo_dir = os.path.join(output_dir, repo_name)
 
     # Post-provisioning: Push to Git
-    if provider:
-        # Create Repo
-        repo = provider.create_repo(
-            repo_name, description=f"GitOps configuration for {application_name}"
-        )
-        if not repo:
-            click.echo("Failed to create repository", err=True)
-            sys.exit(1)
-
-        # Init and Push Main
-        repo_dir = os.path.join(output_dir, repo_name)
-        remote_url = get_remote_url(
-            git_provider, git_token, git_server, org, project_name, repo_name, base_url=git_base_url
-        )
+    # Create Repo
+    repo = provider.create_repo(
+        repo_name, description=f"GitOps configuration for {application_name}"
+    )
+    if not repo:
+        raise click.ClickException("Failed to create repository")
 
+    # Init and Push Main
+    remote_url = get_remote_url(
+        git_provider, git_token, git_server, org, project_name, repo_name, base_url=git_base_url
+    )
+
+    if setup_git_auth:
         configure_git_https_auth(git_username, git_token, git_server)
         configure_git_identity()
 
-        initialize_git_repo(repo_dir, remote_url)
+    initialize_git_repo(repo_dir, remote_url)
 
-        # Create Develop and Push
-        create_and_push_branch(repo_dir, "develop")
+    # Create Develop and Push
+    create_and_push_branch(repo_dir, "develop")
 
-        # Configure Settings
-        provider.set_default_branch(repo, "develop")
-        provider.enable_branch_protection(repo, "main")
+    # Configure Settings (independent once both branches exist)
+    async_provider = AsyncGitProvider(provider)
+    run_concurrently(
+        async_provider.set_default_branch(repo, "develop"),
+        async_provider.enable_branch_protection(repo, "main"),
+    )
+    return "created"
@@ -1,16 +1,25 @@
 import os
 import shutil
+import subprocess
 import sys
+import tempfile
 
 import click
 
+from luban_provisioner import templating
 from luban_provisioner.provider_factory import get_git_provider, get_remote_url
 from luban_provisioner.utils import (
     clone_git_repo,
     commit_and_push,
     configure_git_https_auth,
     configure_git_identity,
+    fetch_tree_only,
+    git_tracked_blobs,
+    git_tree_blobs,
     initialize_git_repo,
+    load_config,
+    read_git_blob,
+    refresh_git_repo,
     render_template,
 )
 
@@ -36,12 +45,23 @@ def cd():
 # --- Helper Functions ---
 
 
+def _overlay_path(template_path, context):
+    """The overlay directory the template renders for context, relative to the repo."""
+    name = templating.render_project_dir(template_path, context)
+    if not name or name in (".", "..") or "/" in name or "\\" in name:
+        click.echo(f"Error: Overlay directory {name!r} is not a plain directory name", err=True)
+        sys.exit(1)
+    return f"overlays/{name}"
+
+
+def _overlay_label(context):
+    return f"{context['project_name']} ({context.get('env') or 'ci'})"
+
+
 def _update_impl(
-    template_path,
-    context,
+    template_name,
+    contexts,
     repo_name,
-    project_name,
-    env_name,
     git_organization,
     git_provider,
     git_server,
@@ -52,17 +72,11 @@ def _update_impl(
     infra_project_name,
     local_dir=None,
 ):
-    # Fallback for local template
-    if not os.path.exists(template_path):
-        cwd = os.getcwd()
-        # template_path passed in might be absolute /app/..., try to find local relative
-        template_dirname = os.path.basename(template_path)
-        local_template = os.path.join(cwd, f"tools/luban-provisioner/templates/{template_dirname}")
-        if os.path.exists(local_template):
-            template_path = local_template
-        else:
-            click.echo(f"Error: Template not found at {template_path}", err=True)
-            sys.exit(1)
+    """Render one overlay per context into a single checkout, then commit and push once."""
+    template_path = templating.resolve_template(template_name)
+    if template_path is None:
+        click.echo(f"Error: Template {template_name} not found", err=True)
+        sys.exit(1)
 
     # Clone Repo
     remote_url = get_remote_url(
@@ -82,29 +96,85 @@ def _update_impl(
     clone_dir_name = local_dir if local_dir else repo_name
     repo_dir = os.path.join(work_dir, clone_dir_name)
 
-    if os.path.exists(repo_dir):
-        shutil.rmtree(repo_dir)  # Clean start
+    # Only the overlays being written are checked out. Their paths come from
+    # the template itself, so context keys like namespace are honoured.
+    overlay_paths = [_overlay_path(template_path, context) for context in contexts]
+    duplicates = sorted({path for path in overlay_paths if overlay_paths.count(path) > 1})
+    if duplicates:
+        click.echo(f"Error: Duplicate overlay {', '.join(duplicates)}", err=True)
+        sys.exit(1)
+    sparse_paths = sorted(overlay_paths)
 
-    if not os.path.exists(work_dir):
-        os.makedirs(work_dir)
+    # Reuse a previous checkout (e.g. on the /workdir PVC) when possible; it is
+    # reset to origin, so this is still a clean start.
+    if not refresh_git_repo(remote_url, repo_dir, sparse_paths=sparse_paths):
+        if os.path.exists(repo_dir):
+            shutil.rmtree(repo_dir)
 
-    clone_git_repo(remote_url, repo_dir)
+        if not os.path.exists(work_dir):
+            os.makedirs(work_dir)
 
-    # Render Template
+        clone_git_repo(remote_url, repo_dir, mode="sparse", sparse_paths=sparse_paths)
+
+    # Render Templates
     overlays_dir = os.path.join(repo_dir, "overlays")
     if not os.path.exists(overlays_dir):
         os.makedirs(overlays_dir)
 
-    render_template(template_path, overlays_dir, context, overwrite=True)
+    for context in contexts:
+        render_template(template_path, overlays_dir, context, overwrite=True)
 
     # Commit & Push
-    msg_suffix = env_name if env_name else "ci"
-    commit_and_push(repo_dir, f"Add overlay for {project_name} ({msg_suffix})")
-    click.echo("Successfully updated infra repo.")
+    if len(contexts) == 1:
+        message = f"Add overlay for {_overlay_label(contexts[0])}"
+    else:
+        labels = "\n".join(f"- {_overlay_label(context)}" for context in contexts)
+        message = f"Add overlays for {len(contexts)} projects\n\n{labels}"
+    commit_and_push(repo_dir, message)
+    click.echo(f"Successfully updated infra repo ({len(contexts)} overlay(s)).")
+
+
+def _load_overlay_contexts(contexts_file, defaults, required):
+    """
+    Load overlay contexts for a batch update from a YAML/JSON file:
+
+        defaults:              # optional, merged into every entry
+          admin_group: platform-admins
+        projects:              # or a top-level list
+          - project_name: team-a
+            developer_group: team-a-devs
+          - project_name: team-b
+            developer_group: team-b-devs
+
+    CLI defaults apply first, then the file defaults, then each entry.
+    """
+    if not os.path.exists(contexts_file):
+        click.echo(f"Error: Contexts file not found: {contexts_file}", err=True)
+        sys.exit(1)
+    data = load_config(contexts_file) or {}
+    if isinstance(data, list):
+        data = {"projects": data}
+    entries = data.get("projects") or []
+    if not isinstance(entries, list) or not entries:
+        click.echo(f"Error: {contexts_file} does not list any projects", err=True)
+        sys.exit(1)
+
+    base = {k: v for k, v in defaults.items() if v is not None}
+    base.update(data.get("defaults") or {})
+
+    contexts = []
+    for entry in entries:
+        context = {**base, **entry}
+        missing = [key for key in required if not context.get(key)]
+        if missing:
+            click.echo(f"Error: Entry {entry} is missing {', '.join(missing)}", err=True)
+            sys.exit(1)
+        contexts.append({k: str(v) for k, v in context.items()})
+    return contexts
 
 
 def _init_impl(
-    template_path,
+    template_name,
     context,
     repo_name,
     template_type,
@@ -116,17 +186,12 @@ def _init_impl(
     git_token,
     output_dir,
     project_name,
+    dry_run=False,
 ):
-    # Fallback logic
-    if not os.path.exists(template_path):
-        cwd = os.getcwd()
-        template_dirname = os.path.basename(template_path)
-        local_template = os.path.join(cwd, f"tools/luban-provisioner/templates/{template_dirname}")
-        if os.path.exists(local_template):
-            template_path = local_template
-        else:
-            click.echo(f"Error: Template not found at {template_path}", err=True)
-            sys.exit(1)
+    template_path = templating.resolve_template(template_name)
+    if template_path is None:
+        click.echo(f"Error: Template {template_name} not found", err=True)
+        sys.exit(1)
 
     # Get Provider
     provider = get_git_provider(
@@ -141,20 +206,26 @@ def _init_impl(
         click.echo("Error: Failed to initialize Git provider.", err=True)
         sys.exit(1)
 
-    # Ensure Project Exists (Relevant for Azure)
-    provider.create_project(project_name)
-
-    # Create Repo if needed
-    if not provider.repo_exists(repo_name):
-        click.echo(f"Creating repo {repo_name}...")
-        repo = provider.create_repo(
-            repo_name, description=f"Luban {template_type.upper()} Infrastructure"
-        )
-        if not repo:
-            click.echo(f"Failed to create repo {repo_name}", err=True)
-            sys.exit(1)
+    if dry_run:
+        # Nothing is created; a missing repo only means that every file is new.
+        repo_exists = provider.repo_exists(repo_name)
+        click.echo(f"Dry run: comparing the {template_type.upper()} base with {repo_name}...")
     else:
-        click.echo(f"Repo {repo_name} already exists. Updating base...")
+        # Ensure Project Exists (Relevant for Azure)
+        provider.create_project(project_name)
+
+        # Create Repo if needed
+        repo_exists = provider.repo_exists(repo_name)
+        if not repo_exists:
+            click.echo(f"Creating repo {repo_name}...")
+            repo = provider.create_repo(
+                repo_name, description=f"Luban {template_type.upper()} Infrastructure"
+            )
+            if not repo:
+                click.echo(f"Failed to create repo {repo_name}", err=True)
+                sys.exit(1)
+        else:
+            click.echo(f"Repo {repo_name} already exists. Updating base...")
 
     # Clone Repo
     remote_url = get_remote_url(
@@ -171,31 +242,114 @@ def _init_impl(
     configure_git_https_auth(git_username, git_token, git_server)
     configure_git_identity()
 
-    if os.path.exists(repo_dir):
-        shutil.rmtree(repo_dir)
+    # We pass repo_name in context so the template can create the directory
+    if "repo_name" not in context:
+        context["repo_name"] = repo_name
+
+    if dry_run:
+        _dry_run_plan(template_path, output_dir, context, repo_dir, remote_url, repo_exists)
+        click.echo("Dry run: nothing was written or pushed.")
+        return
 
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    if not refresh_git_repo(remote_url, repo_dir):
+        if os.path.exists(repo_dir):
+            shutil.rmtree(repo_dir)
 
-    try:
-        clone_git_repo(remote_url, repo_dir)
-    except Exception as e:
-        click.echo(f"Clone failed (likely empty repo): {e}. Initializing fresh...", err=True)
-        os.makedirs(repo_dir, exist_ok=True)
-        initialize_git_repo(repo_dir, remote_url)
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        try:
+            clone_git_repo(remote_url, repo_dir, mode="shallow")
+        except Exception as e:
+            click.echo(f"Clone failed (likely empty repo): {e}. Initializing fresh...", err=True)
+            os.makedirs(repo_dir, exist_ok=True)
+            initialize_git_repo(repo_dir, remote_url)
 
     # Render Template
-    # We pass repo_name in context so the template can create the directory
-    if "repo_name" not in context:
-        context["repo_name"] = repo_name
+    # The base is rendered (in memory unless it needs cookiecutter, see _plan)
+    # and compared with the checkout by blob hash, so only files that really
+    # differ are written and committed.
+    tracked = git_tracked_blobs(repo_dir) if os.path.isdir(os.path.join(repo_dir, ".git")) else None
+    plan = _plan(template_path, output_dir, context, tracked)
+    _echo_plan(plan, repo_dir)
 
-    render_template(template_path, output_dir, context, overwrite=True)
+    if not templating.apply_plan(plan):
+        click.echo(f"{repo_name} already matches the {template_type.upper()} base.")
+        return
 
     # Commit & Push
     commit_and_push(repo_dir, f"Initialize {template_type.upper()} infrastructure base")
     click.echo(f"Successfully initialized {repo_name}.")
 
 
+def _plan(template_path, output_dir, context, tracked):
+    """
+    The render plan of template_path against output_dir.
+
+    Templates with hooks, or any template with LUBAN_TEMPLATE_CACHE=off, are
+    rendered by cookiecutter into a scratch directory and compared from there.
+    """
+    if templating.use_cache(template_path):
+        return templating.plan_render(template_path, output_dir, context, tracked=tracked)[1]
+    scratch = tempfile.mkdtemp()
+    try:
+        render_template(template_path, scratch, context)
+        return templating.plan_directory(scratch, output_dir, tracked=tracked)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def _dry_run_plan(template_path, output_dir, context, repo_dir, remote_url, repo_exists):
+    """
+    Print the render plan against the remote branch without a working tree.
+
+    Only the tip's trees are fetched into a temporary bare repository; the
+    blobs of modified files are fetched on demand for the diff stat.
+    """
+    git_dir = None
+    if not repo_exists:
+        click.echo(f"{os.path.basename(repo_dir)} does not exist yet; every file is new.")
+    else:
+        try:
+            git_dir = fetch_tree_only(remote_url)
+        except subprocess.CalledProcessError as e:
+            click.echo(f"Fetch failed ({e}); every file is new.", err=True)
+    try:
+        tracked = git_tree_blobs(git_dir, repo_dir) if git_dir else {}
+
+        def old_content(planned):
+            entry = tracked.get(os.path.abspath(planned.path))
+            return read_git_blob(git_dir, entry[1]) if entry else b""
+
+        plan = _plan(template_path, output_dir, context, tracked)
+        _echo_plan(plan, repo_dir, old_content=old_content)
+    finally:
+        if git_dir:
+            shutil.rmtree(git_dir, ignore_errors=True)
+
+
+def _echo_plan(plan, repo_dir, old_content=None):
+    """
+    Print a diff summary: one line per added (A) or modified (M) file.
+
+    old_content(planned) returns a file's current bytes; by default they are
+    read from disk.
+    """
+    changed = [planned for planned in plan if planned.status != "unchanged"]
+    counts = {status: 0 for status in ("added", "modified", "unchanged")}
+    for planned in plan:
+        counts[planned.status] += 1
+    click.echo(
+        f"Render plan: {counts['added']} added, {counts['modified']} modified, "
+        f"{counts['unchanged']} unchanged."
+    )
+    for planned in changed:
+        old = old_content(planned) if old_content else None
+        added, removed = templating.diff_stat(planned, old)
+        flag = "A" if planned.status == "added" else "M"
+        click.echo(f"  {flag} {os.path.relpath(planned.path, repo_dir)} (+{added} -{removed})")
+
+
 # --- CI Commands ---
 
 
@@ -250,11 +404,79 @@ def update_ci(
         "git_provider": git_provider,
     }
     _update_impl(
-        "/app/templates/infra-ci-overlay",
-        context,
+        "infra-ci-overlay",
+        [context],
+        repo_name,
+        git_organization,
+        git_provider,
+        git_server,
+        git_base_url,
+        git_username,
+        git_token,
+        work_dir,
+        infra_project_name,
+        local_dir=local_dir,
+    )
+
+
+@ci.command(name="update-batch")
+@click.option("--repo-name", required=True)
+@click.option(
+    "--contexts-file", required=True, help="YAML/JSON file listing the projects to add overlays for"
+)
+@click.option("--git-organization", default="metasync")
+@click.option("--git-provider", default="github")
+@click.option("--git-server", envvar="GIT_SERVER")
+@click.option(
+    "--git-base-url",
+    envvar="GIT_BASE_URL",
+    default="",
+    help="Git base URL (optional, supports path prefixes)",
+)
+@click.option("--git-username", envvar="GIT_USERNAME", default="git")
+@click.option("--git-token", envvar="GIT_TOKEN")
+@click.option("--work-dir", default="/workdir")
+@click.option("--infra-project-name", default="luban-infra")
+@click.option("--admin-group", default=None, help="Default AD Group for Admins")
+@click.option("--developer-group", default=None, help="Default AD Group for Developers")
+@click.option(
+    "--image-pull-secret",
+    default="harbor-creds",
+    envvar="IMAGE_PULL_SECRET",
+    help="Image Pull Secret Name (env: IMAGE_PULL_SECRET)",
+)
+@click.option("--local-dir", default=None, help="Local directory name (defaults to repo-name)")
+def update_ci_batch(
+    repo_name,
+    contexts_file,
+    git_organization,
+    git_provider,
+    git_server,
+    git_base_url,
+    git_username,
+    git_token,
+    work_dir,
+    infra_project_name,
+    admin_group,
+    developer_group,
+    image_pull_secret,
+    local_dir,
+):
+    """Update CI infra repo with overlays for many projects in one commit."""
+    defaults = {
+        "admin_group": admin_group,
+        "developer_group": developer_group,
+        "image_pull_secret": image_pull_secret,
+        "git_organization": git_organization,
+        "git_provider": git_provider,
+    }
+    contexts = _load_overlay_contexts(
+        contexts_file, defaults, required=("project_name", "admin_group", "developer_group")
+    )
+    _update_impl(
+        "infra-ci-overlay",
+        contexts,
         repo_name,
-        project_name,
-        None,
         git_organization,
         git_provider,
         git_server,
@@ -300,6 +522,9 @@ def update_ci(
     default="",
     help="Host for ADO Server SSH (kpack.io/git annotation)",
 )
+@click.option(
+    "--dry-run", is_flag=True, help="Show which base files would change, without writing or pushing"
+)
 def init_ci(
     repo_name,
     git_organization,
@@ -313,6 +538,7 @@ def init_ci(
     image_pull_secret,
     azure_ssh_host,
     ado_ssh_host,
+    dry_run,
 ):
     """Initialize CI infra repo with base structure."""
 
@@ -343,7 +569,7 @@ def init_ci(
         "ado_ssh_host": ado_ssh_host,
     }
     _init_impl(
-        "/app/templates/infra-ci-base",
+        "infra-ci-base",
         context,
         repo_name,
         "ci",
@@ -355,6 +581,7 @@ def init_ci(
         git_token,
         output_dir,
         project_name,
+        dry_run=dry_run,
     )
 
 
@@ -409,11 +636,76 @@ def update_cd(
         "git_provider": git_provider,
     }
     _update_impl(
-        "/app/templates/infra-cd-overlay",
-        context,
+        "infra-cd-overlay",
+        [context],
+        repo_name,
+        git_organization,
+        git_provider,
+        git_server,
+        git_base_url,
+        git_username,
+        git_token,
+        work_dir,
+        infra_project_name,
+        local_dir=local_dir,
+    )
+
+
+@cd.command(name="update-batch")
+@click.option("--repo-name", required=True)
+@click.option(
+    "--contexts-file",
+    required=True,
+    help="YAML/JSON file listing the projects (and envs) to add overlays for",
+)
+@click.option("--env", default=None, help="Default environment (snd/prd) for entries without one")
+@click.option("--git-organization", default="metasync")
+@click.option("--git-provider", default="github")
+@click.option("--git-server", envvar="GIT_SERVER")
+@click.option(
+    "--git-base-url",
+    envvar="GIT_BASE_URL",
+    default="",
+    help="Git base URL (optional, supports path prefixes)",
+)
+@click.option("--git-username", envvar="GIT_USERNAME", default="git")
+@click.option("--git-token", envvar="GIT_TOKEN")
+@click.option("--work-dir", default="/workdir")
+@click.option("--infra-project-name", default="luban-infra")
+@click.option(
+    "--image-pull-secret",
+    default="harbor-creds",
+    envvar="IMAGE_PULL_SECRET",
+    help="Image Pull Secret Name (env: IMAGE_PULL_SECRET)",
+)
+@click.option("--local-dir", default=None, help="Local directory name (defaults to repo-name)")
+def update_cd_batch(
+    repo_name,
+    contexts_file,
+    env,
+    git_organization,
+    git_provider,
+    git_server,
+    git_base_url,
+    git_username,
+    git_token,
+    work_dir,
+    infra_project_name,
+    image_pull_secret,
+    local_dir,
+):
+    """Update CD infra repo with overlays for many projects in one commit."""
+    defaults = {
+        "env": env,
+        "image_pull_secret": image_pull_secret,
+        "git_organization": git_organization,
+        "git_provider": git_provider,
+    }
+    contexts = _load_overlay_contexts(contexts_file, defaults, required=("project_name", "env"))
+    _update_impl(
+        "infra-cd-overlay",
+        contexts,
         repo_name,
-        project_name,
-        env,
         git_organization,
         git_provider,
         git_server,
@@ -447,6 +739,9 @@ def update_cd(
     envvar="IMAGE_PULL_SECRET",
     help="Image Pull Secret Name (env: IMAGE_PULL_SECRET)",
 )
+@click.option(
+    "--dry-run", is_flag=True, help="Show which base files would change, without writing or pushing"
+)
 def init_cd(
     repo_name,
     git_organization,
@@ -458,11 +753,12 @@ def init_cd(
     output_dir,
     project_name,
     image_pull_secret,
+    dry_run,
 ):
     """Initialize CD infra repo with base structure."""
     context = {"image_pull_secret": image_pull_secret}
     _init_impl(
-        "/app/templates/infra-cd-base",
+        "infra-cd-base",
         context,
         repo_name,
         "cd",
@@ -474,4 +770,5 @@ def init_cd(
         git_token,
         output_dir,
         project_name,
+        dry_run=dry_run,
     )
@@ -1,13 +1,30 @@
+import fnmatch
+import functools
+import io
+import json
 import os
 import subprocess
 import sys
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 import click
 from ruamel.yaml import YAML
 
 from luban_provisioner.provider_factory import get_git_provider, get_remote_url
-from luban_provisioner.utils import configure_git_https_auth, configure_git_identity, run_git
+from luban_provisioner.providers.http import DEFAULT_POOL_MAXSIZE, build_session
+from luban_provisioner.utils import (
+    GITOPS_EDIT_MODES,
+    clone_git_repo,
+    commit_and_push,
+    configure_git_https_auth,
+    configure_git_identity,
+    edit_files_in_tree,
+    run_git,
+)
+
+SND_KUSTOMIZATION = os.path.join("app", "overlays", "snd", "kustomization.yaml")
+PRD_KUSTOMIZATION = os.path.join("app", "overlays", "prd", "kustomization.yaml")
 
 
 def _select_image(images, app_name):
@@ -31,8 +48,204 @@ def _select_image(images, app_name):
     return images[0]
 
 
+def _resolve_apps(provider, app_names, app_selector):
+    """Explicit --app-name values plus GitOps repos whose app name matches --app-selector."""
+    apps = list(dict.fromkeys(app_names))
+    if app_selector:
+        repos = provider.list_repos()
+        if repos is None:
+            raise click.ClickException("Failed to list repositories for --app-selector")
+        for repo in sorted(repos, key=lambda r: r.get("name", "")):
+            name = repo.get("name", "")
+            if not name.endswith("-gitops"):
+                continue
+            app = name.removesuffix("-gitops")
+            if fnmatch.fnmatch(app, app_selector) and app not in apps:
+                apps.append(app)
+    return apps
+
+
+def _yaml():
+    yaml = YAML()
+    yaml.preserve_quotes = True
+    return yaml
+
+
+def _promote_kustomization(app_name, snd_text, prd_text):
+    """
+    Copy the app image tag of the snd kustomization into the prd one.
+
+    Works on file contents only, so every edit mode shares it. Returns
+    (image, tag, new prd text); raises ValueError when the overlays lack what
+    is needed.
+    """
+    if snd_text is None:
+        raise ValueError(f"{SND_KUSTOMIZATION} not found.")
+    yaml = _yaml()
+    snd_data = yaml.load(snd_text) or {}
+
+    images = snd_data.get("images", [])
+    selected = _select_image(images, app_name)
+    if not selected:
+        raise ValueError("No images found in snd kustomization.yaml")
+
+    target_image = selected.get("name")
+    target_tag = selected.get("newTag")
+    if not target_image or not target_tag:
+        raise ValueError("Could not extract name/newTag from snd images")
+
+    if prd_text is None:
+        raise ValueError(f"{PRD_KUSTOMIZATION} not found.")
+    prd_data = yaml.load(prd_text) or {}
+
+    prd_images = prd_data.get("images") or []
+    found = False
+    for img in prd_images:
+        if img.get("name") == target_image:
+            img["newTag"] = target_tag
+            if "newName" in img:
+                del img["newName"]
+            found = True
+            break
+
+    if not found:
+        prd_images.append({"name": target_image, "newTag": target_tag})
+        prd_data["images"] = prd_images
+
+    out = io.StringIO()
+    yaml.dump(prd_data, out)
+    return target_image, target_tag, out.getvalue()
+
+
+def _read_text(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _push_clone(app_name, repo_url, work_dir, message_for):
+    """Edit the overlays in a sparse checkout and push with commit_and_push. Returns (tag, pushed)."""
+    try:
+        # Only the two overlays are read or written.
+        clone_git_repo(
+            repo_url,
+            work_dir,
+            branch="develop",
+            mode="sparse",
+            sparse_paths=[os.path.dirname(SND_KUSTOMIZATION), os.path.dirname(PRD_KUSTOMIZATION)],
+        )
+    except subprocess.CalledProcessError:
+        raise ValueError("Failed to clone repository. Check credentials and URL.")
+
+    prd_path = os.path.join(work_dir, PRD_KUSTOMIZATION)
+    target_image, target_tag, prd_text = _promote_kustomization(
+        app_name, _read_text(os.path.join(work_dir, SND_KUSTOMIZATION)), _read_text(prd_path)
+    )
+    click.echo(f"[{app_name}] Promoting Image: {target_image}")
+    with open(prd_path, "w", encoding="utf-8") as f:
+        f.write(prd_text)
+
+    status = run_git(
+        ["status", "--porcelain"], cwd=work_dir, capture_output=True, text=True, check=False
+    )
+    if not status.stdout.strip():
+        return target_tag, False
+    try:
+        commit_and_push(work_dir, message_for(target_tag), branch="develop")
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f"Push failed: {e}")
+    return target_tag, True
+
+
+def _push_remote(app_name, edit, message_for):
+    """
+    Edit the prd overlay without a checkout and push. Returns (tag, pushed).
+
+    edit(paths, mutate, message) is utils.edit_files_in_tree or
+    GitProvider.update_files bound to the repo and the develop branch.
+    """
+    promoted = {}
+
+    def mutate(files):
+        image, tag, prd_text = _promote_kustomization(
+            app_name, files[SND_KUSTOMIZATION], files[PRD_KUSTOMIZATION]
+        )
+        click.echo(f"[{app_name}] Promoting Image: {image}")
+        promoted["tag"] = tag
+        return {PRD_KUSTOMIZATION: prd_text}
+
+    try:
+        commit = edit(
+            [SND_KUSTOMIZATION, PRD_KUSTOMIZATION],
+            mutate,
+            lambda: message_for(promoted["tag"]),
+        )
+    except (subprocess.CalledProcessError, RuntimeError) as e:
+        raise ValueError(f"Edit failed: {e}")
+    return promoted["tag"], commit is not None
+
+
+def _promote_app(provider, app_name, repo_url, work_root, edit_mode="clone"):
+    """
+    Copy the snd image tag of one app into its prd overlay, push develop and open a PR.
+
+    Returns a result dict with app, status ("promoted", "up-to-date" or
+    "failed"), tag, pr and error.
+    """
+    result = {"app": app_name, "status": "failed", "tag": None, "pr": None, "error": None}
+    gitops_repo_name = f"{app_name}-gitops"
+
+    def message_for(tag):
+        return f"Promote {app_name} to prd (tag: {tag})"
+
+    try:
+        if edit_mode == "tree":
+            edit = functools.partial(edit_files_in_tree, repo_url, "develop")
+            target_tag, changed = _push_remote(app_name, edit, message_for)
+        elif edit_mode == "api":
+            edit = functools.partial(provider.update_files, gitops_repo_name, "develop")
+            target_tag, changed = _push_remote(app_name, edit, message_for)
+        else:
+            work_dir = os.path.join(work_root, gitops_repo_name)
+            target_tag, changed = _push_clone(app_name, repo_url, work_dir, message_for)
+    except ValueError as e:
+        result["error"] = str(e)
+        return result
+    result["tag"] = str(target_tag)
+
+    if not changed:
+        click.echo(f"[{app_name}] No changes to promote. PRD overlay is already up to date.")
+        result["status"] = "up-to-date"
+        return result
+    click.echo(f"[{app_name}] Promoted Tag: {target_tag}")
+
+    pr_title = f"Promote {app_name} to prd ({target_tag})"
+    pr_body = (
+        "Automated promotion request from snd (develop) to prd (main).<br><br>"
+        f"**App**: {app_name}<br>**Tag**: {target_tag}"
+    )
+    pr = provider.create_pull_request(
+        repo_identifier=gitops_repo_name,
+        title=pr_title,
+        description=pr_body,
+        source_ref="develop",
+        target_ref="main",
+    )
+    result["pr"] = (pr or {}).get("html_url") or (pr or {}).get("url")
+    result["status"] = "promoted"
+    return result
+
+
 @click.command()
-@click.option("--app-name", required=True, help="Application name")
+@click.option(
+    "--app-name", "app_names", multiple=True, help="Application name (repeat for several apps)"
+)
+@click.option(
+    "--app-selector",
+    required=False,
+    help="Glob matched against app names of '<app>-gitops' repos (e.g. 'billing-*')",
+)
 @click.option("--git-organization", required=True, help="Git Organization")
 @click.option(
     "--git-provider",
@@ -59,8 +272,22 @@ def _select_image(images, app_name):
     help="Git base URL (optional, supports path prefixes)",
 )
 @click.option("--project-name", required=True, help="Project Name (for Azure)")
+@click.option(
+    "--max-workers", default=4, show_default=True, type=click.IntRange(min=1), help="Parallel apps"
+)
+@click.option("--report-file", required=False, help="Write the per-app results as JSON")
+@click.option(
+    "--edit-mode",
+    type=click.Choice(GITOPS_EDIT_MODES),
+    default="clone",
+    show_default=True,
+    envvar="LUBAN_GITOPS_EDIT_MODE",
+    help="clone: sparse checkout + commit; tree: edit git objects without a checkout; "
+    "api: edit through the provider's file API",
+)
 def promote(
-    app_name,
+    app_names,
+    app_selector,
     git_organization,
     git_provider,
     git_username,
@@ -68,11 +295,13 @@ def promote(
     git_server,
     git_base_url,
     project_name,
+    max_workers,
+    report_file,
+    edit_mode,
 ):
-    """Promote an application from Sandbox (snd) to Production (prd)."""
-    gitops_repo_name = f"{app_name}-gitops"
-
+    """Promote one or more applications from Sandbox (snd) to Production (prd)."""
     org = git_organization if git_organization else project_name
+    session = build_session(pool_maxsize=max(DEFAULT_POOL_MAXSIZE, max_workers))
     provider = get_git_provider(
         git_provider,
         git_token,
@@ -80,108 +309,66 @@ def promote(
         organization=org,
         project=project_name,
         base_url=git_base_url,
+        session=session,
     )
     if not provider:
         click.echo(f"Unsupported git provider: {git_provider}", err=True)
         sys.exit(1)
-    repo_url = get_remote_url(
-        git_provider,
-        git_token,
-        git_server,
-        org,
-        project_name,
-        gitops_repo_name,
-        base_url=git_base_url,
-    )
 
-    configure_git_https_auth(git_username, git_token, git_server)
-    configure_git_identity()
-
-    yaml = YAML()
-    yaml.preserve_quotes = True
+    apps = _resolve_apps(provider, app_names, app_selector)
+    if not apps:
+        click.echo(
+            "Error: No applications to promote (use --app-name or --app-selector).", err=True
+        )
+        sys.exit(1)
 
-    snd_kust_rel = os.path.join("app", "overlays", "snd", "kustomization.yaml")
-    prd_kust_rel = os.path.join("app", "overlays", "prd", "kustomization.yaml")
+    if edit_mode != "api":
+        # Credentials are configured once for every clone and push.
+        configure_git_https_auth(git_username, git_token, git_server)
+        configure_git_identity()
 
-    with tempfile.TemporaryDirectory() as work_dir:
-        click.echo(f"Cloning {repo_url} into {work_dir}...")
+    def run(app_name):
+        repo_url = get_remote_url(
+            git_provider,
+            git_token,
+            git_server,
+            org,
+            project_name,
+            f"{app_name}-gitops",
+            base_url=git_base_url,
+        )
         try:
-            run_git(["clone", "-b", "develop", repo_url, work_dir], check=True)
-        except subprocess.CalledProcessError:
-            click.echo("Failed to clone repository. Check credentials and URL.", err=True)
-            sys.exit(1)
+            return _promote_app(provider, app_name, repo_url, work_root, edit_mode)
+        except Exception as e:
+            return {
+                "app": app_name,
+                "status": "failed",
+                "tag": None,
+                "pr": None,
+                "error": f"{type(e).__name__}: {e}",
+            }
 
-        cwd = os.getcwd()
-        os.chdir(work_dir)
+    click.echo(f"Promoting {len(apps)} application(s) with {max_workers} worker(s)...")
+    with tempfile.TemporaryDirectory() as work_root:
         try:
-            if not os.path.exists(snd_kust_rel):
-                click.echo(f"Error: {snd_kust_rel} not found.", err=True)
-                sys.exit(1)
-
-            with open(snd_kust_rel, "r", encoding="utf-8") as f:
-                snd_data = yaml.load(f) or {}
-
-            images = snd_data.get("images", [])
-            selected = _select_image(images, app_name)
-            if not selected:
-                click.echo("Error: No images found in snd kustomization.yaml", err=True)
-                sys.exit(1)
-
-            target_image = selected.get("name")
-            target_tag = selected.get("newTag")
-            if not target_image or not target_tag:
-                click.echo("Error: Could not extract name/newTag from snd images", err=True)
-                sys.exit(1)
-
-            click.echo(f"Promoting Image: {target_image}")
-            click.echo(f"Promoting Tag:   {target_tag}")
-
-            if not os.path.exists(prd_kust_rel):
-                click.echo(f"Error: {prd_kust_rel} not found.", err=True)
-                sys.exit(1)
-
-            with open(prd_kust_rel, "r", encoding="utf-8") as f:
-                prd_data = yaml.load(f) or {}
-
-            prd_images = prd_data.get("images") or []
-            found = False
-            for img in prd_images:
-                if img.get("name") == target_image:
-                    img["newTag"] = target_tag
-                    if "newName" in img:
-                        del img["newName"]
-                    found = True
-                    break
-
-            if not found:
-                prd_images.append({"name": target_image, "newTag": target_tag})
-                prd_data["images"] = prd_images
-
-            with open(prd_kust_rel, "w", encoding="utf-8") as f:
-                yaml.dump(prd_data, f)
-
-            status = run_git(["status", "--porcelain"], capture_output=True, text=True, check=False)
-            if not status.stdout.strip():
-                click.echo("No changes to promote. PRD overlay is already up to date.")
-                return
-
-            commit_msg = f"Promote {app_name} to prd (tag: {target_tag})"
-            run_git(["add", "."], check=True)
-            run_git(["commit", "-m", commit_msg], check=True)
-            run_git(["push", "origin", "develop"], check=True)
-
-            pr_title = f"Promote {app_name} to prd ({target_tag})"
-            pr_body = (
-                "Automated promotion request from snd (develop) to prd (main).<br><br>"
-                f"**App**: {app_name}<br>**Tag**: {target_tag}"
-            )
-
-            provider.create_pull_request(
-                repo_identifier=gitops_repo_name,
-                title=pr_title,
-                description=pr_body,
-                source_ref="develop",
-                target_ref="main",
-            )
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(run, apps))
         finally:
-            os.chdir(cwd)
+            session.close()
+
+    if len(results) > 1:
+        click.echo("Promotion summary:")
+        width = max(len(r["app"]) for r in results)
+        for r in results:
+            detail = r["error"] if r["status"] == "failed" else (r["pr"] or "")
+            click.echo(f"  {r['app']:<{width}}  {r['status']:<10}  {r['tag'] or '-':<20}  {detail}")
+
+    if report_file:
+        with open(report_file, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    failed = [r for r in results if r["status"] == "failed"]
+    for r in failed:
+        click.echo(f"Error: [{r['app']}] {r['error']}", err=True)
+    if failed:
+        sys.exit(1)
@@ -1,15 +1,17 @@
 import os
-import sys
 
 import click
 
+from luban_provisioner import templating
 from luban_provisioner.provider_factory import get_git_provider, get_remote_url
+from luban_provisioner.providers.aio import AsyncGitProvider, run_concurrently
 from luban_provisioner.utils import (
     apply_git_https_config,
     configure_git_https_auth,
     configure_git_identity,
     initialize_git_repo,
     load_config,
+    push_branch,
     render_template,
 )
 
@@ -65,13 +67,8 @@ def source(
         else:
             click.echo(f"Warning: Invalid set option '{item}'. Must be key=value", err=True)
 
-    template_type = (
-        template_type if template_type != "python" else config.get("template_type", "python")
-    )
-
     # Git Provider Logic - Pre-check
     org = git_organization if git_organization else project_name
-    repo_name = application_name
 
     git_base_url = apply_git_https_config(config, git_provider, git_server)
     provider = get_git_provider(
@@ -83,28 +80,80 @@ def source(
         base_url=git_base_url,
     )
 
+    _source_impl(
+        provider,
+        project_name,
+        application_name,
+        output_dir,
+        config,
+        cli_extra_context,
+        git_provider,
+        git_server,
+        git_base_url,
+        git_username,
+        git_token,
+        org,
+        template_type=template_type,
+        webhook_url=webhook_url,
+        webhook_secret=webhook_secret,
+    )
+
+
+def _source_impl(
+    provider,
+    project_name,
+    application_name,
+    output_dir,
+    config,
+    cli_extra_context,
+    git_provider,
+    git_server,
+    git_base_url,
+    git_username,
+    git_token,
+    org,
+    template_type="python",
+    webhook_url=None,
+    webhook_secret=None,
+    setup_git_auth=True,
+):
+    """
+    Render, create and push one source repository.
+
+    Returns "created" or "exists"; raises click.ClickException on failure.
+    Set setup_git_auth=False when git credentials are already configured.
+    """
+    output_dir = os.path.abspath(output_dir)
+    template_type = (
+        template_type if template_type != "python" else config.get("template_type", "python")
+    )
+
+    repo_name = application_name
+
     if provider.repo_exists(repo_name):
         click.echo(f"Repository {repo_name} already exists. Skipping.")
-        sys.exit(0)
+        return "exists"
 
     package_name = application_name.replace("-", "_")
 
     match template_type:
         case "dagster-platform":
-            template_path = "/app/templates/source/luban-dagster-platform-source-template"
+            template_name = "source/luban-dagster-platform-source-template"
             description = f"Dagster Platform for {application_name}"
         case "dagster-code-location":
-            template_path = "/app/templates/source/luban-dagster-code-location-source-template"
+            template_name = "source/luban-dagster-code-location-source-template"
             description = f"Dagster Code Location for {application_name}"
         case "dagster-dbt-starrocks-code-location":
-            template_path = "/app/templates/source/luban-dagster-dbt-starrocks-code-location-source-template"
+            template_name = "source/luban-dagster-dbt-starrocks-code-location-source-template"
             description = f"Dagster + dbt (StarRocks) Code Location for {application_name}"
         case "python":
-            template_path = "/app/templates/source/luban-python-template"
+            template_name = "source/luban-python-template"
             description = f"A sample Python app for {application_name}. Replace this with your own description."
         case _:
-            click.echo(f"Unknown template type: {template_type}", err=True)
-            sys.exit(1)
+            raise click.ClickException(f"Unknown template type: {template_type}")
+    template_path = templating.resolve_template(template_name)
+    if template_path is None:
+        raise click.ClickException(f"Template {template_name} not found")
 
     extra_context = {
         "project_name": project_name,
@@ -140,27 +189,34 @@ def source(
     try:
         render_template(template_path, output_dir, extra_context)
     except Exception:
-        sys.exit(1)
+        raise click.ClickException(f"Failed to render template to {output_dir}")
 
     # Post-provisioning: Push to Git
-    if provider:
-        # Create Repo
-        repo = provider.create_repo(repo_name, description=extra_context["description"])
-        if not repo:
-            click.echo("Failed to create repository", err=True)
-            sys.exit(1)
-
-        # Configure Webhook
-        if webhook_url:
-            provider.create_webhook(repo, webhook_url, secret=webhook_secret)
-
-        # Push
-        repo_dir = os.path.join(output_dir, application_name)
-        remote_url = get_remote_url(
-            git_provider, git_token, git_server, org, project_name, repo_name, base_url=git_base_url
-        )
+    # Create Repo
+    repo = provider.create_repo(repo_name, description=extra_context["description"])
+    if not repo:
+        raise click.ClickException("Failed to create repository")
+
+    repo_dir = os.path.join(output_dir, application_name)
+    remote_url = get_remote_url(
+        git_provider, git_token, git_server, org, project_name, repo_name, base_url=git_base_url
+    )
 
+    if setup_git_auth:
         configure_git_https_auth(git_username, git_token, git_server)
         configure_git_identity()
 
-        initialize_git_repo(repo_dir, remote_url)
+    # Configure Webhook while the local repo is committed; the push waits
+    # for the webhook so the initial commit still triggers CI.
+    if webhook_url:
+        async_provider = AsyncGitProvider(provider)
+        run_concurrently(
+            async_provider.create_webhook(repo, webhook_url, secret=webhook_secret),
+            lambda: initialize_git_repo(repo_dir, remote_url, push=False),
+        )
+    else:
+        initialize_git_repo(repo_dir, remote_url, push=False)
+
+    # Push
+    push_branch(repo_dir, "main", force=True)
+    return "created"
@@ -7,6 +7,7 @@ warnings.filterwarnings(
 )
 import click
 
+from luban_provisioner.commands.batch import batch
 from luban_provisioner.commands.config import config
 from luban_provisioner.commands.dagster import dagster
 from luban_provisioner.commands.gitops import gitops
@@ -29,6 +30,7 @@ cli.add_command(promote)
 cli.add_command(config)
 cli.add_command(dagster)
 cli.add_command(infra)
+cli.add_command(batch)
 
 if __name__ == "__main__":
     cli()
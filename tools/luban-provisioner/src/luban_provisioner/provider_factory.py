@@ -1,3 +1,4 @@
+import os
 import sys
 from urllib.parse import urlsplit
 
@@ -6,6 +7,7 @@ import click
 from luban_provisioner.providers.ado import AdoProvider
 from luban_provisioner.providers.azure import AzureProvider
 from luban_provisioner.providers.github import GitHubProvider
+from luban_provisioner.providers.github_graphql import GitHubGraphQLProvider
 
 
 def _normalize_git_server(server):
@@ -31,16 +33,23 @@ def _normalize_git_base_url(base_url):
 
 
 def get_git_provider(
-    provider_name, token, server=None, organization=None, project=None, base_url=None
+    provider_name, token, server=None, organization=None, project=None, base_url=None, session=None
 ):
     """
     Factory function to get the appropriate Git provider instance.
+
+    Pass an existing requests session to share one connection pool between providers.
+    For GitHub, GITHUB_API_MODE=graphql selects the GraphQL-backed provider.
     """
     if provider_name == "github":
         if not server:
             server = "github.com"
         server = _normalize_git_server(server)
-        return GitHubProvider(token, organization=organization, project=project, git_server=server)
+        api_mode = (os.getenv("GITHUB_API_MODE") or "rest").strip().lower()
+        provider_class = GitHubGraphQLProvider if api_mode == "graphql" else GitHubProvider
+        return provider_class(
+            token, organization=organization, project=project, git_server=server, session=session
+        )
 
     elif provider_name == "azure":
         if not server:
@@ -65,6 +74,7 @@ def get_git_provider(
             project=project,
             git_server=server,
             git_base_url=base_url,
+            session=session,
         )
 
     elif provider_name == "ado":
@@ -97,6 +107,7 @@ def get_git_provider(
             project=project,
             git_server=server,
             git_base_url=base_url,
+            session=session,
         )
 
     else:
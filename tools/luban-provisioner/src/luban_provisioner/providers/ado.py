@@ -8,9 +8,16 @@ class AdoProvider(AzureProvider):
     separate provider class to support on-prem specific behavior over time.
     """
 
-    def __init__(self, token, organization, project, git_server=None, git_base_url=None):
+    def __init__(
+        self, token, organization, project, git_server=None, git_base_url=None, session=None
+    ):
         super().__init__(
-            token, organization, project, git_server=git_server or "", git_base_url=git_base_url
+            token,
+            organization,
+            project,
+            git_server=git_server or "",
+            git_base_url=git_base_url,
+            session=session,
         )
 
     def webhook_push_path(self) -> str:
@@ -0,0 +1,67 @@
+import asyncio
+
+
+class AsyncGitProvider:
+    """
+    asyncio variant of the GitProvider interface.
+
+    Wraps a synchronous provider and runs each call in a worker thread, so
+    independent calls against an existing repo (default branch, branch
+    protection, webhooks, ...) can be awaited concurrently. The wrapped
+    provider's pooled session and lookup cache are shared by all calls.
+    """
+
+    def __init__(self, provider):
+        self.provider = provider
+
+    async def _call(self, method_name, *args, **kwargs):
+        method = getattr(self.provider, method_name)
+        return await asyncio.to_thread(method, *args, **kwargs)
+
+    async def repo_exists(self, repo_name):
+        return await self._call("repo_exists", repo_name)
+
+    async def create_repo(self, name, description=None):
+        return await self._call("create_repo", name, description=description)
+
+    async def create_webhook(self, repo_identifier, webhook_url, secret=None):
+        return await self._call("create_webhook", repo_identifier, webhook_url, secret=secret)
+
+    async def set_default_branch(self, repo_identifier, branch_name):
+        return await self._call("set_default_branch", repo_identifier, branch_name)
+
+    async def enable_branch_protection(self, repo_identifier, branch_name, min_reviewers=1):
+        return await self._call(
+            "enable_branch_protection", repo_identifier, branch_name, min_reviewers=min_reviewers
+        )
+
+    async def create_project(self, project_name, description=None):
+        return await self._call("create_project", project_name, description=description)
+
+    async def create_pull_request(
+        self, repo_identifier, title, description, source_ref, target_ref="main"
+    ):
+        return await self._call(
+            "create_pull_request",
+            repo_identifier,
+            title,
+            description,
+            source_ref,
+            target_ref=target_ref,
+        )
+
+
+def run_concurrently(*calls):
+    """
+    Run independent awaitables concurrently from synchronous code.
+
+    Returns their results in order. Plain callables are run in a worker
+    thread, which lets blocking work (e.g. local git commands) overlap with
+    provider calls.
+    """
+
+    async def _gather():
+        awaitables = [c if asyncio.iscoroutine(c) else asyncio.to_thread(c) for c in calls]
+        return await asyncio.gather(*awaitables)
+
+    return asyncio.run(_gather())
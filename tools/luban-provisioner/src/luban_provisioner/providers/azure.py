@@ -3,14 +3,22 @@ import re
 import time
 
 import click
-import requests
 
-from .base import GitProvider
+from .base import ConflictError, GitProvider
+from .wait import backoff_delays, wait_until
 
 
 class AzureProvider(GitProvider):
-    def __init__(self, token, organization, project, git_server="dev.azure.com", git_base_url=None):
-        super().__init__(token, organization, project, git_server)
+    def __init__(
+        self,
+        token,
+        organization,
+        project,
+        git_server="dev.azure.com",
+        git_base_url=None,
+        session=None,
+    ):
+        super().__init__(token, organization, project, git_server, session=session)
         if git_base_url:
             self.base_url = f"{git_base_url.rstrip('/')}/{organization}"
         else:
@@ -28,10 +36,13 @@ class AzureProvider(GitProvider):
 
     def _request(self, method, url, **kwargs):
         versioned_url = self._apply_api_version(url, self.api_version)
-        return requests.request(method, versioned_url, auth=self.auth, **kwargs)
+        return self._send(method, versioned_url, auth=self.auth, **kwargs)
 
     def _get_project_id(self):
         """Get the ID of the Azure DevOps Project."""
+        return self._memoize(("project_id", self.project), self._fetch_project_id)
+
+    def _fetch_project_id(self):
         url = f"{self.base_url}/_apis/projects/{self.project}?api-version=7.1"
         resp = self._request("GET", url)
         if resp.status_code == 200:
@@ -46,34 +57,96 @@ class AzureProvider(GitProvider):
         body = resp.text or ""
         return "Could not find dataspace with category Git" in body
 
-    def _wait_for_git_ready(self, timeout_seconds=120, poll_seconds=2):
+    def _wait_for_git_ready(self, timeout_seconds=120):
         url = f"{self.base_url}/{self.project}/_apis/git/repositories?api-version=7.1"
-        start = time.time()
-        while True:
+        last = {}
+
+        def check():
             resp = self._request("GET", url)
+            last["resp"] = resp
             if resp.status_code == 200:
                 return True
             if self._is_git_dataspace_not_ready(resp):
-                if (time.time() - start) >= timeout_seconds:
-                    click.echo(
-                        f"Timeout waiting for Azure DevOps Git service to be ready for project '{self.project}'. Status: {resp.status_code}, Body: {resp.text}",
-                        err=True,
-                    )
-                    return False
-                time.sleep(poll_seconds)
-                continue
+                return None
             click.echo(
                 f"Failed while waiting for Azure DevOps Git service readiness. Status: {resp.status_code}, Body: {resp.text}",
                 err=True,
             )
             return False
 
+        result = wait_until(check, timeout_seconds)
+        if result.timed_out:
+            resp = last["resp"]
+            click.echo(
+                f"Timeout waiting for Azure DevOps Git service to be ready for project '{self.project}' after {result.elapsed:.1f}s. Status: {resp.status_code}, Body: {resp.text}",
+                err=True,
+            )
+            return False
+        if result.value and result.attempts > 1:
+            click.echo(f"Azure DevOps Git service ready after {result.elapsed:.1f}s.")
+        return result.value
+
+    def _wait_for_operation(self, operation_ref, timeout_seconds=120):
+        """
+        Poll the operation returned by an async (202) call until it finishes.
+
+        Returns the final status ("succeeded", "failed" or "cancelled"),
+        "timeout" when it is still running after timeout_seconds, and None when
+        the server does not expose the operation so the caller can poll
+        another way. A failure is reported with the operation's resultMessage.
+        """
+        op_url = operation_ref.get("url") or (
+            f"{self.base_url}/_apis/operations/{operation_ref.get('id')}"
+        )
+        unavailable = False
+
+        def check():
+            nonlocal unavailable
+            resp = self._request("GET", op_url)
+            if resp.status_code != 200:
+                unavailable = True
+                return False
+            operation = resp.json()
+            if operation.get("status") in ("succeeded", "failed", "cancelled"):
+                return operation
+            return None
+
+        result = wait_until(check, timeout_seconds)
+        if unavailable:
+            return None
+        if result.timed_out:
+            click.echo(f"Timeout after {result.elapsed:.1f}s waiting for operation.", err=True)
+            return "timeout"
+        operation = result.value
+        status = operation["status"]
+        if status != "succeeded":
+            click.echo(
+                f"Operation {operation.get('id')} {status} after {result.elapsed:.1f}s: "
+                f"{operation.get('resultMessage') or 'no result message'}",
+                err=True,
+            )
+            return status
+        click.echo(f"Operation finished after {result.elapsed:.1f}s ({result.attempts} polls).")
+        return status
+
     def _get_repo_id(self, repo_identifier):
         """Helper to resolve repo ID from name or dict."""
         if isinstance(repo_identifier, dict):
             return repo_identifier.get("id")
 
+        index = self._fresh_repo_index()
+        if index is not None:
+            repo = index.get(str(repo_identifier).lower())
+            if repo:
+                return repo.get("id")
+
         # If string, assume it's a name or ID. Try to fetch it.
+        return self._memoize(
+            ("repo_id", self.project, repo_identifier),
+            lambda: self._fetch_repo_id(repo_identifier),
+        )
+
+    def _fetch_repo_id(self, repo_identifier):
         # GET /_apis/git/repositories/{repositoryId}
         url = f"{self.base_url}/{self.project}/_apis/git/repositories/{repo_identifier}?api-version=7.1"
         resp = self._request("GET", url)
@@ -83,21 +156,76 @@ class AzureProvider(GitProvider):
 
     def _get_policy_type_id(self, display_name):
         """Get policy type ID by display name."""
+        types = self._memoize(("policy_types", self.project), self._fetch_policy_types)
+        for t in types or []:
+            if t.get("displayName") == display_name:
+                return t.get("id")
+        return None
+
+    def _fetch_policy_types(self):
         url = f"{self.base_url}/{self.project}/_apis/policy/types?api-version=7.1"
         resp = self._request("GET", url)
         if resp.status_code == 200:
-            types = resp.json().get("value", [])
-            for t in types:
-                if t.get("displayName") == display_name:
-                    return t.get("id")
+            return resp.json().get("value", [])
+        return None
+
+    def _get_webhook_index(self, project_id):
+        """(repository id, target url) -> git.push web hook subscription, loaded once per project."""
+        return self._memoize(("webhooks", project_id), lambda: self._fetch_webhooks(project_id))
+
+    def _fetch_webhooks(self, project_id):
+        # Filter on the server instead of listing every push subscription in the org.
+        query = {
+            "publisherId": "tfs",
+            "eventType": "git.push",
+            "consumerId": "webHooks",
+            "consumerActionId": "httpRequest",
+        }
+        if project_id:
+            condition = {"inputId": "projectId", "operator": "equals", "inputValue": project_id}
+            query["publisherInputFilters"] = [{"conditions": [condition]}]
+        url = f"{self.base_url}/_apis/hooks/subscriptionsquery?api-version=7.1"
+        resp = self._request("POST", url, json=query)
+        if resp.status_code == 200:
+            subs = resp.json().get("results") or []
+        else:
+            list_url = f"{self.base_url}/_apis/hooks/subscriptions?publisherId=tfs&eventType=git.push&api-version=7.1"
+            resp = self._request("GET", list_url)
+            if resp.status_code != 200:
+                return None
+            subs = [
+                sub
+                for sub in resp.json().get("value", [])
+                if not project_id or sub.get("publisherInputs", {}).get("projectId") == project_id
+            ]
+
+        index = {}
+        for sub in subs:
+            key = (
+                sub.get("publisherInputs", {}).get("repository"),
+                sub.get("consumerInputs", {}).get("url"),
+            )
+            index.setdefault(key, sub)
+        return index
+
+    def list_repos(self):
+        """List the project's repositories (the API returns them in one response)."""
+        url = f"{self.base_url}/{self.project}/_apis/git/repositories?api-version=7.1"
+        resp = self._request("GET", url)
+        if resp.status_code == 200:
+            return resp.json().get("value", [])
+        click.echo(
+            f"Failed to list repositories. Status: {resp.status_code}, Body: {resp.text}", err=True
+        )
         return None
 
     def repo_exists(self, repo_name):
         """Check if a repository exists."""
-        # Azure DevOps API: GET /_apis/git/repositories/{repositoryId}
-        url = f"{self.base_url}/{self.project}/_apis/git/repositories/{repo_name}?api-version=7.1"
-        resp = self._request("GET", url)
-        return resp.status_code == 200
+        index = self._fresh_repo_index()
+        if index is not None:
+            return repo_name.lower() in index
+        # Resolving the ID also caches it for later webhook/branch/PR calls.
+        return self._get_repo_id(repo_name) is not None
 
     def create_repo(self, name, description=None):
         """Create a repository."""
@@ -111,16 +239,20 @@ class AzureProvider(GitProvider):
         payload = {"name": name, "project": {"id": project_id}}
 
         click.echo(f"Creating repo '{name}' in project '{self.project}'...")
-        for attempt in range(1, 11):
+        delays = backoff_delays(initial=1, maximum=10)
+        for _ in range(10):
             resp = self._request("POST", url, json=payload)
             if resp.status_code == 201:
-                return resp.json()
+                repo = resp.json()
+                self._remember(("repo_id", self.project, name), repo.get("id"))
+                self._index_repo(repo)
+                return repo
 
             if self._is_git_dataspace_not_ready(resp):
-                wait_ok = self._wait_for_git_ready(timeout_seconds=120, poll_seconds=2)
+                wait_ok = self._wait_for_git_ready(timeout_seconds=120)
                 if not wait_ok:
                     return None
-                time.sleep(min(2 * attempt, 10))
+                time.sleep(next(delays))
                 continue
 
             click.echo(
@@ -162,29 +294,94 @@ class AzureProvider(GitProvider):
         }
 
         # Check existing hooks
-        list_url = f"{self.base_url}/_apis/hooks/subscriptions?publisherId=tfs&eventType=git.push&api-version=7.1"
-        list_resp = self._request("GET", list_url)
-        if list_resp.status_code == 200:
-            subs = list_resp.json().get("value", [])
-            for sub in subs:
-                if (
-                    sub.get("consumerInputs", {}).get("url") == target_url
-                    and sub.get("publisherInputs", {}).get("repository") == repo_id
-                ):
-                    click.echo("Webhook already exists.")
-                    return sub
+        index = self._get_webhook_index(project_id)
+        if index and (repo_id, target_url) in index:
+            click.echo("Webhook already exists.")
+            return index[(repo_id, target_url)]
 
         click.echo(f"Creating webhook for repo {repo_id}...")
         resp = self._request("POST", url, json=payload)
 
         if resp.status_code == 200:
-            return resp.json()
+            sub = resp.json()
+            if index is not None:
+                index[(repo_id, target_url)] = sub
+            return sub
 
         click.echo(
             f"Failed to create webhook. Status: {resp.status_code}, Body: {resp.text}", err=True
         )
         return None
 
+    def _read_files(self, repo_identifier, branch, paths):
+        """Read files at the branch tip with the items API; the version is the tip commit id."""
+        repo_id = self._get_repo_id(repo_identifier)
+        if not repo_id:
+            raise RuntimeError(f"Repository '{repo_identifier}' not found")
+        repo_url = f"{self.base_url}/{self.project}/_apis/git/repositories/{repo_id}"
+
+        resp = self._request("GET", f"{repo_url}/refs", params={"filter": f"heads/{branch}"})
+        refs = resp.json().get("value", []) if resp.status_code == 200 else []
+        tip = next((r["objectId"] for r in refs if r.get("name") == f"refs/heads/{branch}"), None)
+        if not tip:
+            raise RuntimeError(f"Branch '{branch}' not found: HTTP {resp.status_code} {resp.text}")
+
+        files = {}
+        for path in paths:
+            # Read at the tip commit, so every file comes from the same snapshot.
+            resp = self._request(
+                "GET",
+                f"{repo_url}/items",
+                params={
+                    "path": path,
+                    "versionDescriptor.version": tip,
+                    "versionDescriptor.versionType": "commit",
+                    "includeContent": "true",
+                    "$format": "json",
+                },
+            )
+            if resp.status_code == 404:
+                files[path] = None
+            elif resp.status_code == 200:
+                files[path] = resp.json().get("content") or ""
+            else:
+                raise RuntimeError(f"Failed to read {path}: HTTP {resp.status_code} {resp.text}")
+        return files, tip
+
+    def _write_files(self, repo_identifier, branch, files, version, changes, message):
+        """
+        Commit all changes in one push.
+
+        oldObjectId pins the branch to the tip that was read; Azure DevOps
+        rejects the push (409) if the branch moved meanwhile.
+        """
+        repo_id = self._get_repo_id(repo_identifier)
+        url = f"{self.base_url}/{self.project}/_apis/git/repositories/{repo_id}/pushes"
+        payload = {
+            "refUpdates": [{"name": f"refs/heads/{branch}", "oldObjectId": version}],
+            "commits": [
+                {
+                    "comment": message,
+                    "changes": [
+                        {
+                            "changeType": "add" if files.get(path) is None else "edit",
+                            "item": {"path": f"/{path}"},
+                            "newContent": {"content": text, "contentType": "rawtext"},
+                        }
+                        for path, text in changes.items()
+                    ],
+                }
+            ],
+        }
+        resp = self._request("POST", url, json=payload)
+        if resp.status_code == 409:
+            raise ConflictError(f"{branch} moved since {version[:12]}")
+        if resp.status_code != 201:
+            raise RuntimeError(f"Failed to push to {branch}: HTTP {resp.status_code} {resp.text}")
+        commit = (resp.json().get("commits") or [{}])[-1].get("commitId")
+        click.echo(f"Pushed {len(changes)} file(s) to {branch} ({commit}).")
+        return commit
+
     def webhook_push_path(self) -> str:
         return "/azure/push"
 
@@ -271,8 +468,10 @@ class AzureProvider(GitProvider):
 
         if check_resp.status_code == 200:
             click.echo(f"Project '{project_name}' already exists.")
-            self._wait_for_git_ready(timeout_seconds=120, poll_seconds=2)
-            return check_resp.json()
+            project = check_resp.json()
+            self._remember(("project_id", project_name), project.get("id"))
+            self._wait_for_git_ready(timeout_seconds=120)
+            return project
 
         # Create Project
         url = f"{self.base_url}/_apis/projects?api-version=7.1"
@@ -306,18 +505,31 @@ class AzureProvider(GitProvider):
         resp = self._request("POST", url, json=payload)
 
         if resp.status_code == 202:
+            # Project-scoped lookups made before creation are stale now.
+            self._invalidate(("project_id", project_name), ("policy_types", project_name))
             operation_ref = resp.json()
             op_id = operation_ref.get("id")
             click.echo(f"Project creation queued. Operation ID: {op_id}")
 
-            for _ in range(30):
-                time.sleep(2)
-                if self._get_project_id():
-                    click.echo(f"Project '{project_name}' created successfully.")
-                    self._wait_for_git_ready(timeout_seconds=120, poll_seconds=2)
-                    return operation_ref
-
-            click.echo(f"Timeout waiting for project '{project_name}' to be ready.", err=True)
+            status = self._wait_for_operation(operation_ref, timeout_seconds=120)
+            if status is None:
+                # No operations endpoint: poll for the project itself.
+                found = not wait_until(self._get_project_id, 60).timed_out
+                status = "succeeded" if found else "timeout"
+            if status == "succeeded" and self._get_project_id():
+                click.echo(f"Project '{project_name}' created successfully.")
+                self._wait_for_git_ready(timeout_seconds=120)
+                return operation_ref
+
+            if status == "timeout":
+                click.echo(f"Timeout waiting for project '{project_name}' to be ready.", err=True)
+            elif status == "succeeded":
+                click.echo(
+                    f"Project '{project_name}' was not found after its creation succeeded.",
+                    err=True,
+                )
+            else:
+                click.echo(f"Project '{project_name}' creation {status}.", err=True)
             return None
 
         click.echo(
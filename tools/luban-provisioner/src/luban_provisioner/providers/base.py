@@ -1,4 +1,26 @@
+import os
+import time
 from abc import ABC, abstractmethod
+from urllib.parse import urlsplit
+
+import click
+
+from .http import (
+    build_session,
+    get_etag_cache,
+    get_rate_limiter,
+    is_rate_limited,
+    rate_limit_resource,
+)
+from .wait import backoff_delays
+
+RATE_LIMIT_RETRIES = 3
+DEFAULT_REPO_INDEX_TTL = 300
+FILE_UPDATE_RETRIES = 5
+
+
+class ConflictError(Exception):
+    """A file write was rejected because the branch or file changed after it was read."""
 
 
 class GitProvider(ABC):
@@ -6,11 +28,193 @@ class GitProvider(ABC):
     Abstract Base Class for Git Providers (GitHub, Azure DevOps, etc.)
     """
 
-    def __init__(self, token, organization, project=None, git_server=None):
+    def __init__(self, token, organization, project=None, git_server=None, session=None):
         self.token = token
         self.organization = organization
         self.project = project
         self.git_server = git_server
+        # A single pooled session keeps TCP/TLS connections alive across calls.
+        # It may be shared between providers; auth is always passed per request.
+        self.session = session if session is not None else build_session()
+        # Per-run memoization of read-only lookups (IDs, type lists, ...).
+        self._lookup_cache = {}
+        # Optional cross-run cache of GET responses, revalidated with ETags.
+        self._etag_cache = get_etag_cache()
+        # Inventory of repository name -> repo, see load_repo_index().
+        self._repo_index = None
+        self._repo_index_loaded = 0.0
+
+    def _send(self, method, url, **kwargs):
+        """
+        Issue an HTTP request through the provider's pooled session.
+
+        Requests are paced by the API host's shared RateLimiter, and 429/403
+        rate-limit responses are retried after the pause the server asks for.
+        With LUBAN_HTTP_CACHE_DIR set, GETs are sent as conditional requests
+        and a 304 is answered from the on-disk cache.
+        """
+        cache = self._etag_cache if method == "GET" else None
+        if cache:
+            key = cache.key(url, kwargs.get("params"), self.token)
+            entry = cache.load(key)
+            if entry:
+                kwargs["headers"] = {
+                    **(kwargs.get("headers") or {}),
+                    "If-None-Match": entry["etag"],
+                }
+            resp = self._send_paced(method, url, **kwargs)
+            if resp.status_code == 304 and entry:
+                return cache.revive(entry, resp)
+            if resp.status_code == 200:
+                cache.store(key, resp)
+            return resp
+        return self._send_paced(method, url, **kwargs)
+
+    def _send_paced(self, method, url, **kwargs):
+        host, path = urlsplit(url)[1:3]
+        limiter = get_rate_limiter(host, rate_limit_resource(path))
+        delays = backoff_delays(initial=2, maximum=60)
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            limiter.acquire()
+            resp = self.session.request(method, url, **kwargs)
+            resource = (resp.headers or {}).get("X-RateLimit-Resource")
+            if resource:
+                limiter = get_rate_limiter(host, resource)
+            pause = limiter.update(resp.headers)
+            if attempt == RATE_LIMIT_RETRIES or not is_rate_limited(resp):
+                return resp
+            if not pause:
+                pause = limiter.pause(next(delays))
+            click.echo(
+                f"Rate limited by {urlsplit(url).netloc} (HTTP {resp.status_code}); "
+                f"retrying in {pause:.0f}s..."
+            )
+        return resp
+
+    def _memoize(self, key, loader):
+        """Return the cached value for key, calling loader() on a miss.
+
+        None results are not cached so callers can keep polling for resources
+        that do not exist yet.
+        """
+        if key in self._lookup_cache:
+            return self._lookup_cache[key]
+        value = loader()
+        if value is not None:
+            self._lookup_cache[key] = value
+        return value
+
+    def _remember(self, key, value):
+        """Seed the lookup cache with a value learned from a write response."""
+        if value is not None:
+            self._lookup_cache[key] = value
+
+    def _invalidate(self, *keys):
+        """Drop cached lookups after a write that may have changed them."""
+        for key in keys:
+            self._lookup_cache.pop(key, None)
+
+    def clear_cache(self):
+        """Forget every memoized lookup and the repository index."""
+        self._lookup_cache.clear()
+        self._repo_index = None
+
+    def load_repo_index(self):
+        """
+        Fetch the repository inventory once with list_repos().
+
+        Until LUBAN_REPO_INDEX_TTL seconds (default 300) pass, repo_exists()
+        and repository lookups are answered from this name -> repo index
+        instead of one request per repository. Returns the index, or None if
+        the inventory could not be listed.
+        """
+        repos = self.list_repos()
+        if repos is None:
+            return None
+        self._repo_index = {repo["name"].lower(): repo for repo in repos if repo.get("name")}
+        self._repo_index_loaded = time.monotonic()
+        return self._repo_index
+
+    def _fresh_repo_index(self):
+        if self._repo_index is None:
+            return None
+        try:
+            ttl = float(os.getenv("LUBAN_REPO_INDEX_TTL") or DEFAULT_REPO_INDEX_TTL)
+        except ValueError:
+            ttl = DEFAULT_REPO_INDEX_TTL
+        if time.monotonic() - self._repo_index_loaded > ttl:
+            self._repo_index = None
+            return None
+        return self._repo_index
+
+    def _index_repo(self, repo):
+        """Add a repository created by this run to a loaded index."""
+        if self._repo_index is not None and repo and repo.get("name"):
+            self._repo_index[repo["name"].lower()] = repo
+
+    def close(self):
+        """Release pooled connections."""
+        self.session.close()
+
+    def update_files(
+        self, repo_identifier, branch, paths, mutate, message, retries=FILE_UPDATE_RETRIES
+    ):
+        """
+        Edit files on a branch through the provider API, without cloning.
+
+        mutate() receives {path: text or None if missing} and returns
+        {path: new text} for the files to write, like
+        utils.edit_files_in_tree(). The write carries the versions that were
+        read, so a concurrent change is rejected and the edit is re-applied to
+        fresh content; mutate() must therefore only depend on its input.
+        message may be a callable, called after mutate().
+
+        Returns the new commit id, or None when mutate() made no changes.
+        Raises RuntimeError when the files cannot be read or written.
+        """
+        delays = backoff_delays(initial=1, maximum=10)
+        for attempt in range(1, retries + 1):
+            files, version = self._read_files(repo_identifier, branch, paths)
+            changes = {
+                path: text for path, text in mutate(dict(files)).items() if text != files.get(path)
+            }
+            if not changes:
+                return None
+            text = message() if callable(message) else message
+            try:
+                return self._write_files(repo_identifier, branch, files, version, changes, text)
+            except ConflictError as e:
+                if attempt == retries:
+                    raise RuntimeError(f"{e} (gave up after {retries} attempts)")
+                click.echo(f"{e}; re-reading and retrying ({attempt}/{retries})...")
+                time.sleep(next(delays))
+        return None
+
+    def update_file(self, repo_identifier, branch, path, mutate_fn, message, **kwargs):
+        """update_files() for one file: mutate_fn(text or None) returns the new text."""
+        return self.update_files(
+            repo_identifier,
+            branch,
+            [path],
+            lambda files: {path: mutate_fn(files[path])},
+            message,
+            **kwargs,
+        )
+
+    @abstractmethod
+    def _read_files(self, repo_identifier, branch, paths):
+        """Return ({path: text or None}, version) for the files on the branch."""
+        pass
+
+    @abstractmethod
+    def _write_files(self, repo_identifier, branch, files, version, changes, message):
+        """Write changes on top of version. Returns the commit id; raises ConflictError."""
+        pass
+
+    @abstractmethod
+    def list_repos(self):
+        """List every repository in the organization/project, or None on failure."""
+        pass
 
     @abstractmethod
     def repo_exists(self, repo_name):
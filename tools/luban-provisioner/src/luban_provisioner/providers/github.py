@@ -1,12 +1,14 @@
+import base64
+from urllib.parse import quote
+
 import click
-import requests
 
-from .base import GitProvider
+from .base import ConflictError, GitProvider
 
 
 class GitHubProvider(GitProvider):
-    def __init__(self, token, organization, project=None, git_server="github.com"):
-        super().__init__(token, organization, project, git_server)
+    def __init__(self, token, organization, project=None, git_server="github.com", session=None):
+        super().__init__(token, organization, project, git_server, session=session)
         self.api_url = (
             f"https://api.{git_server}"
             if git_server == "github.com"
@@ -19,11 +21,169 @@ class GitHubProvider(GitProvider):
 
     def get_current_user(self):
         """Get the authenticated user's login."""
-        resp = requests.get(f"{self.api_url}/user", headers=self.headers)
+        resp = self._send("GET", f"{self.api_url}/user", headers=self.headers)
         if resp.status_code == 200:
             return resp.json().get("login")
         return None
 
+    def _iter_pages(self, url, params=None):
+        """
+        Yield items from a paginated list endpoint, following Link: rel="next".
+
+        Raises RuntimeError when any page fails, so callers never mistake a
+        partial listing for a complete one.
+        """
+        params = {"per_page": 100, **(params or {})}
+        while url:
+            resp = self._send("GET", url, headers=self.headers, params=params)
+            if resp.status_code != 200:
+                raise RuntimeError(f"GET {url}: HTTP {resp.status_code} {resp.text}")
+            yield from resp.json()
+            url = resp.links.get("next", {}).get("url")
+            params = None  # the next link already carries the query
+
+    def _find_hook(self, owner, repo_name, target_url):
+        """
+        Return the repo's hook pointing at target_url, or None.
+
+        Pages are read until a match is found; only a complete, successful
+        scan is kept as a url -> hook index so later checks for the same repo
+        cost no requests. A failed listing returns None and caches nothing.
+        """
+        key = ("hooks", owner, repo_name)
+        index = self._lookup_cache.get(key)
+        if index is not None:
+            return index.get(target_url)
+
+        index = {}
+        try:
+            for hook in self._iter_pages(f"{self.api_url}/repos/{owner}/{repo_name}/hooks"):
+                url = hook.get("config", {}).get("url")
+                if url == target_url:
+                    return hook
+                index[url] = hook
+        except RuntimeError as e:
+            click.echo(f"Failed to list webhooks: {e}", err=True)
+            return None
+        self._remember(key, index)
+        return None
+
+    def _split_repo(self, repo_identifier):
+        """Return (owner, repo name) for a repo dict, "owner/name" or a bare name."""
+        if isinstance(repo_identifier, dict):
+            return (
+                repo_identifier.get("owner", {}).get("login", self.organization),
+                repo_identifier.get("name"),
+            )
+        if "/" in repo_identifier:
+            return tuple(repo_identifier.split("/", 1))
+        return self.organization, repo_identifier
+
+    def _contents_url(self, repo_identifier, path):
+        owner, repo_name = self._split_repo(repo_identifier)
+        return f"{self.api_url}/repos/{owner}/{repo_name}/contents/{quote(path)}"
+
+    def _repo_api_url(self, repo_identifier):
+        owner, repo_name = self._split_repo(repo_identifier)
+        return f"{self.api_url}/repos/{owner}/{repo_name}"
+
+    def _create(self, url, payload, what):
+        """POST a git-data object and return its sha."""
+        resp = self._send("POST", url, headers=self.headers, json=payload)
+        if resp.status_code != 201:
+            raise RuntimeError(f"Failed to create {what}: HTTP {resp.status_code} {resp.text}")
+        return resp.json().get("sha")
+
+    def _read_files(self, repo_identifier, branch, paths):
+        """Read files at the branch tip with the contents API; the version is the tip commit sha."""
+        repo_url = self._repo_api_url(repo_identifier)
+        resp = self._send("GET", f"{repo_url}/git/ref/heads/{quote(branch)}", headers=self.headers)
+        if resp.status_code != 200:
+            raise RuntimeError(f"Branch '{branch}' not found: HTTP {resp.status_code} {resp.text}")
+        tip = resp.json().get("object", {}).get("sha")
+
+        files = {}
+        for path in paths:
+            # Read at the tip commit, so every file comes from the same snapshot.
+            resp = self._send(
+                "GET",
+                self._contents_url(repo_identifier, path),
+                headers=self.headers,
+                params={"ref": tip},
+            )
+            if resp.status_code == 404:
+                files[path] = None
+            elif resp.status_code == 200:
+                files[path] = base64.b64decode(resp.json().get("content") or "").decode("utf-8")
+            else:
+                raise RuntimeError(f"Failed to read {path}: HTTP {resp.status_code} {resp.text}")
+        return files, tip
+
+    def _write_files(self, repo_identifier, branch, files, version, changes, message):
+        """
+        Commit all changes at once with the git data API.
+
+        Blobs and a tree are created on top of the tip commit that was read,
+        then a commit with that tip as parent. The branch is moved with a
+        non-forced ref update, which GitHub rejects as "not a fast forward" if
+        the branch moved meanwhile.
+        """
+        repo_url = self._repo_api_url(repo_identifier)
+        resp = self._send("GET", f"{repo_url}/git/commits/{version}", headers=self.headers)
+        if resp.status_code != 200:
+            raise RuntimeError(
+                f"Failed to read commit {version}: HTTP {resp.status_code} {resp.text}"
+            )
+        base_tree = resp.json().get("tree", {}).get("sha")
+
+        entries = []
+        for path, text in changes.items():
+            blob = self._create(
+                f"{repo_url}/git/blobs", {"content": text, "encoding": "utf-8"}, f"blob for {path}"
+            )
+            entries.append({"path": path, "mode": "100644", "type": "blob", "sha": blob})
+        tree = self._create(
+            f"{repo_url}/git/trees", {"base_tree": base_tree, "tree": entries}, "tree"
+        )
+        commit = self._create(
+            f"{repo_url}/git/commits",
+            {"message": message, "tree": tree, "parents": [version]},
+            "commit",
+        )
+
+        resp = self._send(
+            "PATCH",
+            f"{repo_url}/git/refs/heads/{quote(branch)}",
+            headers=self.headers,
+            json={"sha": commit, "force": False},
+        )
+        if resp.status_code in (409, 422) and "fast forward" in resp.text.lower():
+            raise ConflictError(f"{branch} moved since {version[:12]}")
+        if resp.status_code != 200:
+            raise RuntimeError(f"Failed to update {branch}: HTTP {resp.status_code} {resp.text}")
+        click.echo(f"Pushed {len(changes)} file(s) to {branch} ({commit}).")
+        return commit
+
+    def list_repos(self):
+        """
+        List the organization's repositories, or the user's own when it is not an org.
+
+        Returns None if any page fails, never a partial list.
+        """
+        try:
+            return list(
+                self._iter_pages(f"{self.api_url}/orgs/{self.organization}/repos", {"type": "all"})
+            )
+        except RuntimeError as e:
+            if self.get_current_user() != self.organization:
+                click.echo(f"Failed to list repositories: {e}", err=True)
+                return None
+        try:
+            return list(self._iter_pages(f"{self.api_url}/user/repos", {"affiliation": "owner"}))
+        except RuntimeError as e:
+            click.echo(f"Failed to list repositories: {e}", err=True)
+            return None
+
     def repo_exists(self, repo_name):
         """Check if a repository exists."""
         # Check if repo_name contains slash (owner/repo) or if we should use self.organization
@@ -33,9 +193,20 @@ class GitHubProvider(GitProvider):
             owner = self.organization
             name = repo_name
 
-        resp = requests.get(f"{self.api_url}/repos/{owner}/{name}", headers=self.headers)
+        index = self._fresh_repo_index() if owner == self.organization else None
+        if index is not None:
+            return name.lower() in index
+
+        resp = self._send("GET", f"{self.api_url}/repos/{owner}/{name}", headers=self.headers)
         return resp.status_code == 200
 
+    def _created(self, repo):
+        # A repository created by this run has no hooks yet.
+        owner = repo.get("owner", {}).get("login", self.organization)
+        self._remember(("hooks", owner, repo.get("name")), {})
+        self._index_repo(repo)
+        return repo
+
     def create_repo(self, name, description=None):
         """
         Create a repository.
@@ -55,12 +226,15 @@ class GitHubProvider(GitProvider):
             click.echo(
                 f"Attempting to create repo '{name}' in organization '{self.organization}'..."
             )
-            resp = requests.post(
-                f"{self.api_url}/orgs/{self.organization}/repos", headers=self.headers, json=payload
+            resp = self._send(
+                "POST",
+                f"{self.api_url}/orgs/{self.organization}/repos",
+                headers=self.headers,
+                json=payload,
             )
 
             if resp.status_code == 201:
-                return resp.json()
+                return self._created(resp.json())
 
             if resp.status_code == 404:
                 click.echo(
@@ -91,10 +265,10 @@ class GitHubProvider(GitProvider):
             return None
 
         click.echo(f"Creating repo '{name}' for user '{current_user}'...")
-        resp = requests.post(f"{self.api_url}/user/repos", headers=self.headers, json=payload)
+        resp = self._send("POST", f"{self.api_url}/user/repos", headers=self.headers, json=payload)
 
         if resp.status_code == 201:
-            return resp.json()
+            return self._created(resp.json())
 
         click.echo(
             f"Failed to create repo for user. Status: {resp.status_code}, Body: {resp.text}",
@@ -120,22 +294,23 @@ class GitHubProvider(GitProvider):
 
         # Check existing hooks
         hooks_url = f"{self.api_url}/repos/{owner}/{repo_name}/hooks"
-        resp = requests.get(hooks_url, headers=self.headers)
-        if resp.status_code == 200:
-            hooks = resp.json()
-            for hook in hooks:
-                if hook.get("config", {}).get("url") == target_url:
-                    click.echo("Webhook already exists.")
-                    return hook
+        hook = self._find_hook(owner, repo_name, target_url)
+        if hook:
+            click.echo("Webhook already exists.")
+            return hook
 
         # Create new hook
         config = {"url": target_url, "content_type": "json", "secret": secret, "insecure_ssl": "0"}
         payload = {"name": "web", "active": True, "events": events, "config": config}
 
         click.echo(f"Creating webhook for {owner}/{repo_name}...")
-        resp = requests.post(hooks_url, headers=self.headers, json=payload)
+        resp = self._send("POST", hooks_url, headers=self.headers, json=payload)
         if resp.status_code == 201:
-            return resp.json()
+            hook = resp.json()
+            index = self._lookup_cache.get(("hooks", owner, repo_name))
+            if index is not None:
+                index[target_url] = hook
+            return hook
 
         click.echo(
             f"Failed to create webhook. Status: {resp.status_code}, Body: {resp.text}", err=True
@@ -155,8 +330,8 @@ class GitHubProvider(GitProvider):
 
         click.echo(f"Setting default branch to '{branch_name}'...")
         payload = {"default_branch": branch_name}
-        resp = requests.patch(
-            f"{self.api_url}/repos/{owner}/{repo_name}", headers=self.headers, json=payload
+        resp = self._send(
+            "PATCH", f"{self.api_url}/repos/{owner}/{repo_name}", headers=self.headers, json=payload
         )
         if resp.status_code != 200:
             click.echo(
@@ -190,7 +365,7 @@ class GitHubProvider(GitProvider):
         }
 
         url = f"{self.api_url}/repos/{owner}/{repo_name}/branches/{branch_name}/protection"
-        resp = requests.put(url, headers=self.headers, json=payload)
+        resp = self._send("PUT", url, headers=self.headers, json=payload)
 
         if resp.status_code != 200:
             click.echo(
@@ -214,21 +389,13 @@ class GitHubProvider(GitProvider):
         self, repo_identifier, title, description, source_ref, target_ref="main"
     ):
         """Create a Pull Request."""
-        if isinstance(repo_identifier, dict):
-            repo_name = repo_identifier.get("name")
-            owner = repo_identifier.get("owner", {}).get("login", self.organization)
-        elif "/" in repo_identifier:
-            owner, repo_name = repo_identifier.split("/", 1)
-        else:
-            owner = self.organization
-            repo_name = repo_identifier
-
+        owner, repo_name = self._split_repo(repo_identifier)
         url = f"{self.api_url}/repos/{owner}/{repo_name}/pulls"
 
         payload = {"title": title, "body": description, "head": source_ref, "base": target_ref}
 
         click.echo(f"Creating PR '{title}' in {owner}/{repo_name}...")
-        resp = requests.post(url, headers=self.headers, json=payload)
+        resp = self._send("POST", url, headers=self.headers, json=payload)
 
         if resp.status_code == 201:
             pr = resp.json()
@@ -0,0 +1,169 @@
+import click
+
+from .github import GitHubProvider
+
+OWNER_QUERY = """
+query($org: String!) {
+  viewer { login id }
+  organization(login: $org) { id }
+}
+"""
+
+CREATE_REPOSITORY = """
+mutation($input: CreateRepositoryInput!) {
+  createRepository(input: $input) {
+    repository { id name nameWithOwner url owner { login } }
+  }
+}
+"""
+
+REPOSITORY_ID_QUERY = """
+query($owner: String!, $name: String!) {
+  repository(owner: $owner, name: $name) { id }
+}
+"""
+
+CREATE_BRANCH_PROTECTION = """
+mutation($input: CreateBranchProtectionRuleInput!) {
+  createBranchProtectionRule(input: $input) {
+    branchProtectionRule { id pattern }
+  }
+}
+"""
+
+
+class GitHubGraphQLProvider(GitHubProvider):
+    """
+    GitHubProvider that creates repositories and branch protection through GraphQL.
+
+    The owner (organization or authenticated user) is resolved with one query
+    per run, so creating a repository is a single mutation without the REST
+    org probe and /user fallback. Protection is one createBranchProtectionRule
+    mutation. GraphQL has no mutation for the default branch (UpdateRepository
+    cannot change it), so that and all other operations use the REST API of
+    GitHubProvider; protection also falls back to REST if the mutation is
+    rejected.
+
+    A new repository with a default branch and protection costs 4 requests
+    for the first repository of a run (owner query, createRepository, REST
+    default branch, createBranchProtectionRule) and 3 for each later one.
+    REST needs 3 in an organization and 5 for a user account (org probe,
+    /user, create, default branch, protection), so this only saves requests
+    for user-owned repositories; in an organization it costs one more per run.
+    """
+
+    def __init__(self, token, organization, project=None, git_server="github.com", session=None):
+        super().__init__(token, organization, project, git_server, session=session)
+        self.graphql_url = (
+            "https://api.github.com/graphql"
+            if git_server == "github.com"
+            else f"https://{git_server}/api/graphql"
+        )
+        self.graphql_headers = {"Authorization": f"bearer {self.token}"}
+
+    def _graphql(self, query, variables):
+        """Run a GraphQL document. Returns (data, errors)."""
+        resp = self._send(
+            "POST",
+            self.graphql_url,
+            headers=self.graphql_headers,
+            json={"query": query, "variables": variables},
+        )
+        if resp.status_code != 200:
+            return {}, [{"message": f"HTTP {resp.status_code}: {resp.text}"}]
+        body = resp.json()
+        return body.get("data") or {}, body.get("errors") or []
+
+    def _get_owner(self):
+        return self._memoize(("graphql_owner", self.organization), self._fetch_owner)
+
+    def _fetch_owner(self):
+        data, errors = self._graphql(OWNER_QUERY, {"org": self.organization or ""})
+        viewer = data.get("viewer")
+        if not viewer:
+            click.echo(f"Failed to resolve GitHub owner: {errors}", err=True)
+            return None
+        org = data.get("organization")
+        return {
+            "viewer": viewer["login"],
+            "viewer_id": viewer["id"],
+            "org_id": (org or {}).get("id"),
+        }
+
+    def _get_repo_node_id(self, repo_identifier):
+        if isinstance(repo_identifier, dict) and repo_identifier.get("node_id"):
+            return repo_identifier["node_id"]
+        if isinstance(repo_identifier, dict):
+            owner = repo_identifier.get("owner", {}).get("login", self.organization)
+            name = repo_identifier.get("name")
+        elif "/" in repo_identifier:
+            owner, name = repo_identifier.split("/", 1)
+        else:
+            owner, name = self.organization, repo_identifier
+
+        def load():
+            data, _ = self._graphql(REPOSITORY_ID_QUERY, {"owner": owner, "name": name})
+            return (data.get("repository") or {}).get("id")
+
+        return self._memoize(("repo_node_id", owner, name), load)
+
+    def create_repo(self, name, description=None):
+        """Create a private repository in the organization, or for the authenticated user."""
+        owner = self._get_owner()
+        if not owner:
+            return None
+
+        owner_id = owner["org_id"]
+        if not owner_id:
+            if self.organization and self.organization != owner["viewer"]:
+                click.echo(
+                    f"Target '{self.organization}' is neither an accessible organization nor the authenticated user '{owner['viewer']}'.",
+                    err=True,
+                )
+                return None
+            owner_id = owner["viewer_id"]
+
+        repo_input = {"name": name, "ownerId": owner_id, "visibility": "PRIVATE"}
+        if description:
+            repo_input["description"] = description
+
+        click.echo(f"Creating repo '{name}' via GraphQL...")
+        data, errors = self._graphql(CREATE_REPOSITORY, {"input": repo_input})
+        repo = (data.get("createRepository") or {}).get("repository")
+        if not repo:
+            click.echo(f"Failed to create repo. Errors: {errors}", err=True)
+            return None
+
+        # REST-shaped so the inherited REST methods accept it as an identifier.
+        return self._created(
+            {
+                "node_id": repo["id"],
+                "name": repo["name"],
+                "full_name": repo["nameWithOwner"],
+                "html_url": repo["url"],
+                "owner": {"login": repo["owner"]["login"]},
+            }
+        )
+
+    def enable_branch_protection(self, repo_identifier, branch_name, min_reviewers=1):
+        """Enable branch protection with a single createBranchProtectionRule mutation."""
+        repo_id = self._get_repo_node_id(repo_identifier)
+        if not repo_id:
+            return super().enable_branch_protection(repo_identifier, branch_name, min_reviewers)
+
+        click.echo(f"Enabling branch protection for '{branch_name}' via GraphQL...")
+        rule_input = {
+            "repositoryId": repo_id,
+            "pattern": branch_name,
+            "requiresApprovingReviews": True,
+            "requiredApprovingReviewCount": min_reviewers,
+            "dismissesStaleReviews": True,
+            "requiresCodeOwnerReviews": False,
+            "isAdminEnforced": True,
+        }
+        data, errors = self._graphql(CREATE_BRANCH_PROTECTION, {"input": rule_input})
+        if (data.get("createBranchProtectionRule") or {}).get("branchProtectionRule"):
+            return True
+
+        click.echo(f"GraphQL branch protection failed ({errors}); retrying via REST.", err=True)
+        return super().enable_branch_protection(repo_identifier, branch_name, min_reviewers)
@@ -0,0 +1,349 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 16
+
+DEFAULT_RATE = 10.0  # requests per second per API host
+DEFAULT_BURST = 20
+DEFAULT_MAX_WAIT = 300  # longest single rate-limit pause, in seconds
+DEFAULT_CACHE_MAX_AGE = 7 * 24 * 3600  # seconds an unused ETag cache entry is kept
+DEFAULT_CACHE_MAX_ENTRIES = 10000
+MIN_RATE = 0.2
+# The pace is only lowered once less than this share of X-RateLimit-Limit is
+# left (or LOW_BUDGET requests when the server sends no limit).
+LOW_BUDGET_FRACTION = 0.1
+LOW_BUDGET = 100
+
+
+def _env_int(name, default):
+    raw = (os.getenv(name) or "").strip()
+    if not raw:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+
+def _env_float(name, default):
+    raw = (os.getenv(name) or "").strip()
+    try:
+        value = float(raw) if raw else default
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+
+def build_session(pool_connections=None, pool_maxsize=None):
+    """
+    Create a keep-alive requests.Session with a sized connection pool.
+
+    pool_connections is the number of distinct hosts kept in the pool and
+    pool_maxsize the number of reusable connections per host. Both default to
+    LUBAN_HTTP_POOL_CONNECTIONS / LUBAN_HTTP_POOL_MAXSIZE when set.
+    """
+    if pool_connections is None:
+        pool_connections = _env_int("LUBAN_HTTP_POOL_CONNECTIONS", DEFAULT_POOL_CONNECTIONS)
+    if pool_maxsize is None:
+        pool_maxsize = _env_int("LUBAN_HTTP_POOL_MAXSIZE", DEFAULT_POOL_MAXSIZE)
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _header_seconds(headers, name):
+    raw = (headers or {}).get(name)
+    if raw is None or str(raw).strip() == "":
+        return None
+    try:
+        return float(raw)
+    except ValueError:
+        pass
+    try:
+        # Retry-After may also be an HTTP date.
+        return parsedate_to_datetime(raw).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every thread talking to one API host.
+
+    acquire() paces requests to `rate` per second with bursts of up to `burst`.
+    update() reads the server's rate-limit headers after each response:
+    Retry-After pauses all callers. Once X-RateLimit-Remaining drops below
+    LOW_BUDGET_FRACTION of X-RateLimit-Limit (GitHub, and Azure DevOps TSTU
+    budgets), the rate is lowered so the rest of the budget is spread over
+    the time left until X-RateLimit-Reset instead of being spent at once; a
+    healthy budget keeps the configured rate. X-RateLimit-Delay (Azure DevOps
+    throttling) halves the rate.
+    """
+
+    def __init__(self, rate=None, burst=None, max_wait=None):
+        self.base_rate = rate or _env_float("LUBAN_HTTP_RATE", DEFAULT_RATE)
+        self.burst = burst or _env_int("LUBAN_HTTP_BURST", DEFAULT_BURST)
+        self.max_wait = max_wait or _env_float("LUBAN_HTTP_MAX_WAIT", DEFAULT_MAX_WAIT)
+        self.rate = self.base_rate
+        self.remaining = None
+        self.limit = None
+        self.reset_at = None
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold back every caller for up to max_wait seconds. Returns the pause applied."""
+        seconds = min(max(seconds, 0), self.max_wait)
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        return seconds
+
+    def update(self, headers):
+        """Adapt to a response's rate-limit headers. Returns the pause requested by the server."""
+        retry_after = _header_seconds(headers, "Retry-After")
+        remaining = _header_seconds(headers, "X-RateLimit-Remaining")
+        limit = _header_seconds(headers, "X-RateLimit-Limit")
+        reset = _header_seconds(headers, "X-RateLimit-Reset")
+        delay = _header_seconds(headers, "X-RateLimit-Delay")
+
+        with self._lock:
+            if remaining is not None:
+                self.remaining = int(remaining)
+            if limit is not None:
+                self.limit = int(limit)
+            if reset is not None:
+                self.reset_at = reset
+            rate = self.base_rate
+            window = (reset - time.time()) if reset else 0
+            low = self.limit * LOW_BUDGET_FRACTION if self.limit else LOW_BUDGET
+            if remaining is not None and remaining < low and window > 0:
+                rate = min(rate, max(remaining / window, MIN_RATE))
+            if delay:
+                rate = max(min(rate, self.rate / 2), MIN_RATE)
+            self.rate = rate
+
+        wait = retry_after or 0
+        if remaining == 0 and window > 0:
+            wait = max(wait, window)
+        return self.pause(wait) if wait > 0 else 0
+
+    def status(self):
+        return {
+            "remaining": self.remaining,
+            "limit": self.limit,
+            "reset_at": self.reset_at,
+            "rate": self.rate,
+        }
+
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+# ETag cache directories already pruned by this process.
+_PRUNED = set()
+_PRUNED_LOCK = threading.Lock()
+
+
+def rate_limit_resource(url_path):
+    """
+    Guess the rate-limit budget a request draws from before it is sent.
+
+    GitHub keeps separate budgets (X-RateLimit-Resource) for GraphQL, search
+    and the core REST API; a response naming another budget corrects this.
+    """
+    if url_path.rstrip("/").endswith("/graphql"):
+        return "graphql"
+    if "/search/" in url_path:
+        return "search"
+    return "core"
+
+
+def get_rate_limiter(host, resource="core"):
+    """Return the process-wide RateLimiter for one budget of an API host."""
+    with _LIMITERS_LOCK:
+        key = (host, resource)
+        if key not in _LIMITERS:
+            _LIMITERS[key] = RateLimiter()
+        return _LIMITERS[key]
+
+
+def rate_limit_status():
+    """Remaining budget and current pace for every API host and budget used so far."""
+    with _LIMITERS_LOCK:
+        return {
+            host if resource == "core" else f"{host} ({resource})": limiter.status()
+            for (host, resource), limiter in _LIMITERS.items()
+        }
+
+
+def is_rate_limited(resp):
+    if resp.status_code == 429:
+        return True
+    if resp.status_code != 403:
+        return False
+    headers = resp.headers or {}
+    if str(headers.get("X-RateLimit-Remaining", "")).strip() == "0" or "Retry-After" in headers:
+        return True
+    return "rate limit" in (resp.text or "").lower()
+
+
+class ETagCache:
+    """
+    On-disk store of GET responses for conditional requests.
+
+    Entries are keyed by URL, query parameters and a hash of the credential,
+    so users never see each other's responses. A cached ETag is sent as
+    If-None-Match; on 304 the stored body is returned as a 200 response.
+    Only responses carrying an ETag are stored.
+
+    The entries are private API responses: directories are 0700 and files
+    0600. Entries unused for max_age seconds are dropped, and prune() keeps
+    at most max_entries, evicting the least recently used.
+    """
+
+    KEPT_HEADERS = ("Content-Type", "ETag", "Link")
+
+    def __init__(self, cache_dir, max_age=None, max_entries=None):
+        self.cache_dir = cache_dir
+        self.max_age = max_age or _env_float("LUBAN_HTTP_CACHE_MAX_AGE", DEFAULT_CACHE_MAX_AGE)
+        self.max_entries = max_entries or _env_int(
+            "LUBAN_HTTP_CACHE_MAX_ENTRIES", DEFAULT_CACHE_MAX_ENTRIES
+        )
+        self._makedirs(cache_dir)
+
+    @staticmethod
+    def _makedirs(path):
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        # makedirs leaves the mode of an existing directory alone
+        os.chmod(path, 0o700)
+
+    def key(self, url, params, credential):
+        identity = hashlib.sha256(str(credential or "").encode("utf-8")).hexdigest()
+        raw = json.dumps([url, sorted((params or {}).items()), identity], default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def load(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.max_age:
+                os.remove(path)
+                return None
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            # The mtime records the last use, for expiry and eviction
+            os.utime(path)
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def store(self, key, resp):
+        etag = resp.headers.get("ETag")
+        if not etag:
+            return
+        entry = {
+            "etag": etag,
+            "url": resp.url,
+            "headers": {h: resp.headers[h] for h in self.KEPT_HEADERS if h in resp.headers},
+            "body": resp.text,
+        }
+        path = self._path(key)
+        try:
+            self._makedirs(os.path.dirname(path))
+        except OSError:
+            return
+        # mkstemp creates the file with mode 0600
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def prune(self):
+        """Drop expired entries and the least recently used beyond max_entries."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    entries.append((os.stat(path).st_mtime, path))
+                except OSError:
+                    continue
+        entries.sort(reverse=True)
+        cutoff = time.time() - self.max_age
+        for i, (mtime, path) in enumerate(entries):
+            if i >= self.max_entries or mtime < cutoff:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def revive(entry, not_modified):
+        """Build a 200 response from a cache entry and the 304 that validated it."""
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.reason = "OK (revalidated)"
+        resp.url = entry.get("url") or not_modified.url
+        resp.request = not_modified.request
+        resp.headers = CaseInsensitiveDict(entry.get("headers") or {})
+        resp.headers.update(not_modified.headers or {})
+        resp.encoding = "utf-8"
+        resp._content = entry.get("body", "").encode("utf-8")
+        return resp
+
+
+def get_etag_cache():
+    """
+    Return an ETagCache under LUBAN_HTTP_CACHE_DIR, or None when caching is off.
+
+    The directory is pruned the first time it is opened in a process.
+    """
+    cache_dir = (os.getenv("LUBAN_HTTP_CACHE_DIR") or "").strip()
+    if not cache_dir:
+        return None
+    try:
+        cache = ETagCache(cache_dir)
+    except OSError:
+        return None
+    with _PRUNED_LOCK:
+        first = cache_dir not in _PRUNED
+        _PRUNED.add(cache_dir)
+    if first:
+        cache.prune()
+    return cache
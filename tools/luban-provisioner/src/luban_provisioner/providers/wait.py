@@ -0,0 +1,49 @@
+import random
+import time
+from typing import Any, NamedTuple
+
+
+class WaitResult(NamedTuple):
+    value: Any
+    elapsed: float
+    attempts: int
+
+    @property
+    def timed_out(self):
+        return self.value is None
+
+
+def backoff_delays(initial=0.5, maximum=10.0, factor=2.0, jitter=0.5):
+    """
+    Yield exponentially growing sleep intervals, capped at maximum.
+
+    Each interval is randomized by +/- jitter (as a fraction) so that many
+    clients polling the same server do not stay in lockstep.
+    """
+    delay = initial
+    while True:
+        yield min(maximum, delay * random.uniform(1 - jitter, 1 + jitter))
+        delay = min(maximum, delay * factor)
+
+
+def wait_until(check, timeout, initial=0.5, maximum=10.0, factor=2.0, jitter=0.5):
+    """
+    Call check() until it returns something other than None, or timeout seconds pass.
+
+    check() returns None for "not yet"; any other value (including False for
+    "give up") ends the wait. The first check runs immediately and later ones
+    follow backoff_delays(). Returns a WaitResult whose value is None on timeout.
+    """
+    start = time.monotonic()
+    delays = backoff_delays(initial, maximum, factor, jitter)
+    attempts = 0
+    while True:
+        attempts += 1
+        value = check()
+        elapsed = time.monotonic() - start
+        if value is not None:
+            return WaitResult(value, elapsed, attempts)
+        remaining = timeout - elapsed
+        if remaining <= 0:
+            return WaitResult(None, elapsed, attempts)
+        time.sleep(min(next(delays), remaining))
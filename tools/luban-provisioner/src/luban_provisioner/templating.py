@@ -0,0 +1,431 @@
+import difflib
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from binaryornot.helpers import CHUNK_SIZE, has_binary_extension, is_binary_string
+from cookiecutter.environment import StrictEnvironment
+from cookiecutter.exceptions import OutputDirExistsException
+from cookiecutter.generate import apply_overwrites_to_context
+from cookiecutter.prompt import prompt_for_config
+from jinja2 import FunctionLoader
+
+from luban_provisioner.bundle import TemplateBundle
+
+TEMPLATES_DIR = "/app/templates"
+DEFAULT_BUNDLE = "/app/templates.zip"
+
+_CACHE_LOCK = threading.Lock()
+# Held while a cookiecutter run has changed the process working directory.
+CWD_LOCK = threading.Lock()
+_COMPILED = {}
+_BUNDLES = {}
+
+
+class _DirSource:
+    """A template directory on disk."""
+
+    def __init__(self, template_dir):
+        self.key = os.path.abspath(template_dir)
+
+    def __str__(self):
+        return self.key
+
+    def fingerprint(self):
+        """Hash of every file's path, size and mtime: changes whenever the template is edited."""
+        digest = hashlib.sha256()
+        for rel in self.names():
+            st = os.stat(os.path.join(self.key, rel))
+            digest.update(f"{rel}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def names(self):
+        names = []
+        for root, dirs, files in os.walk(self.key):
+            dirs.sort()
+            for name in sorted(files):
+                rel = os.path.relpath(os.path.join(root, name), self.key)
+                names.append(rel.replace(os.sep, "/"))
+        return names
+
+    def has_hooks(self):
+        return os.path.isdir(os.path.join(self.key, "hooks"))
+
+    def read(self, rel_path):
+        with open(os.path.join(self.key, rel_path), "rb") as f:
+            return f.read()
+
+    def executable(self, rel_path):
+        return bool(os.stat(os.path.join(self.key, rel_path)).st_mode & 0o100)
+
+    def directory(self):
+        return self.key
+
+
+class BundledTemplate:
+    """A template inside a TemplateBundle, accepted wherever a template directory is."""
+
+    def __init__(self, bundle, name):
+        self.bundle = bundle
+        self.name = name.strip("/")
+        self.key = f"{bundle.path}!/{self.name}"
+        self._prefix = f"{self.name}/"
+
+    def __str__(self):
+        return self.key
+
+    def fingerprint(self):
+        return self.bundle.fingerprint
+
+    def names(self):
+        return self.bundle.names(self._prefix)
+
+    def has_hooks(self):
+        return any(rel.startswith("hooks/") for rel in self.names())
+
+    def read(self, rel_path):
+        return self.bundle.read(self._prefix + rel_path)
+
+    def executable(self, rel_path):
+        return self.bundle.executable(self._prefix + rel_path)
+
+    def directory(self):
+        """Extract the template once, for renders that need real files (cookiecutter hooks)."""
+        return self.bundle.extract(self._prefix)
+
+
+def _source(template):
+    return template if isinstance(template, (BundledTemplate, _DirSource)) else _DirSource(template)
+
+
+@dataclass
+class _TemplateFile:
+    rel_path: str
+    path_template: object
+    # None for binary and _copy_without_render files, which are copied verbatim.
+    content_template: object
+    newline: str
+    executable: bool
+
+
+@dataclass
+class CompiledTemplate:
+    """A cookiecutter template whose path and file templates are parsed once."""
+
+    source: object
+    fingerprint: str
+    env: StrictEnvironment
+    project_dir: object
+    files: list = field(default_factory=list)
+
+
+@dataclass
+class PlannedFile:
+    path: str
+    content: bytes
+    executable: bool
+    # "added", "modified" or "unchanged" relative to what is on disk.
+    status: str
+
+
+@dataclass
+class RenderStats:
+    project_dir: str
+    written: list = field(default_factory=list)
+    unchanged: int = 0
+
+
+def open_bundle(path):
+    """Return the TemplateBundle at path, reopening it only when the file changed."""
+    path = os.path.abspath(path)
+    with _CACHE_LOCK:
+        bundle = _BUNDLES.get(path)
+        if bundle is None or not bundle.is_current():
+            bundle = TemplateBundle(path)
+            _BUNDLES[path] = bundle
+        return bundle
+
+
+def resolve_template(name):
+    """
+    Find a template by its path relative to the templates directory.
+
+    Looks in the LUBAN_TEMPLATE_BUNDLE archive (default /app/templates.zip;
+    "off" skips it), then /app/templates, then tools/luban-provisioner/templates
+    under the working directory for runs from a repo checkout. Returns a
+    BundledTemplate, a directory path, or None.
+    """
+    bundle_path = os.getenv("LUBAN_TEMPLATE_BUNDLE") or DEFAULT_BUNDLE
+    if bundle_path.strip().lower() != "off" and os.path.isfile(bundle_path):
+        bundle = open_bundle(bundle_path)
+        if bundle.has(f"{name}/cookiecutter.json"):
+            return BundledTemplate(bundle, name)
+    with CWD_LOCK:
+        cwd = os.getcwd()
+    local_dir = os.path.join(cwd, "tools", "luban-provisioner", "templates")
+    for root in (TEMPLATES_DIR, local_dir):
+        path = os.path.join(root, name)
+        if os.path.isdir(path):
+            return path
+    return None
+
+
+def template_directory(template):
+    """A directory cookiecutter can read for template; bundled templates are extracted."""
+    return template.directory() if isinstance(template, BundledTemplate) else template
+
+
+def has_hooks(template):
+    """Templates with pre/post generation hooks need a real cookiecutter run."""
+    return _source(template).has_hooks()
+
+
+def use_cache(template):
+    """
+    Whether template renders in memory (render_cached, plan_render) rather
+    than with cookiecutter: a local or bundled template without hooks, unless
+    LUBAN_TEMPLATE_CACHE=off.
+    """
+    if (os.getenv("LUBAN_TEMPLATE_CACHE") or "on").strip().lower() == "off":
+        return False
+    if not (isinstance(template, BundledTemplate) or os.path.isdir(template)):
+        return False
+    return not has_hooks(template)
+
+
+def _text(data):
+    # Universal newlines, as jinja's FileSystemLoader reads templates.
+    return data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _newline(data):
+    """The first line ending of a file, "\n" if it has none."""
+    match = re.search(rb"\r\n|\r|\n", data)
+    return match.group().decode("ascii") if match else "\n"
+
+
+def _is_binary(rel_path, data):
+    return has_binary_extension(rel_path) or is_binary_string(data[:CHUNK_SIZE])
+
+
+def _copy_only(rel_path, patterns):
+    return any(fnmatch.fnmatch(rel_path, pattern) for pattern in patterns)
+
+
+def _compile(source, fingerprint):
+    defaults = json.loads(source.read("cookiecutter.json"))
+    names = source.names()
+    project_dirs = sorted(
+        {
+            rel.split("/", 1)[0]
+            for rel in names
+            if "/" in rel and "cookiecutter" in rel.split("/")[0]
+        }
+    )
+    if len(project_dirs) != 1:
+        raise ValueError(f"{source} must contain exactly one '{{{{cookiecutter.*}}}}' dir")
+
+    env = StrictEnvironment(
+        context={"cookiecutter": defaults},
+        keep_trailing_newline=True,
+        loader=FunctionLoader(lambda name: _text(source.read(name))),
+        **defaults.get("_jinja2_env_vars", {}),
+    )
+    copy_patterns = defaults.get("_copy_without_render", [])
+    compiled = CompiledTemplate(source, fingerprint, env, env.from_string(project_dirs[0]))
+
+    for rel_path in names:
+        if not rel_path.startswith(f"{project_dirs[0]}/"):
+            continue
+        data = source.read(rel_path)
+        verbatim = _copy_only(rel_path, copy_patterns) or _is_binary(rel_path, data)
+        compiled.files.append(
+            _TemplateFile(
+                rel_path=rel_path,
+                path_template=env.from_string(rel_path),
+                content_template=None if verbatim else env.get_template(rel_path),
+                newline="\n" if verbatim else _newline(data),
+                executable=source.executable(rel_path),
+            )
+        )
+    return compiled
+
+
+def get_compiled_template(template):
+    """
+    Return the compiled template, parsing it only when it changed.
+
+    template is a template directory or a BundledTemplate.
+    """
+    source = _source(template)
+    fingerprint = source.fingerprint()
+    with _CACHE_LOCK:
+        compiled = _COMPILED.get(source.key)
+        if compiled is None or compiled.fingerprint != fingerprint:
+            compiled = _compile(source, fingerprint)
+            _COMPILED[source.key] = compiled
+        return compiled
+
+
+def build_context(template, extra_context, output_dir):
+    """Resolve cookiecutter.json defaults against extra_context, as a no-input run does."""
+    source = _source(template)
+    defaults = json.loads(source.read("cookiecutter.json"), object_pairs_hook=OrderedDict)
+    if extra_context:
+        apply_overwrites_to_context(defaults, extra_context)
+    context = OrderedDict(cookiecutter=defaults)
+    context["_cookiecutter"] = {
+        k: v for k, v in context["cookiecutter"].items() if not k.startswith("_")
+    }
+    context["cookiecutter"].update(prompt_for_config(context, no_input=True))
+    context["cookiecutter"].update(
+        _template=str(source),
+        _output_dir=os.path.abspath(output_dir),
+        _repo_dir=str(source),
+        _checkout=None,
+    )
+    return context
+
+
+def render_files(compiled, context):
+    """Yield (relative output path, rendered bytes, template file) for every file."""
+    for item in compiled.files:
+        rel_path = item.path_template.render(**context)
+        if item.content_template is None:
+            yield rel_path, compiled.source.read(item.rel_path), item
+            continue
+        text = item.content_template.render(**context)
+        if item.newline != "\n":
+            text = text.replace("\n", item.newline)
+        yield rel_path, text.encode("utf-8"), item
+
+
+def git_blob_sha(content):
+    """The object id git assigns to a blob with this content (SHA-1 repositories)."""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+def _status(path, content, executable, tracked):
+    entry = tracked.get(os.path.abspath(path)) if tracked is not None else None
+    if entry and len(entry[1]) == 40:
+        mode, sha = entry
+        same = sha == git_blob_sha(content) and (mode == "100755") == executable
+        return "unchanged" if same else "modified"
+    if tracked is not None and entry is None:
+        return "added"
+    if not os.path.isfile(path):
+        return "added"
+    with open(path, "rb") as f:
+        same = f.read() == content
+    return "unchanged" if same and bool(os.stat(path).st_mode & 0o100) == executable else "modified"
+
+
+def plan_render(template, output_dir, extra_context, tracked=None):
+    """
+    Render a hook-less template in memory and compare it with output_dir.
+
+    Returns (project_dir, [PlannedFile]) without touching the disk. tracked
+    optionally maps absolute paths to the (mode, blob sha) of a git index or
+    tree (see utils.git_tracked_blobs and utils.git_tree_blobs); those files
+    are compared by hash instead of being read back, and files missing from
+    it are added.
+    """
+    compiled = get_compiled_template(template)
+    context = build_context(compiled.source, extra_context, output_dir)
+    project_dir = os.path.join(output_dir, compiled.project_dir.render(**context))
+    plan = []
+    for rel_path, content, item in render_files(compiled, context):
+        path = os.path.join(output_dir, rel_path)
+        status = _status(path, content, item.executable, tracked)
+        plan.append(PlannedFile(path, content, item.executable, status))
+    return project_dir, plan
+
+
+def plan_directory(rendered_dir, output_dir, tracked=None):
+    """
+    Compare a finished render in rendered_dir with output_dir.
+
+    For templates plan_render cannot handle: cookiecutter renders them into a
+    scratch directory first. Returns [PlannedFile] with paths under
+    output_dir; tracked works as for plan_render.
+    """
+    plan = []
+    for root, dirs, files in os.walk(rendered_dir):
+        dirs[:] = sorted(d for d in dirs if d != ".git")
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            with open(source, "rb") as f:
+                content = f.read()
+            executable = bool(os.stat(source).st_mode & 0o100)
+            path = os.path.join(output_dir, os.path.relpath(source, rendered_dir))
+            plan.append(
+                PlannedFile(path, content, executable, _status(path, content, executable, tracked))
+            )
+    return plan
+
+
+def render_project_dir(template, extra_context):
+    """The top-level directory name a render with extra_context creates."""
+    compiled = get_compiled_template(template)
+    context = build_context(compiled.source, extra_context, ".")
+    return compiled.project_dir.render(**context)
+
+
+def diff_stat(planned, old_content=None):
+    """
+    (lines added, lines removed) of a planned file against old_content.
+
+    old_content defaults to the file on disk.
+    """
+    old = []
+    if old_content is None and os.path.isfile(planned.path):
+        with open(planned.path, "rb") as f:
+            old_content = f.read()
+    if old_content is not None:
+        old = old_content.decode("utf-8", errors="replace").splitlines()
+    new = planned.content.decode("utf-8", errors="replace").splitlines()
+    added = removed = 0
+    for line in difflib.unified_diff(old, new, lineterm="", n=0):
+        if line.startswith("+") and not line.startswith("+++"):
+            added += 1
+        elif line.startswith("-") and not line.startswith("---"):
+            removed += 1
+    return added, removed
+
+
+def apply_plan(plan):
+    """Write the added and modified files of a plan. Returns the paths written."""
+    written = []
+    for planned in plan:
+        if planned.status == "unchanged":
+            continue
+        os.makedirs(os.path.dirname(planned.path), exist_ok=True)
+        with open(planned.path, "wb") as f:
+            f.write(planned.content)
+        mode = os.stat(planned.path).st_mode
+        os.chmod(planned.path, mode | 0o111 if planned.executable else mode & ~0o111)
+        written.append(planned.path)
+    return written
+
+
+def render_cached(template, output_dir, extra_context, overwrite=False):
+    """
+    Render a hook-less cookiecutter template with compiled templates.
+
+    Output paths and contents match a no-input cookiecutter run, but the
+    Jinja environment and templates are built once per process and template
+    fingerprint, the working directory is left alone, and only files whose
+    rendered bytes differ from what is on disk are written. Returns RenderStats.
+    """
+    project_dir, plan = plan_render(template, output_dir, extra_context)
+    if os.path.exists(project_dir) and not overwrite:
+        raise OutputDirExistsException(f'Error: "{project_dir}" directory already exists')
+
+    os.makedirs(project_dir, exist_ok=True)
+    written = apply_plan(plan)
+    return RenderStats(project_dir, written, len(plan) - len(written))
@@ -1,15 +1,24 @@
 import base64
+import fcntl
+import hashlib
 import json
 import os
 import random
+import shutil
 import subprocess
+import tempfile
+import threading
+import time
 import traceback
+from datetime import datetime, timezone
 from urllib.parse import urlsplit, urlunsplit
 
 import click
 from cookiecutter.main import cookiecutter
 from ruamel.yaml import YAML
 
+from luban_provisioner import templating
+
 
 def configure_git_https_auth(git_username, git_token, git_server):
     mode = (os.getenv("GIT_HTTPS_AUTH_MODE") or "credential_store").strip()
@@ -42,19 +51,28 @@ def configure_git_https_auth(git_username, git_token, git_server):
         f.write(f"https://{git_username}:{git_token}@{git_server}\n")
 
 
-def run_git(args, cwd=None, check=True, capture_output=False, text=True):
-    env = os.environ.copy()
-    env.setdefault("GIT_TERMINAL_PROMPT", "0")
+def run_git(args, cwd=None, check=True, capture_output=False, text=True, env=None, input=None):
+    # The process environment is inherited as is; a copy is only built when
+    # variables have to be added (env, or the GIT_TERMINAL_PROMPT default).
+    extra = dict(env or {})
+    if "GIT_TERMINAL_PROMPT" not in os.environ:
+        extra.setdefault("GIT_TERMINAL_PROMPT", "0")
 
     cmd = ["git"]
-    if env.get("LUBAN_GIT_HTTPS_AUTH_MODE") == "extraheader_basic" and env.get(
+    if os.environ.get("LUBAN_GIT_HTTPS_AUTH_MODE") == "extraheader_basic" and os.environ.get(
         "LUBAN_GIT_AUTH_HEADER"
     ):
         cmd.extend(["--config-env=http.extraHeader=LUBAN_GIT_AUTH_HEADER"])
 
     cmd.extend(args)
     return subprocess.run(
-        cmd, cwd=cwd, env=env, check=check, capture_output=capture_output, text=text
+        cmd,
+        cwd=cwd,
+        env={**os.environ, **extra} if extra else None,
+        input=input,
+        check=check,
+        capture_output=capture_output,
+        text=text,
     )
 
 
@@ -146,16 +164,33 @@ def load_config_from_dir(config_dir):
 def render_template(template_path, output_dir, context, overwrite=False):
     """
     Renders a cookiecutter template.
+
+    template_path is a directory, a templating.BundledTemplate or anything
+    else cookiecutter accepts. Local and bundled templates without hooks go
+    through the compiled-template cache in luban_provisioner.templating, which
+    only writes files whose content changed. Templates with hooks, or
+    LUBAN_TEMPLATE_CACHE=off, use cookiecutter.
     """
+    output_dir = os.path.abspath(output_dir)
     click.echo(f"Rendering template from {template_path} to {output_dir}...")
     try:
-        cookiecutter(
-            template_path,
-            no_input=True,
-            output_dir=output_dir,
-            extra_context=context,
-            overwrite_if_exists=overwrite,
-        )
+        if templating.use_cache(template_path):
+            stats = templating.render_cached(template_path, output_dir, context, overwrite)
+            click.echo(
+                f"Successfully generated template in {output_dir} "
+                f"({len(stats.written)} written, {stats.unchanged} unchanged)"
+            )
+            return
+        # cookiecutter changes the process working directory while rendering, so
+        # renders are serialized and other threads must only use absolute paths.
+        with templating.CWD_LOCK:
+            cookiecutter(
+                templating.template_directory(template_path),
+                no_input=True,
+                output_dir=output_dir,
+                extra_context=context,
+                overwrite_if_exists=overwrite,
+            )
         click.echo(f"Successfully generated template in {output_dir}")
     except Exception as e:
         click.echo(f"Error generating template: {e}", err=True)
@@ -163,79 +198,723 @@ def render_template(template_path, output_dir, context, overwrite=False):
         raise e
 
 
-def clone_git_repo(repo_url, target_dir, user_name="Luban CI", user_email="ci@luban.com"):
-    """Clone a git repository to a target directory."""
-    try:
-        click.echo(f"Cloning {_redact_url(repo_url)} into {target_dir}...")
-        run_git(["clone", repo_url, target_dir], check=True)
+CLONE_MODES = ("full", "shallow", "partial", "sparse")
 
-        # Configure local git user
-        cwd = os.getcwd()
-        os.chdir(target_dir)
+
+def _resolve_clone_mode(mode):
+    # LUBAN_GIT_CLONE_MODE overrides the per-command choice (e.g. "full" to debug).
+    override = (os.getenv("LUBAN_GIT_CLONE_MODE") or "").strip()
+    if override in CLONE_MODES:
+        return override
+    return mode if mode in CLONE_MODES else "full"
+
+
+def _mirror_dir(mirror_dir=None):
+    return (mirror_dir or os.getenv("LUBAN_GIT_MIRROR_DIR") or "").strip() or None
+
+
+def _mirror_path(mirror_dir, repo_url):
+    name = os.path.basename(urlsplit(repo_url).path.rstrip("/")).removesuffix(".git") or "repo"
+    digest = hashlib.sha256(_redact_url(repo_url).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(mirror_dir, f"{name}-{digest}.git")
+
+
+def update_mirror(repo_url, mirror_dir):
+    """
+    Create or refresh a bare mirror of repo_url under mirror_dir and return its path.
+
+    The first call runs "git clone --mirror"; later calls only "git fetch --prune".
+    A file lock next to the mirror serializes writers across processes sharing the volume.
+    """
+    os.makedirs(mirror_dir, exist_ok=True)
+    path = _mirror_path(mirror_dir, repo_url)
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
         try:
-            run_git(["config", "user.name", user_name], check=True)
-            run_git(["config", "user.email", user_email], check=True)
+            if os.path.isdir(path):
+                click.echo(f"Refreshing mirror {path}...")
+                run_git(["--git-dir", path, "remote", "set-url", "origin", repo_url], check=True)
+                run_git(["--git-dir", path, "fetch", "--prune", "origin"], check=True)
+            else:
+                click.echo(f"Creating mirror of {_redact_url(repo_url)} in {path}...")
+                tmp_path = f"{path}.tmp"
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                run_git(["clone", "--mirror", repo_url, tmp_path], check=True)
+                # Checkouts borrow objects from the mirror, so it must never prune them.
+                run_git(["--git-dir", tmp_path, "config", "gc.auto", "0"], check=True)
+                os.rename(tmp_path, path)
         finally:
-            os.chdir(cwd)
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return path
+
+
+def clone_git_repo(
+    repo_url,
+    target_dir,
+    user_name="Luban CI",
+    user_email="ci@luban.com",
+    branch=None,
+    mode="full",
+    sparse_paths=None,
+    mirror_dir=None,
+):
+    """
+    Clone a git repository to a target directory.
+
+    mode controls how much is fetched:
+      full     complete history and checkout (default)
+      shallow  --depth 1 --single-branch
+      partial  --filter=blob:none, blobs are fetched on demand
+      sparse   shallow + partial, checking out only sparse_paths (plus top-level files)
+
+    When mirror_dir (or LUBAN_GIT_MIRROR_DIR) is set, a bare mirror there is
+    refreshed first and the clone borrows its objects via --reference, so only
+    the ref negotiation goes over the network. History limits are then
+    unnecessary and only the sparse checkout is kept.
+    """
+    mode = _resolve_clone_mode(mode)
+    mirror_dir = _mirror_dir(mirror_dir)
+    reference = None
+    if mirror_dir:
+        try:
+            reference = update_mirror(repo_url, mirror_dir)
+        except (OSError, subprocess.CalledProcessError) as e:
+            click.echo(f"Warning: mirror unavailable ({e}), cloning directly.", err=True)
+
+    args = ["clone"]
+    if branch:
+        args.extend(["-b", branch])
+    if reference:
+        args.extend(["--reference-if-able", reference])
+    else:
+        if mode in ("shallow", "sparse"):
+            args.extend(["--depth", "1", "--single-branch"])
+        if mode in ("partial", "sparse"):
+            args.append("--filter=blob:none")
+    if mode == "sparse" and sparse_paths:
+        args.append("--sparse")
+    args.extend([repo_url, target_dir])
+
+    try:
+        via = f", via mirror {reference}" if reference else ""
+        click.echo(f"Cloning {_redact_url(repo_url)} into {target_dir} ({mode}{via})...")
+        run_git(args, check=True)
+        if mode == "sparse" and sparse_paths:
+            run_git(["sparse-checkout", "set", *sparse_paths], cwd=target_dir, check=True)
+
+        # Configure local git user
+        run_git(["config", "user.name", user_name], cwd=target_dir, check=True)
+        run_git(["config", "user.email", user_email], cwd=target_dir, check=True)
 
     except subprocess.CalledProcessError as e:
         click.echo(f"Git clone failed: {e}", err=True)
         raise e
 
 
+def refresh_git_repo(repo_url, target_dir, branch=None, sparse_paths=None):
+    """
+    Bring an existing checkout of repo_url in target_dir up to date with origin.
+
+    Local changes and untracked files are discarded. Returns False when
+    target_dir is not a usable checkout of repo_url, so the caller can fall
+    back to a fresh clone.
+    """
+    if not os.path.isdir(os.path.join(target_dir, ".git")):
+        return False
+
+    def git(*args):
+        return run_git(list(args), cwd=target_dir, capture_output=True, text=True, check=True)
+
+    try:
+        if git("remote", "get-url", "origin").stdout.strip() != repo_url:
+            return False
+        branch = branch or git("rev-parse", "--abbrev-ref", "HEAD").stdout.strip()
+        click.echo(f"Refreshing existing checkout {target_dir} ({branch})...")
+        mirror_dir = _mirror_dir()
+        if mirror_dir:
+            update_mirror(repo_url, mirror_dir)
+        git("fetch", "--prune", "origin", f"+refs/heads/{branch}:refs/remotes/origin/{branch}")
+        git("checkout", "--force", "-B", branch, f"origin/{branch}")
+        git("reset", "--hard", f"origin/{branch}")
+        git("clean", "-ffdx")
+        if (
+            sparse_paths
+            and git("config", "--bool", "--default", "false", "core.sparseCheckout").stdout.strip()
+            == "true"
+        ):
+            git("sparse-checkout", "set", *sparse_paths)
+    except (OSError, subprocess.CalledProcessError) as e:
+        click.echo(f"Could not refresh {target_dir} ({e}), re-cloning.", err=True)
+        return False
+    return True
+
+
+def git_tracked_blobs(repo_dir):
+    """Return {absolute path: (mode, blob sha)} for the files in the repo's index."""
+    listing = run_git(
+        ["ls-files", "--stage", "-z"], cwd=repo_dir, capture_output=True, text=True, check=True
+    ).stdout
+    tracked = {}
+    for line in filter(None, listing.split("\0")):
+        info, path = line.split("\t", 1)
+        mode, sha, _ = info.split()
+        tracked[os.path.join(os.path.abspath(repo_dir), path)] = (mode, sha)
+    return tracked
+
+
+def fetch_tree_only(repo_url):
+    """
+    Fetch the default branch tip of repo_url into a temporary bare repository.
+
+    The clone is depth 1 and blob-less, so only commit and tree objects are
+    transferred and nothing is checked out; blobs are fetched on demand by
+    read_git_blob. Returns the repository path (the caller removes it), or
+    None when ls-remote shows the repository has no commits yet.
+    """
+    heads = run_git(["ls-remote", repo_url, "HEAD"], capture_output=True, check=True).stdout
+    if not heads.strip():
+        return None
+    git_dir = tempfile.mkdtemp(suffix=".git")
+    try:
+        click.echo(f"Fetching {_redact_url(repo_url)} (tree only)...")
+        run_git(
+            ["clone", "--bare", "--depth", "1", "--filter=blob:none", "--single-branch"]
+            + [repo_url, git_dir],
+            check=True,
+        )
+    except subprocess.CalledProcessError:
+        shutil.rmtree(git_dir, ignore_errors=True)
+        raise
+    return git_dir
+
+
+def git_tree_blobs(git_dir, base_dir, ref="HEAD"):
+    """Return {absolute path under base_dir: (mode, blob sha)} for the files at ref."""
+    listing = run_git(
+        ["ls-tree", "-r", "-z", ref], cwd=git_dir, capture_output=True, check=True
+    ).stdout
+    tracked = {}
+    for line in filter(None, listing.split("\0")):
+        info, path = line.split("\t", 1)
+        mode, kind, sha = info.split()
+        if kind == "blob":
+            tracked[os.path.join(os.path.abspath(base_dir), path)] = (mode, sha)
+    return tracked
+
+
+def read_git_blob(git_dir, sha):
+    """Return a blob's bytes, fetching it first in a blob-less repository."""
+    return run_git(
+        ["cat-file", "blob", sha], cwd=git_dir, capture_output=True, text=False, check=True
+    ).stdout
+
+
+def _unshallow(repo_dir, branch):
+    """Fetch full history for a shallow clone. Returns False if it was not shallow."""
+    shallow = run_git(
+        ["rev-parse", "--is-shallow-repository"],
+        cwd=repo_dir,
+        capture_output=True,
+        text=True,
+        check=False,
+    ).stdout.strip()
+    if shallow != "true":
+        return False
+    click.echo("Shallow clone lacks history for rebase. Fetching full history...")
+    run_git(["fetch", "--unshallow", "origin", branch], cwd=repo_dir, check=True)
+    return True
+
+
+_SA_NAMESPACE_FILE = "/var/run/secrets/kubernetes.io/serviceaccount/namespace"
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def _format_micro_time(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class LeaseLock:
+    """
+    Cross-pod mutex backed by a coordination.k8s.io Lease, driven through kubectl.
+
+    The lease is taken when it is missing, released (no holder) or expired, and
+    every write carries the resourceVersion that was read, so two pods cannot
+    take it at once. While held it is renewed in the background.
+    """
+
+    def __init__(
+        self, name, namespace=None, holder=None, lease_seconds=60, poll_interval=1.0, timeout=600
+    ):
+        self.name = name
+        self.namespace = namespace or self._default_namespace()
+        self.holder = holder or f"{os.getenv('HOSTNAME') or 'luban'}-{os.getpid()}"
+        self.lease_seconds = int(lease_seconds)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._stop = threading.Event()
+        self._renewer = None
+        self._resource_version = None
+
+    @staticmethod
+    def _default_namespace():
+        namespace = (os.getenv("LUBAN_PUSH_LOCK_NAMESPACE") or "").strip()
+        if namespace:
+            return namespace
+        try:
+            with open(_SA_NAMESPACE_FILE, encoding="utf-8") as f:
+                return f.read().strip() or "luban-ci"
+        except OSError:
+            return "luban-ci"
+
+    def _kubectl(self, *args, manifest=None):
+        return subprocess.run(
+            ["kubectl", "-n", self.namespace, *args],
+            input=json.dumps(manifest) if manifest is not None else None,
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+
+    def _get(self):
+        result = self._kubectl("get", "lease", self.name, "-o", "json")
+        if result.returncode != 0:
+            if "NotFound" in result.stderr:
+                return None
+            raise RuntimeError(f"kubectl get lease failed: {result.stderr.strip()}")
+        return json.loads(result.stdout)
+
+    def _manifest(self, lease=None, holder=None):
+        now = _format_micro_time(_utcnow())
+        spec = {"holderIdentity": holder, "leaseDurationSeconds": self.lease_seconds}
+        if holder:
+            spec["renewTime"] = now
+            spec["acquireTime"] = now
+        metadata = {"name": self.name, "namespace": self.namespace}
+        if lease is not None:
+            metadata["resourceVersion"] = lease["metadata"]["resourceVersion"]
+            if holder and lease.get("spec", {}).get("holderIdentity") == holder:
+                spec["acquireTime"] = lease["spec"].get("acquireTime", now)
+        return {
+            "apiVersion": "coordination.k8s.io/v1",
+            "kind": "Lease",
+            "metadata": metadata,
+            "spec": spec,
+        }
+
+    @staticmethod
+    def _is_free(lease):
+        spec = lease.get("spec") or {}
+        if not spec.get("holderIdentity"):
+            return True
+        renewed = spec.get("renewTime") or spec.get("acquireTime")
+        if not renewed:
+            return True
+        expires = datetime.fromisoformat(renewed).timestamp() + int(
+            spec.get("leaseDurationSeconds") or 0
+        )
+        return expires < _utcnow().timestamp()
+
+    def _try_acquire(self):
+        lease = self._get()
+        if lease is None:
+            result = self._kubectl(
+                "create", "-o", "json", "-f", "-", manifest=self._manifest(None, self.holder)
+            )
+        elif self._is_free(lease):
+            result = self._kubectl(
+                "replace", "-o", "json", "-f", "-", manifest=self._manifest(lease, self.holder)
+            )
+        else:
+            return False
+        if result.returncode != 0:
+            # AlreadyExists / Conflict: another pod won the race.
+            if "AlreadyExists" in result.stderr or "Conflict" in result.stderr:
+                return False
+            raise RuntimeError(f"kubectl lease update failed: {result.stderr.strip()}")
+        self._resource_version = json.loads(result.stdout)["metadata"]["resourceVersion"]
+        return True
+
+    def _renew_loop(self):
+        while not self._stop.wait(max(self.lease_seconds / 3, 1)):
+            try:
+                lease = self._get()
+            except RuntimeError:
+                continue
+            if not lease or lease.get("spec", {}).get("holderIdentity") != self.holder:
+                click.echo(f"Warning: lost push lock {self.name}", err=True)
+                return
+            result = self._kubectl(
+                "replace", "-o", "json", "-f", "-", manifest=self._manifest(lease, self.holder)
+            )
+            if result.returncode == 0:
+                self._resource_version = json.loads(result.stdout)["metadata"]["resourceVersion"]
+
+    def acquire(self):
+        """Block until the lease is held and return the seconds spent waiting."""
+        started = time.monotonic()
+        while not self._try_acquire():
+            waited = time.monotonic() - started
+            if waited > self.timeout:
+                raise TimeoutError(f"Timed out after {waited:.0f}s waiting for lease {self.name}")
+            time.sleep(self.poll_interval * random.uniform(0.5, 1.5))
+        self._stop.clear()
+        self._renewer = threading.Thread(target=self._renew_loop, daemon=True)
+        self._renewer.start()
+        return time.monotonic() - started
+
+    def release(self):
+        self._stop.set()
+        if self._renewer:
+            self._renewer.join()
+            self._renewer = None
+        try:
+            lease = self._get()
+        except RuntimeError as e:
+            # The lease expires on its own if it cannot be released.
+            click.echo(f"Warning: could not release push lock {self.name}: {e}", err=True)
+            return
+        if lease and lease.get("spec", {}).get("holderIdentity") == self.holder:
+            self._kubectl("replace", "-f", "-", manifest=self._manifest(lease, None))
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _push_lock(repo_dir, branch):
+    """Return a LeaseLock for the repo/branch when LUBAN_PUSH_LOCK=lease, else None."""
+    mode = (os.getenv("LUBAN_PUSH_LOCK") or "none").strip()
+    if mode != "lease":
+        return None
+    if not shutil.which("kubectl"):
+        click.echo("Warning: LUBAN_PUSH_LOCK=lease but kubectl is not available.", err=True)
+        return None
+    remote = run_git(
+        ["remote", "get-url", "origin"], cwd=repo_dir, capture_output=True, text=True, check=False
+    ).stdout.strip()
+    digest = hashlib.sha256(f"{_redact_url(remote)}#{branch}".encode("utf-8")).hexdigest()[:16]
+    return LeaseLock(
+        f"luban-push-{digest}",
+        lease_seconds=int(os.getenv("LUBAN_PUSH_LOCK_LEASE_SECONDS") or 60),
+        timeout=float(os.getenv("LUBAN_PUSH_LOCK_TIMEOUT") or 600),
+    )
+
+
+def _record_push_metrics(metrics):
+    click.echo(
+        "Push metrics: "
+        f"lock={metrics['lock']} wait={metrics['lock_wait_seconds']:.2f}s "
+        f"attempts={metrics['attempts']} push={metrics['push_seconds']:.2f}s "
+        f"result={metrics['result']}"
+    )
+    path = (os.getenv("LUBAN_PUSH_METRICS_FILE") or "").strip()
+    if path:
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(metrics) + "\n")
+        except OSError as e:
+            click.echo(f"Warning: could not write push metrics to {path}: {e}", err=True)
+
+
+def _push_with_retry(repo_dir, branch, retries):
+    """Push the branch, rebasing onto origin between attempts. Returns the attempt count."""
+    for i in range(retries):
+        try:
+            click.echo(f"Pushing to {branch} (Attempt {i + 1}/{retries})...")
+            run_git(["push", "origin", branch], cwd=repo_dir, check=True)
+            click.echo("Push successful.")
+            return i + 1
+        except subprocess.CalledProcessError:
+            if i < retries - 1:
+                click.echo("Push failed. Pulling rebase and retrying...")
+                time.sleep(random.uniform(1, 3))  # Random jitter
+                try:
+                    run_git(["pull", "--rebase", "origin", branch], cwd=repo_dir, check=True)
+                except subprocess.CalledProcessError as e:
+                    run_git(["rebase", "--abort"], cwd=repo_dir, check=False)
+                    try:
+                        if not _unshallow(repo_dir, branch):
+                            raise e
+                        run_git(["pull", "--rebase", "origin", branch], cwd=repo_dir, check=True)
+                    except subprocess.CalledProcessError as e2:
+                        click.echo(f"Pull rebase failed: {e2}. Aborting retry.", err=True)
+                        raise e2
+            else:
+                click.echo("Max retries reached. Push failed.")
+                raise
+    return retries
+
+
+def _locked_push(repo_dir, branch, push):
+    """
+    Run push(locked) under the optional push lock and record push metrics.
+
+    push returns the number of attempts it needed; locked tells it whether
+    the lease is held.
+    """
+    metrics = {
+        "repo": _redact_url(
+            run_git(
+                ["remote", "get-url", "origin"],
+                cwd=repo_dir,
+                capture_output=True,
+                text=True,
+                check=False,
+            ).stdout.strip()
+        ),
+        "branch": branch,
+        "lock": "none",
+        "lock_wait_seconds": 0.0,
+        "attempts": 0,
+        "push_seconds": 0.0,
+        "result": "failed",
+    }
+    lock = _push_lock(repo_dir, branch)
+    if lock:
+        try:
+            click.echo(f"Waiting for push lock {lock.namespace}/{lock.name}...")
+            metrics["lock_wait_seconds"] = lock.acquire()
+            metrics["lock"] = "lease"
+        except (RuntimeError, TimeoutError, OSError) as e:
+            click.echo(f"Warning: push lock unavailable ({e}), pushing without it.", err=True)
+            lock = None
+
+    started = time.monotonic()
+    try:
+        metrics["attempts"] = push(bool(lock))
+        metrics["result"] = "ok"
+    finally:
+        metrics["push_seconds"] = time.monotonic() - started
+        if lock:
+            lock.release()
+        _record_push_metrics(metrics)
+
+
 def commit_and_push(repo_dir, message, branch="main", retries=5):
-    """Commit all changes in the repo and push to remote with retry logic."""
-    cwd = os.getcwd()
-    import time
+    """
+    Commit all changes in the repo and push to remote with retry logic.
 
+    With LUBAN_PUSH_LOCK=lease, pushes to the same repo and branch are
+    serialized through a Kubernetes Lease: the holder rebases onto origin and
+    pushes, so concurrent writers queue instead of racing. Queue wait and push
+    attempts are logged and, with LUBAN_PUSH_METRICS_FILE, appended as JSON lines.
+    """
     try:
-        os.chdir(repo_dir)
         click.echo(f"Committing changes in {repo_dir}...")
 
         # Add all files
-        run_git(["add", "."], check=True)
+        run_git(["add", "."], cwd=repo_dir, check=True)
 
         # Check if there are changes
-        status = run_git(["status", "--porcelain"], capture_output=True, text=True, check=False)
+        status = run_git(
+            ["status", "--porcelain"], cwd=repo_dir, capture_output=True, text=True, check=False
+        )
         if not status.stdout.strip():
             click.echo("No changes to commit.")
         else:
             # Commit
-            run_git(["commit", "-m", message], check=True)
+            run_git(["commit", "-m", message], cwd=repo_dir, check=True)
 
         # Ensure we are on the target branch
         current_branch = run_git(
-            ["rev-parse", "--abbrev-ref", "HEAD"], capture_output=True, text=True, check=True
+            ["rev-parse", "--abbrev-ref", "HEAD"],
+            cwd=repo_dir,
+            capture_output=True,
+            text=True,
+            check=True,
         ).stdout.strip()
         if current_branch != branch:
             click.echo(f"Renaming branch {current_branch} to {branch}...")
-            run_git(["branch", "-M", branch], check=True)
+            run_git(["branch", "-M", branch], cwd=repo_dir, check=True)
 
-        # Push with retry
-        for i in range(retries):
-            try:
-                click.echo(f"Pushing to {branch} (Attempt {i + 1}/{retries})...")
-                run_git(["push", "origin", branch], check=True)
-                click.echo("Push successful.")
-                break
-            except subprocess.CalledProcessError:
-                if i < retries - 1:
-                    click.echo("Push failed. Pulling rebase and retrying...")
-                    time.sleep(random.uniform(1, 3))  # Random jitter
-                    try:
-                        run_git(["pull", "--rebase", "origin", branch], check=True)
-                    except subprocess.CalledProcessError as e:
-                        click.echo(f"Pull rebase failed: {e}. Aborting retry.", err=True)
-                        raise e
-                else:
-                    click.echo("Max retries reached. Push failed.")
-                    raise
+        def push(locked):
+            if locked:
+                # Nobody else can push now, so catch up once and push.
+                if run_git(
+                    ["pull", "--rebase", "origin", branch], cwd=repo_dir, check=False
+                ).returncode:
+                    run_git(["rebase", "--abort"], cwd=repo_dir, check=False)
+            return _push_with_retry(repo_dir, branch, retries)
+
+        _locked_push(repo_dir, branch, push)
 
     except subprocess.CalledProcessError as e:
         click.echo(f"Git commit/push failed: {e}", err=True)
         raise e
+
+
+# How GitOps commands edit a few files: a sparse checkout, git objects only,
+# or the provider's file API (GitProvider.update_files).
+GITOPS_EDIT_MODES = ("clone", "tree", "api")
+
+
+def _read_tree_files(git_dir, ref, paths):
+    """
+    Return {path: (mode, text or None)} for paths at ref, fetching only those blobs.
+
+    The missing blobs are fetched from the promisor remote in one request and
+    read back with one cat-file --batch. Contents are bytes decoded as UTF-8
+    with surrogateescape, so CRLF line endings and non-UTF-8 bytes survive a
+    round trip through _commit_tree_edit().
+    """
+    listing = run_git(
+        ["ls-tree", "-z", ref, "--", *paths], cwd=git_dir, capture_output=True, check=True
+    ).stdout
+    entries = {}
+    for line in filter(None, listing.split("\0")):
+        info, path = line.split("\t", 1)
+        mode, kind, sha = info.split()
+        if kind == "blob":
+            entries[path] = (mode, sha)
+
+    files = {path: ("100644", None) for path in paths}
+    if not entries:
+        return files
+    shas = "".join(f"{sha}\n" for _, sha in entries.values())
+    # What git's own lazy fetch runs, once for all blobs instead of per object
+    run_git(
+        ["-c", "fetch.negotiationAlgorithm=noop", "fetch", "origin", "--no-tags"]
+        + ["--no-write-fetch-head", "--recurse-submodules=no", "--filter=blob:none", "--stdin"],
+        cwd=git_dir,
+        input=shas,
+        capture_output=True,
+        check=True,
+    )
+    batch = run_git(
+        ["cat-file", "--batch"],
+        cwd=git_dir,
+        input=shas.encode(),
+        capture_output=True,
+        text=False,
+        check=True,
+    ).stdout
+    pos = 0
+    for path, (mode, _) in entries.items():
+        end = batch.index(b"\n", pos)
+        size = int(batch[pos:end].split()[2])
+        content = batch[end + 1 : end + 1 + size]
+        files[path] = (mode, content.decode("utf-8", "surrogateescape"))
+        pos = end + 1 + size + 1
+    return files
+
+
+def _commit_tree_edit(git_dir, ref, modes, changes, message):
+    """Write changes {path: text} on top of ref with a throwaway index. Returns the commit sha."""
+    index = {"GIT_INDEX_FILE": os.path.join(git_dir, "luban-edit.index")}
+
+    def git(*args, input=None):
+        # Bytes in and out, so content is written exactly as given
+        result = run_git(
+            list(args), cwd=git_dir, env=index, input=input, capture_output=True, text=False
+        )
+        return result.stdout.decode().strip()
+
+    git("read-tree", ref)
+    # One hash-object for all new blobs, then one update-index for all entries
+    blobs = {}
+    for path, content in changes.items():
+        blob_file = os.path.join(git_dir, f"luban-edit-{len(blobs)}.blob")
+        with open(blob_file, "wb") as f:
+            f.write(content.encode("utf-8", "surrogateescape"))
+        blobs[path] = blob_file
+    shas = git(
+        "hash-object",
+        "-w",
+        "--stdin-paths",
+        "--no-filters",
+        input="".join(f"{blob_file}\n" for blob_file in blobs.values()).encode(),
+    ).split()
+    git(
+        "update-index",
+        "--add",
+        "-z",
+        "--index-info",
+        input=b"".join(f"{modes[path]} {sha}\t{path}\0".encode() for path, sha in zip(blobs, shas)),
+    )
+    # Blobs of untouched files were never fetched; they exist on the remote.
+    tree = git("write-tree", "--missing-ok")
+    return git("commit-tree", tree, "-p", ref, "-m", message)
+
+
+def edit_files_in_tree(repo_url, branch, paths, mutate, message, retries=5):
+    """
+    Edit a few files on a remote branch without a working tree.
+
+    The branch tip is fetched into a bare, depth 1, blob-less repository, so
+    only commit and tree objects travel plus the blobs of paths. mutate()
+    receives {path: text or None if missing} and returns {path: new text} for
+    the files to write (an empty dict means nothing to do). The new blobs are
+    committed with git plumbing and pushed as <commit>:refs/heads/<branch>;
+    if the push is rejected the tip is re-fetched and mutate() re-applied,
+    so it must only depend on its input. message may be a callable, called
+    after mutate(), when it depends on what was read.
+
+    Returns the pushed commit sha, or None when mutate() made no changes.
+    """
+    git_dir = tempfile.mkdtemp(suffix=".git")
+    try:
+        click.echo(f"Fetching {branch} of {_redact_url(repo_url)} (tree only)...")
+        run_git(
+            ["clone", "--bare", "--depth", "1", "--filter=blob:none", "--single-branch"]
+            + ["--branch", branch, repo_url, git_dir],
+            check=True,
+        )
+        ref = f"refs/heads/{branch}"
+
+        def prepare():
+            files = _read_tree_files(git_dir, ref, paths)
+            current = {path: text for path, (_, text) in files.items()}
+            changes = {
+                path: text
+                for path, text in mutate(dict(current)).items()
+                if text != current.get(path)
+            }
+            if not changes:
+                return None
+            modes = {path: files.get(path, ("100644", None))[0] for path in changes}
+            text = message() if callable(message) else message
+            return _commit_tree_edit(git_dir, ref, modes, changes, text)
+
+        commit = prepare()
+        if commit is None:
+            click.echo("No changes to commit.")
+            return None
+
+        def push(locked):
+            nonlocal commit
+            for i in range(retries):
+                click.echo(f"Pushing to {branch} (Attempt {i + 1}/{retries})...")
+                pushed = run_git(["push", "origin", f"{commit}:{ref}"], cwd=git_dir, check=False)
+                if pushed.returncode == 0:
+                    click.echo("Push successful.")
+                    return i + 1
+                if i == retries - 1:
+                    click.echo("Max retries reached. Push failed.")
+                    raise subprocess.CalledProcessError(1, ["git", "push", "origin", ref])
+                click.echo("Push failed. Fetching the new tip and re-applying the edit...")
+                time.sleep(random.uniform(1, 3))  # Random jitter
+                run_git(
+                    ["fetch", "--depth", "1", "origin", f"+{ref}:{ref}"], cwd=git_dir, check=True
+                )
+                commit = prepare()
+                if commit is None:
+                    click.echo("Remote already contains the change.")
+                    return i + 1
+            return retries
+
+        _locked_push(git_dir, branch, push)
+        return commit
+    except subprocess.CalledProcessError as e:
+        click.echo(f"Git tree edit failed: {e}", err=True)
+        raise e
     finally:
-        os.chdir(cwd)
+        shutil.rmtree(git_dir, ignore_errors=True)
 
 
 def initialize_git_repo(
@@ -244,39 +923,53 @@ def initialize_git_repo(
     user_name="Luban CI",
     user_email="luban-ci@metasync.io",
     initial_branch="main",
+    push=True,
 ):
-    """Initialize a git repository, commit all files, and push to remote."""
-    cwd = os.getcwd()
-    try:
-        os.chdir(repo_dir)
+    """Initialize a git repository, commit all files, and push to remote.
 
+    With push=False the remote is configured but nothing is pushed yet; use
+    push_branch() once the remote side is ready.
+    """
+    try:
         click.echo(f"Initializing git repo in {repo_dir}...")
 
         # Init
-        run_git(["init"], check=True)
-        run_git(["config", "user.name", user_name], check=True)
-        run_git(["config", "user.email", user_email], check=True)
-        run_git(["config", "--add", "safe.directory", "*"], check=True)
+        run_git(["init"], cwd=repo_dir, check=True)
+        run_git(["config", "user.name", user_name], cwd=repo_dir, check=True)
+        run_git(["config", "user.email", user_email], cwd=repo_dir, check=True)
+        run_git(["config", "--add", "safe.directory", "*"], cwd=repo_dir, check=True)
 
         # Branch
-        run_git(["branch", "-M", initial_branch], check=True)
+        run_git(["branch", "-M", initial_branch], cwd=repo_dir, check=True)
 
         # Add and Commit
-        run_git(["add", "."], check=True)
-        run_git(["commit", "-m", "Initial provisioning"], check=True)
+        run_git(["add", "."], cwd=repo_dir, check=True)
+        run_git(["commit", "-m", "Initial provisioning"], cwd=repo_dir, check=True)
 
         # Remote
-        run_git(["remote", "add", "origin", remote_url], check=True)
+        run_git(["remote", "add", "origin", remote_url], cwd=repo_dir, check=True)
 
         # Push
-        click.echo(f"Pushing to {initial_branch}...")
-        run_git(["push", "-u", "origin", initial_branch, "--force"], check=True)
+        if push:
+            click.echo(f"Pushing to {initial_branch}...")
+            run_git(["push", "-u", "origin", initial_branch, "--force"], cwd=repo_dir, check=True)
 
     except subprocess.CalledProcessError as e:
         click.echo(f"Git operation failed: {e}", err=True)
         raise e
-    finally:
-        os.chdir(cwd)
+
+
+def push_branch(repo_dir, branch_name, force=False):
+    """Push a local branch to origin and set it as upstream."""
+    args = ["push", "-u", "origin", branch_name]
+    if force:
+        args.append("--force")
+    try:
+        click.echo(f"Pushing to {branch_name}...")
+        run_git(args, cwd=repo_dir, check=True)
+    except subprocess.CalledProcessError as e:
+        click.echo(f"Git push failed: {e}", err=True)
+        raise e
 
 
 def patch_default_service_account(target_ns, image_pull_secret):
@@ -289,14 +982,10 @@ def patch_default_service_account(target_ns, image_pull_secret):
 
 def create_and_push_branch(repo_dir, branch_name):
     """Create a new branch and push it."""
-    cwd = os.getcwd()
     try:
-        os.chdir(repo_dir)
         click.echo(f"Creating and pushing branch {branch_name}...")
-        run_git(["checkout", "-b", branch_name], check=True)
-        run_git(["push", "-u", "origin", branch_name, "--force"], check=True)
+        run_git(["checkout", "-b", branch_name], cwd=repo_dir, check=True)
+        run_git(["push", "-u", "origin", branch_name, "--force"], cwd=repo_dir, check=True)
     except subprocess.CalledProcessError as e:
         click.echo(f"Git branch operation failed: {e}", err=True)
         raise e
-    finally:
-        os.chdir(cwd)
@@ -0,0 +1,178 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import click
+from click.testing import CliRunner
+
+from luban_provisioner.commands.batch import batch
+
+TEMPLATES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "templates"))
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "Test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "Test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+    "GIT_CONFIG_GLOBAL": os.devnull,
+    "LUBAN_TEMPLATE_BUNDLE": "off",
+    "LUBAN_TEMPLATE_CACHE": "on",
+}
+
+
+class TestBatch(unittest.TestCase):
+    def _write_manifest(self, data):
+        fd, path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_batch_provisions_every_app_with_one_setup(self):
+        manifest = self._write_manifest(
+            {
+                "defaults": {"gitops": {"domain_suffix": "example.com"}},
+                "apps": [
+                    {
+                        "project_name": "team-a",
+                        "application_name": "orders",
+                        "source": {"template_type": "python"},
+                        "gitops": {"container_port": 8080, "service_port": 80},
+                    },
+                    {
+                        "project_name": "team-b",
+                        "application_name": "billing",
+                        "gitops": {"container_port": 8080, "service_port": 80},
+                    },
+                ],
+            }
+        )
+
+        def gitops_impl(provider, project_name, application_name, *args, **kwargs):
+            if application_name == "billing":
+                raise click.ClickException("Failed to create repository")
+            return "created"
+
+        with (
+            patch("luban_provisioner.commands.batch.configure_git_https_auth") as auth,
+            patch("luban_provisioner.commands.batch.configure_git_identity") as identity,
+            patch("luban_provisioner.commands.batch.get_git_provider") as get_provider,
+            patch("luban_provisioner.commands.batch._source_impl", return_value="exists") as src,
+            patch(
+                "luban_provisioner.commands.batch._gitops_impl", side_effect=gitops_impl
+            ) as gitops,
+        ):
+            result = CliRunner().invoke(
+                batch,
+                [
+                    "--manifest",
+                    manifest,
+                    "--output-dir",
+                    "/tmp/out",
+                    "--git-token",
+                    "TOKEN",
+                    "--git-server",
+                    "github.com",
+                    "--max-workers",
+                    "2",
+                ],
+            )
+
+        self.assertEqual(result.exit_code, 1, result.output)
+        auth.assert_called_once()
+        identity.assert_called_once()
+        self.assertEqual(get_provider.call_count, 2)
+        sessions = {c.kwargs["session"] for c in get_provider.call_args_list}
+        self.assertEqual(len(sessions), 1)
+
+        src.assert_called_once()
+        self.assertFalse(src.call_args.kwargs["setup_git_auth"])
+        self.assertEqual(gitops.call_count, 2)
+        self.assertEqual(gitops.call_args_list[0].kwargs["domain_suffix"], "example.com")
+
+        self.assertRegex(result.output, r"team-a/orders\s+source\s+exists")
+        self.assertRegex(result.output, r"team-a/orders\s+gitops\s+created")
+        self.assertIn("failed: Failed to create repository", result.output)
+
+    @unittest.skipUnless(shutil.which("git"), "git is required")
+    def test_hooked_and_cached_templates_render_into_the_output_dir(self):
+        tmp = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmp)
+        remotes = os.path.join(tmp, "remotes")
+        apps = {
+            "orders-dbt": "dagster-dbt-starrocks-code-location",  # has hooks
+            "billing": "python",  # rendered from the compiled-template cache
+            "payments": "python",
+        }
+        for app in apps:
+            subprocess.run(
+                ["git", "init", "--bare", "-q", os.path.join(remotes, f"{app}.git")], check=True
+            )
+        manifest = self._write_manifest(
+            {
+                "apps": [
+                    {
+                        "project_name": "data",
+                        "application_name": app,
+                        "source": {"template_type": template_type},
+                    }
+                    for app, template_type in apps.items()
+                ]
+            }
+        )
+
+        provider = MagicMock()
+        provider.repo_exists.return_value = False
+        provider.create_repo.side_effect = lambda name, **kwargs: {"name": name}
+
+        # The output dir is relative to where the batch starts.
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(tmp)
+        with (
+            patch.dict(os.environ, GIT_ENV),
+            patch("luban_provisioner.templating.TEMPLATES_DIR", TEMPLATES_DIR),
+            patch("luban_provisioner.commands.batch.configure_git_https_auth"),
+            patch("luban_provisioner.commands.batch.configure_git_identity"),
+            patch("luban_provisioner.commands.batch.get_git_provider", return_value=provider),
+            patch(
+                "luban_provisioner.commands.source.get_remote_url",
+                side_effect=lambda *args, **kwargs: f"file://{remotes}/{args[5]}.git",
+            ),
+        ):
+            result = CliRunner().invoke(
+                batch,
+                ["--manifest", manifest, "--output-dir", "out", "--git-token", "TOKEN"]
+                + ["--git-server", "github.com", "--max-workers", "3"],
+            )
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(os.getcwd(), tmp)
+        for app in apps:
+            self.assertRegex(result.output, rf"data/{app}\s+source\s+created")
+            files = subprocess.run(
+                ["git", "ls-tree", "-r", "--name-only", "main"],
+                cwd=os.path.join(remotes, f"{app}.git"),
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.splitlines()
+            self.assertIn("pyproject.toml", files)
+        self.assertEqual(sorted(os.listdir(os.path.join(tmp, "out", "data"))), sorted(apps))
+
+    def test_manifest_without_apps_is_rejected(self):
+        manifest = self._write_manifest({"apps": []})
+        result = CliRunner().invoke(
+            batch,
+            ["--manifest", manifest, "--output-dir", "/tmp/out", "--git-token", "T"]
+            + ["--git-server", "github.com"],
+        )
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("does not list any apps", result.output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from cookiecutter.main import cookiecutter
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+BUILDPACK_DIR = os.path.join(REPO_ROOT, "buildpacks", "python-uv")
+DBT_TEMPLATE = os.path.join(
+    REPO_ROOT,
+    "tools",
+    "luban-provisioner",
+    "templates",
+    "source",
+    "luban-dagster-dbt-starrocks-code-location-source-template",
+)
+
+# Stands in for uv: sync creates an empty venv, dbt commands write their outputs
+# and the editable project install is left to the real uv and build backend.
+FAKE_UV = """#!/usr/bin/env bash
+set -e
+case "$1" in
+  pip) exec "$REAL_UV" "$@" ;;
+  sync) [[ -x .venv/bin/python ]] || "$FAKE_UV_PYTHON" -m venv --without-pip "$(readlink -f .venv)" ;;
+  run)
+    shift
+    if [[ "$1 $2" == "dbt deps" ]]; then mkdir -p "$4/dbt_packages"; exit 0; fi
+    if [[ "$1 $2" == "dbt parse" ]]; then mkdir -p "$4/target"; echo '{}' > "$4/target/manifest.json"; exit 0; fi
+    exec "$@" ;;
+esac
+"""
+
+
+REAL_UV = shutil.which("uv")
+
+
+@unittest.skipUnless(
+    shutil.which("bash") and REAL_UV and sys.version_info >= (3, 11), "bash and uv are required"
+)
+class TestPythonUvBuild(unittest.TestCase):
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.layers = os.path.join(self.tmp, "layers")
+        uv_bin = os.path.join(self.layers, "uv", "bin")
+        os.makedirs(uv_bin)
+        with open(os.path.join(self.layers, "uv", "version"), "w") as f:
+            f.write("0.0.0-test\n")
+        with open(os.path.join(uv_bin, "uv"), "w") as f:
+            f.write(FAKE_UV)
+        os.chmod(os.path.join(uv_bin, "uv"), 0o755)
+
+    def _build(self, app_dir):
+        with open(os.path.join(app_dir, ".uv-version"), "w") as f:
+            f.write("0.0.0-test\n")
+        env = {
+            **os.environ,
+            "CNB_LAYERS_DIR": self.layers,
+            "CNB_BUILDPACK_DIR": BUILDPACK_DIR,
+            "FAKE_UV_PYTHON": sys.executable,
+            "REAL_UV": REAL_UV,
+        }
+        return subprocess.run(
+            ["bash", os.path.join(BUILDPACK_DIR, "bin", "build")],
+            cwd=app_dir,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+
+    def _python(self, code):
+        python = os.path.join(self.layers, "venv", "bin", "python")
+        return subprocess.run(
+            [python, "-c", code], check=True, capture_output=True, text=True
+        ).stdout.strip()
+
+    def test_dbt_code_location_imports_from_the_app_directory(self):
+        cookiecutter(
+            DBT_TEMPLATE,
+            no_input=True,
+            output_dir=self.tmp,
+            extra_context={
+                "project_name": "data",
+                "app_name": "orders-dbt",
+                "package_name": "orders_dbt",
+                "default_env": "sandbox",
+            },
+        )
+        app_dir = os.path.join(self.tmp, "orders-dbt")
+
+        result = self._build(app_dir)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+
+        # definitions.py resolves REPO_ROOT as parents[2] of its own file. The
+        # package is only located, not imported, as dagster is not installed.
+        repo_root = self._python(
+            "import importlib.util, pathlib;"
+            "spec = importlib.util.find_spec('orders_dbt');"
+            "path = pathlib.Path(spec.origin).with_name('definitions.py');"
+            "print(path.resolve().parents[2] if path.is_file() else '')"
+        )
+        self.assertEqual(repo_root, app_dir)
+        self.assertTrue(
+            os.path.isfile(os.path.join(repo_root, "dbt_project", "target", "manifest.json"))
+        )
+        self.assertEqual(
+            self._python("import importlib.metadata as m; print(m.version('orders-dbt'))"),
+            "0.1.0",
+        )
+
+    def test_dynamic_version_and_scripts_come_from_the_build_backend(self):
+        app_dir = os.path.join(self.tmp, "demo")
+        os.makedirs(os.path.join(app_dir, "lib", "demo"))
+        with open(os.path.join(app_dir, "pyproject.toml"), "w") as f:
+            f.write(
+                '[project]\nname = "demo-app"\ndynamic = ["version"]\n'
+                'requires-python = ">=3.11"\n'
+                '[project.scripts]\ndemo = "demo.cli:main"\n'
+                '[project.entry-points."luban.plugins"]\ndemo = "demo.cli:main"\n'
+                '[build-system]\nrequires = ["hatchling"]\nbuild-backend = "hatchling.build"\n'
+                '[tool.hatch.version]\npath = "lib/demo/__init__.py"\n'
+                '[tool.hatch.build.targets.wheel]\npackages = ["lib/demo"]\n'
+                "[tool.luban]\nbp-compile-bytecode = true\n"
+            )
+        with open(os.path.join(app_dir, "lib", "demo", "__init__.py"), "w") as f:
+            f.write('__version__ = "1.2.3"\n')
+        with open(os.path.join(app_dir, "lib", "demo", "cli.py"), "w") as f:
+            f.write("import demo\n\ndef main():\n    print(demo.__file__)\n")
+
+        result = self._build(app_dir)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        # The source dir is found through the backend's .pth file
+        self.assertTrue(os.path.isdir(os.path.join(app_dir, "lib", "demo", "__pycache__")))
+
+        self.assertEqual(
+            self._python("import importlib.metadata as m; print(m.version('demo-app'))"),
+            "1.2.3",
+        )
+        self.assertEqual(
+            self._python(
+                "import importlib.metadata as m;"
+                "print(m.entry_points(group='luban.plugins')['demo'].value)"
+            ),
+            "demo.cli:main",
+        )
+        script = os.path.join(self.layers, "project", "bin", "demo")
+        output = subprocess.run([script], check=True, capture_output=True, text=True).stdout
+        self.assertEqual(output.strip(), os.path.join(app_dir, "lib", "demo", "__init__.py"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from luban_provisioner.commands.dagster import _register_in_workspace, _workspace_paths
+
+WORKSPACE, KUSTOMIZATION, BASE_WORKSPACE = _workspace_paths("snd")
+
+
+class TestRegisterInWorkspace(unittest.TestCase):
+    def test_first_location_copies_base_and_adds_generator(self):
+        files = {
+            WORKSPACE: None,
+            KUSTOMIZATION: "resources:\n- ../../base\n",
+            BASE_WORKSPACE: "load_from: []\n",
+        }
+        changes = _register_in_workspace(files, "snd", "orders", "orders.svc", 3000)
+
+        self.assertEqual(set(changes), {WORKSPACE, KUSTOMIZATION})
+        self.assertIn("name: dagster-workspace", changes[KUSTOMIZATION])
+        self.assertIn("location_name: orders", changes[WORKSPACE])
+
+    def test_existing_location_is_updated_in_place(self):
+        workspace = (
+            "load_from:\n"
+            "- grpc_server:\n"
+            "    host: old.svc\n"
+            "    port: 3000\n"
+            "    location_name: orders\n"
+        )
+        files = {WORKSPACE: workspace, KUSTOMIZATION: "resources: []\n", BASE_WORKSPACE: None}
+
+        changes = _register_in_workspace(files, "snd", "orders", "new.svc", 3000)
+        self.assertEqual(list(changes), [WORKSPACE])
+        self.assertIn("host: new.svc", changes[WORKSPACE])
+        self.assertEqual(changes[WORKSPACE].count("location_name"), 1)
+
+        files[WORKSPACE] = changes[WORKSPACE]
+        self.assertEqual(_register_in_workspace(files, "snd", "orders", "new.svc", 3000), {})
+
+    def test_missing_overlay_is_an_error(self):
+        with self.assertRaises(ValueError):
+            _register_in_workspace({}, "snd", "orders", "orders.svc", 3000)
+
+
+if __name__ == "__main__":
+    unittest.main()
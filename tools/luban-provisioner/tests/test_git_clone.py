@@ -0,0 +1,224 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from luban_provisioner.utils import (
+    clone_git_repo,
+    commit_and_push,
+    edit_files_in_tree,
+    refresh_git_repo,
+)
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "Test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "Test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+    "GIT_CONFIG_GLOBAL": os.devnull,
+    "LUBAN_GIT_CLONE_MODE": "",
+    "LUBAN_GIT_MIRROR_DIR": "",
+}
+
+
+def _git(*args, cwd=None):
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def _write(root, rel, content):
+    path = os.path.join(root, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+@unittest.skipUnless(shutil.which("git"), "git is required")
+class TestCloneModes(unittest.TestCase):
+    def setUp(self):
+        env = patch.dict(os.environ, GIT_ENV)
+        env.start()
+        self.addCleanup(env.stop)
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+        seed = os.path.join(self.tmp, "seed")
+        _git("init", "-b", "main", seed)
+        for i in range(3):
+            _write(seed, "README.md", f"rev {i}\n")
+            _write(seed, "overlays/ci-a/kustomization.yaml", f"a: {i}\n")
+            _write(seed, "overlays/ci-b/kustomization.yaml", f"b: {i}\n")
+            _git("add", ".", cwd=seed)
+            _git("commit", "-m", f"rev {i}", cwd=seed)
+
+        self.origin = os.path.join(self.tmp, "origin.git")
+        _git("clone", "--bare", seed, self.origin)
+        _git("config", "uploadpack.allowFilter", "true", cwd=self.origin)
+        self.url = f"file://{self.origin}"
+
+    def test_sparse_clone_checks_out_only_requested_paths(self):
+        target = os.path.join(self.tmp, "sparse")
+        clone_git_repo(self.url, target, mode="sparse", sparse_paths=["overlays/ci-a"])
+
+        self.assertTrue(os.path.exists(os.path.join(target, "README.md")))
+        self.assertTrue(os.path.exists(os.path.join(target, "overlays/ci-a/kustomization.yaml")))
+        self.assertFalse(os.path.exists(os.path.join(target, "overlays/ci-b")))
+        self.assertEqual(_git("rev-list", "--count", "HEAD", cwd=target), "1")
+
+    def test_env_override_forces_full_clone(self):
+        target = os.path.join(self.tmp, "full")
+        with patch.dict(os.environ, {"LUBAN_GIT_CLONE_MODE": "full"}):
+            clone_git_repo(self.url, target, mode="shallow")
+        self.assertEqual(_git("rev-list", "--count", "HEAD", cwd=target), "3")
+
+    def test_shallow_clone_rebases_over_concurrent_push(self):
+        target = os.path.join(self.tmp, "shallow")
+        clone_git_repo(self.url, target, mode="sparse", sparse_paths=["overlays/ci-a"])
+
+        other = os.path.join(self.tmp, "other")
+        _git("clone", self.url, other)
+        _write(other, "overlays/ci-b/kustomization.yaml", "b: concurrent\n")
+        _git("commit", "-am", "concurrent update", cwd=other)
+        _git("push", "origin", "main", cwd=other)
+
+        _write(target, "overlays/ci-a/kustomization.yaml", "a: new\n")
+        with patch("luban_provisioner.utils.time.sleep"):
+            commit_and_push(target, "Update ci-a", branch="main")
+
+        log = _git("log", "--format=%s", "main", cwd=self.origin).splitlines()
+        self.assertEqual(log[:2], ["Update ci-a", "concurrent update"])
+
+    def test_mirror_is_reused_for_later_clones(self):
+        mirrors = os.path.join(self.tmp, "mirrors")
+        first = os.path.join(self.tmp, "first")
+        clone_git_repo(
+            self.url, first, mode="sparse", sparse_paths=["overlays/ci-a"], mirror_dir=mirrors
+        )
+
+        (mirror,) = [d for d in os.listdir(mirrors) if d.endswith(".git")]
+        self.assertTrue(mirror.startswith("origin-"))
+        alternates = os.path.join(first, ".git/objects/info/alternates")
+        with open(alternates, encoding="utf-8") as f:
+            self.assertIn(os.path.join(mirrors, mirror), f.read())
+        self.assertFalse(os.path.exists(os.path.join(first, "overlays/ci-b")))
+
+        other = os.path.join(self.tmp, "other")
+        _git("clone", self.url, other)
+        _write(other, "README.md", "rev 3\n")
+        _git("commit", "-am", "rev 3", cwd=other)
+        _git("push", "origin", "main", cwd=other)
+
+        second = os.path.join(self.tmp, "second")
+        clone_git_repo(self.url, second, mirror_dir=mirrors)
+        mirror_head = _git("--git-dir", os.path.join(mirrors, mirror), "rev-parse", "main")
+        self.assertEqual(_git("rev-parse", "HEAD", cwd=second), mirror_head)
+        self.assertEqual(_git("rev-list", "--count", "HEAD", cwd=second), "4")
+
+    def test_refresh_resets_existing_checkout_to_origin(self):
+        target = os.path.join(self.tmp, "checkout")
+        clone_git_repo(self.url, target, mode="shallow")
+        _write(target, "README.md", "local edit\n")
+        _write(target, "stale.txt", "leftover\n")
+
+        other = os.path.join(self.tmp, "other")
+        _git("clone", self.url, other)
+        _write(other, "overlays/ci-b/kustomization.yaml", "b: remote\n")
+        _git("commit", "-am", "remote update", cwd=other)
+        _git("push", "origin", "main", cwd=other)
+
+        self.assertTrue(refresh_git_repo(self.url, target))
+        self.assertEqual(_git("log", "-1", "--format=%s", cwd=target), "remote update")
+        self.assertEqual(_git("status", "--porcelain", cwd=target), "")
+        self.assertFalse(os.path.exists(os.path.join(target, "stale.txt")))
+
+    def test_refresh_rejects_checkout_of_another_remote(self):
+        target = os.path.join(self.tmp, "checkout")
+        clone_git_repo(self.url, target, mode="shallow")
+        self.assertFalse(refresh_git_repo("file:///elsewhere.git", target))
+        self.assertFalse(refresh_git_repo(self.url, os.path.join(self.tmp, "missing")))
+
+    def test_tree_edit_reapplies_over_concurrent_push(self):
+        other = os.path.join(self.tmp, "other")
+        _git("clone", self.url, other)
+        seen = []
+
+        def mutate(files):
+            seen.append(files)
+            if len(seen) == 1:
+                # Someone else pushes between our fetch and our push.
+                _write(other, "overlays/ci-b/kustomization.yaml", "b: concurrent\n")
+                _git("commit", "-am", "concurrent update", cwd=other)
+                _git("push", "origin", "main", cwd=other)
+            return {
+                "overlays/ci-a/kustomization.yaml": files["overlays/ci-a/kustomization.yaml"]
+                + "x: 1\n"
+            }
+
+        with patch("luban_provisioner.utils.time.sleep"):
+            commit = edit_files_in_tree(
+                self.url,
+                "main",
+                ["overlays/ci-a/kustomization.yaml", "missing.yaml"],
+                mutate,
+                "Edit a",
+            )
+
+        self.assertEqual(len(seen), 2)
+        self.assertEqual(seen[0]["overlays/ci-a/kustomization.yaml"], "a: 2\n")
+        self.assertIsNone(seen[0]["missing.yaml"])
+        self.assertEqual(_git("rev-parse", "main", cwd=self.origin), commit)
+        self.assertEqual(
+            _git("show", "main:overlays/ci-a/kustomization.yaml", cwd=self.origin), "a: 2\nx: 1"
+        )
+        self.assertEqual(
+            _git("show", "main:overlays/ci-b/kustomization.yaml", cwd=self.origin), "b: concurrent"
+        )
+        self.assertEqual(_git("show", "main:README.md", cwd=self.origin), "rev 2")
+        self.assertEqual(_git("log", "-1", "--format=%s", "main", cwd=self.origin), "Edit a")
+
+    def test_tree_edit_keeps_crlf_and_non_utf8_bytes(self):
+        other = os.path.join(self.tmp, "other")
+        _git("clone", self.url, other)
+        with open(os.path.join(other, "windows.ini"), "wb") as f:
+            f.write(b"a=1\r\nb=2\r\n")
+        with open(os.path.join(other, "legacy.txt"), "wb") as f:
+            f.write(b"caf\xe9\n")
+        _git("add", ".", cwd=other)
+        _git("commit", "-m", "binary-ish files", cwd=other)
+        _git("push", "origin", "main", cwd=other)
+        seen = []
+
+        def mutate(files):
+            seen.append(files)
+            return {
+                "windows.ini": files["windows.ini"] + "c=3\r\n",
+                "legacy.txt": files["legacy.txt"] + "x\n",
+            }
+
+        commit = edit_files_in_tree(self.url, "main", ["windows.ini", "legacy.txt"], mutate, "Edit")
+
+        self.assertEqual(seen[0]["windows.ini"], "a=1\r\nb=2\r\n")
+
+        def blob(path):
+            return subprocess.run(
+                ["git", "cat-file", "blob", f"{commit}:{path}"],
+                cwd=self.origin,
+                check=True,
+                capture_output=True,
+            ).stdout
+
+        self.assertEqual(blob("windows.ini"), b"a=1\r\nb=2\r\nc=3\r\n")
+        self.assertEqual(blob("legacy.txt"), b"caf\xe9\nx\n")
+
+    def test_tree_edit_without_changes_does_not_push(self):
+        before = _git("rev-parse", "main", cwd=self.origin)
+        commit = edit_files_in_tree(self.url, "main", ["README.md"], lambda files: files, "Noop")
+        self.assertIsNone(commit)
+        self.assertEqual(_git("rev-parse", "main", cwd=self.origin), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from click.testing import CliRunner
+
+from luban_provisioner.commands.infra import infra
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "Test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "Test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+    "GIT_CONFIG_GLOBAL": os.devnull,
+    "LUBAN_GIT_CLONE_MODE": "",
+    "LUBAN_GIT_MIRROR_DIR": "",
+}
+
+
+def _git(*args, cwd=None):
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+@unittest.skipUnless(shutil.which("git"), "git is required")
+class TestInfraUpdateBatch(unittest.TestCase):
+    def setUp(self):
+        env = patch.dict(os.environ, GIT_ENV)
+        env.start()
+        self.addCleanup(env.stop)
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+        seed = os.path.join(self.tmp, "seed")
+        _git("init", "-b", "main", seed)
+        os.makedirs(os.path.join(seed, "overlays"))
+        with open(os.path.join(seed, "overlays", ".gitkeep"), "w"):
+            pass
+        _git("add", ".", cwd=seed)
+        _git("commit", "-m", "base", cwd=seed)
+        self.origin = os.path.join(self.tmp, "origin.git")
+        _git("clone", "--bare", seed, self.origin)
+        _git("config", "uploadpack.allowFilter", "true", cwd=self.origin)
+
+        # The update commands fall back to the in-tree templates from the repo root.
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(REPO_ROOT)
+
+        for target in ("configure_git_https_auth", "configure_git_identity"):
+            patcher = patch(f"luban_provisioner.commands.infra.{target}")
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch(
+            "luban_provisioner.commands.infra.get_remote_url",
+            return_value=f"file://{self.origin}",
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _contexts_file(self, content):
+        path = os.path.join(self.tmp, "contexts.yaml")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def test_ci_update_batch_pushes_all_overlays_in_one_commit(self):
+        contexts = self._contexts_file(
+            "defaults:\n"
+            "  admin_group: admins\n"
+            "projects:\n"
+            "  - project_name: team-a\n"
+            "    developer_group: a-devs\n"
+            "  - project_name: team-b\n"
+            "    developer_group: b-devs\n"
+        )
+        result = CliRunner().invoke(
+            infra,
+            ["ci", "update-batch", "--repo-name", "luban-ci-infra"]
+            + ["--contexts-file", contexts, "--work-dir", os.path.join(self.tmp, "work")],
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        log = _git("log", "--format=%s", "main", cwd=self.origin).splitlines()
+        self.assertEqual(log, ["Add overlays for 2 projects", "base"])
+        files = _git("ls-tree", "-r", "--name-only", "main", cwd=self.origin).splitlines()
+        self.assertIn("overlays/ci-team-a/namespace.yaml", files)
+        self.assertIn("overlays/ci-team-b/namespace.yaml", files)
+
+    def test_ci_update_batch_checks_out_the_rendered_namespace(self):
+        contexts = self._contexts_file(
+            "- project_name: team-a\n"
+            "  namespace: shared-tools\n"
+            "  admin_group: admins\n"
+            "  developer_group: a-devs\n"
+        )
+        result = CliRunner().invoke(
+            infra,
+            ["ci", "update-batch", "--repo-name", "luban-ci-infra"]
+            + ["--contexts-file", contexts, "--work-dir", os.path.join(self.tmp, "work")],
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        files = _git("ls-tree", "-r", "--name-only", "main", cwd=self.origin).splitlines()
+        self.assertIn("overlays/shared-tools/namespace.yaml", files)
+        self.assertFalse(any(f.startswith("overlays/ci-team-a/") for f in files))
+
+    def test_ci_update_batch_rejects_overlay_outside_overlays(self):
+        contexts = self._contexts_file(
+            "- project_name: team-a\n"
+            "  namespace: ../base\n"
+            "  admin_group: admins\n"
+            "  developer_group: a-devs\n"
+        )
+        result = CliRunner().invoke(
+            infra,
+            ["ci", "update-batch", "--repo-name", "luban-ci-infra"]
+            + ["--contexts-file", contexts, "--work-dir", os.path.join(self.tmp, "work")],
+        )
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("is not a plain directory name", result.output)
+        self.assertEqual(_git("log", "-1", "--format=%s", "main", cwd=self.origin), "base")
+
+    def test_ci_init_rerender_commits_only_drifted_files(self):
+        provider = patch("luban_provisioner.commands.infra.get_git_provider")
+        provider.start().return_value.repo_exists.return_value = True
+        self.addCleanup(provider.stop)
+        args = ["ci", "init", "--repo-name", "luban-ci-infra"]
+        args += ["--output-dir", os.path.join(self.tmp, "work")]
+
+        result = CliRunner().invoke(infra, args)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("0 modified, 0 unchanged", result.output)
+
+        # Someone edits one rendered file by hand.
+        other = os.path.join(self.tmp, "other")
+        _git("clone", self.origin, other)
+        with open(os.path.join(other, "base", "kustomization.yaml"), "a", encoding="utf-8") as f:
+            f.write("# drift\n")
+        _git("commit", "-am", "drift", cwd=other)
+        _git("push", "origin", "main", cwd=other)
+
+        # The dry run reads the remote tip's trees only; nothing is checked out.
+        dry_dir = os.path.join(self.tmp, "dry")
+        dry_args = ["ci", "init", "--repo-name", "luban-ci-infra", "--output-dir", dry_dir]
+        result = CliRunner().invoke(infra, dry_args + ["--dry-run"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("0 added, 1 modified", result.output)
+        self.assertIn("M base/kustomization.yaml (+0 -1)", result.output)
+        self.assertFalse(os.path.exists(dry_dir))
+        self.assertEqual(_git("log", "-1", "--format=%s", "main", cwd=self.origin), "drift")
+
+        result = CliRunner().invoke(infra, args)
+        self.assertEqual(result.exit_code, 0, result.output)
+        changed = _git("show", "--name-only", "--format=", "main", cwd=self.origin)
+        self.assertEqual(changed, "base/kustomization.yaml")
+
+        result = CliRunner().invoke(infra, args)
+        self.assertIn("already matches the CI base", result.output)
+
+    def test_ci_init_runs_hooks_and_honours_the_cache_switch(self):
+        provider = patch("luban_provisioner.commands.infra.get_git_provider")
+        provider.start().return_value.repo_exists.return_value = True
+        self.addCleanup(provider.stop)
+        template = os.path.join(self.tmp, "infra-ci-base")
+        shutil.copytree(
+            os.path.join(REPO_ROOT, "tools", "luban-provisioner", "templates", "infra-ci-base"),
+            template,
+        )
+        os.makedirs(os.path.join(template, "hooks"))
+        with open(os.path.join(template, "hooks", "post_gen_project.py"), "w") as f:
+            f.write("open('hooked.txt', 'w').write('from hook\\n')\n")
+        resolve = patch("luban_provisioner.templating.resolve_template", return_value=template)
+        resolve.start()
+        self.addCleanup(resolve.stop)
+        args = ["ci", "init", "--repo-name", "luban-ci-infra"]
+        args += ["--output-dir", os.path.join(self.tmp, "work")]
+
+        result = CliRunner().invoke(infra, args + ["--dry-run"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("A hooked.txt (+1 -0)", result.output)
+
+        result = CliRunner().invoke(infra, args)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(_git("show", "main:hooked.txt", cwd=self.origin), "from hook")
+
+        # Without hooks, LUBAN_TEMPLATE_CACHE=off still renders with cookiecutter.
+        shutil.rmtree(os.path.join(template, "hooks"))
+        with (
+            patch.dict(os.environ, {"LUBAN_TEMPLATE_CACHE": "off"}),
+            patch("luban_provisioner.templating.plan_render") as plan_render,
+        ):
+            result = CliRunner().invoke(infra, args)
+        self.assertEqual(result.exit_code, 0, result.output)
+        plan_render.assert_not_called()
+        self.assertIn("already matches the CI base", result.output)
+
+    def test_cd_update_batch_requires_env(self):
+        contexts = self._contexts_file("- project_name: team-a\n")
+        result = CliRunner().invoke(
+            infra,
+            ["cd", "update-batch", "--repo-name", "luban-cd-infra"]
+            + ["--contexts-file", contexts, "--work-dir", os.path.join(self.tmp, "work")],
+        )
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("is missing env", result.output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from click.testing import CliRunner
+
+from luban_provisioner.commands.promote import promote
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "Test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "Test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+    "GIT_CONFIG_GLOBAL": os.devnull,
+    "LUBAN_GIT_CLONE_MODE": "",
+    "LUBAN_GIT_MIRROR_DIR": "",
+    "LUBAN_PUSH_LOCK": "",
+}
+
+SND = "images:\n- name: registry.example.com/team/{app}\n  newTag: v2\n"
+PRD = "images:\n- name: registry.example.com/team/{app}\n  newTag: v1\n"
+
+
+def _git(*args, cwd=None):
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+@unittest.skipUnless(shutil.which("git"), "git is required")
+class TestPromote(unittest.TestCase):
+    def setUp(self):
+        env = patch.dict(os.environ, GIT_ENV)
+        env.start()
+        self.addCleanup(env.stop)
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+        for app, overlays in (("orders", True), ("billing", True), ("broken", False)):
+            self._make_origin(app, overlays)
+
+        self.provider = MagicMock()
+        self.provider.list_repos.return_value = [
+            {"name": "orders-gitops"},
+            {"name": "billing-gitops"},
+            {"name": "orders"},
+        ]
+        self.provider.create_pull_request.side_effect = lambda repo_identifier, **kw: {
+            "html_url": f"https://example.com/{repo_identifier}/pull/1"
+        }
+        patches = [
+            patch(
+                "luban_provisioner.commands.promote.get_git_provider", return_value=self.provider
+            ),
+            patch(
+                "luban_provisioner.commands.promote.get_remote_url",
+                side_effect=lambda *args, **kw: f"file://{self.tmp}/{args[5]}.git",
+            ),
+            patch("luban_provisioner.commands.promote.configure_git_https_auth"),
+            patch("luban_provisioner.commands.promote.configure_git_identity"),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _make_origin(self, app, overlays):
+        seed = os.path.join(self.tmp, f"{app}-seed")
+        _git("init", "-b", "develop", seed)
+        files = {"README.md": app}
+        if overlays:
+            files["app/overlays/snd/kustomization.yaml"] = SND.format(app=app)
+            files["app/overlays/prd/kustomization.yaml"] = PRD.format(app=app)
+        for rel, content in files.items():
+            path = os.path.join(seed, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(content)
+        _git("add", ".", cwd=seed)
+        _git("commit", "-m", "init", cwd=seed)
+        origin = os.path.join(self.tmp, f"{app}-gitops.git")
+        _git("clone", "--bare", seed, origin)
+        _git("config", "uploadpack.allowFilter", "true", cwd=origin)
+
+    def _invoke(self, *args):
+        return CliRunner().invoke(
+            promote,
+            ["--git-organization", "acme", "--git-provider", "github", "--git-token", "T"]
+            + ["--git-server", "github.com", "--project-name", "team", *args],
+        )
+
+    def test_selector_promotes_matching_apps_in_parallel(self):
+        report = os.path.join(self.tmp, "report.json")
+        result = self._invoke("--app-selector", "*", "--max-workers", "2", "--report-file", report)
+        self.assertEqual(result.exit_code, 0, result.output)
+
+        for app in ("orders", "billing"):
+            origin = os.path.join(self.tmp, f"{app}-gitops.git")
+            prd = _git("show", "develop:app/overlays/prd/kustomization.yaml", cwd=origin)
+            self.assertIn("newTag: v2", prd)
+
+        with open(report, encoding="utf-8") as f:
+            results = {r["app"]: r for r in json.load(f)}
+        self.assertEqual(set(results), {"billing", "orders"})
+        self.assertEqual(results["orders"]["status"], "promoted")
+        self.assertEqual(results["orders"]["pr"], "https://example.com/orders-gitops/pull/1")
+
+    def test_failed_app_is_reported_without_stopping_others(self):
+        result = self._invoke("--app-name", "orders", "--app-name", "broken")
+        self.assertEqual(result.exit_code, 1)
+        self.assertRegex(result.output, r"orders\s+promoted\s+v2")
+        self.assertIn("[broken] app/overlays/snd/kustomization.yaml not found.", result.output)
+
+    def test_tree_edit_mode_pushes_without_checkout(self):
+        with patch("luban_provisioner.commands.promote.clone_git_repo") as clone:
+            result = self._invoke("--app-name", "orders", "--edit-mode", "tree")
+        self.assertEqual(result.exit_code, 0, result.output)
+        clone.assert_not_called()
+
+        origin = os.path.join(self.tmp, "orders-gitops.git")
+        prd = _git("show", "develop:app/overlays/prd/kustomization.yaml", cwd=origin)
+        self.assertIn("newTag: v2", prd)
+        self.assertEqual(
+            _git("log", "-1", "--format=%s", "develop", cwd=origin),
+            "Promote orders to prd (tag: v2)",
+        )
+
+        # A second run finds nothing to change.
+        result = self._invoke("--app-name", "orders", "--edit-mode", "tree")
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("already up to date", result.output)
+
+    def test_api_edit_mode_uses_provider_file_api(self):
+        repo = {
+            "app/overlays/snd/kustomization.yaml": SND.format(app="orders"),
+            "app/overlays/prd/kustomization.yaml": PRD.format(app="orders"),
+        }
+
+        def update_files(repo_name, branch, paths, mutate, message):
+            self.assertEqual((repo_name, branch), ("orders-gitops", "develop"))
+            repo.update(mutate({path: repo.get(path) for path in paths}))
+            self.assertEqual(message(), "Promote orders to prd (tag: v2)")
+            return "commit-sha"
+
+        self.provider.update_files.side_effect = update_files
+        with patch("luban_provisioner.commands.promote.configure_git_https_auth") as auth:
+            result = self._invoke("--app-name", "orders", "--edit-mode", "api")
+        self.assertEqual(result.exit_code, 0, result.output)
+        auth.assert_not_called()
+        self.assertIn("newTag: v2", repo["app/overlays/prd/kustomization.yaml"])
+
+    def test_no_apps_is_an_error(self):
+        result = self._invoke()
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("No applications to promote", result.output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,724 @@
+import base64
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from luban_provisioner.provider_factory import get_git_provider
+from luban_provisioner.providers import http
+from luban_provisioner.providers.aio import AsyncGitProvider, run_concurrently
+from luban_provisioner.providers.azure import AzureProvider
+from luban_provisioner.providers.github import GitHubProvider
+from luban_provisioner.providers.github_graphql import GitHubGraphQLProvider
+from luban_provisioner.providers.http import RateLimiter, build_session
+from luban_provisioner.providers.wait import backoff_delays, wait_until
+
+
+def setUpModule():
+    # Keep the shared per-host rate limiters from pacing these tests.
+    env = patch.dict(os.environ, {"LUBAN_HTTP_RATE": "1000", "LUBAN_HTTP_BURST": "1000"})
+    env.start()
+    limiters = patch.dict(http._LIMITERS, clear=True)
+    limiters.start()
+    unittest.addModuleCleanup(limiters.stop)
+    unittest.addModuleCleanup(env.stop)
+
+
+def _response(status_code, payload=None, headers=None):
+    resp = MagicMock()
+    resp.status_code = status_code
+    resp.json.return_value = payload if payload is not None else {}
+    resp.text = ""
+    resp.headers = headers or {}
+    resp.links = {}
+    return resp
+
+
+class TestSession(unittest.TestCase):
+    def test_build_session_reads_pool_sizes_from_env(self):
+        with patch.dict(
+            os.environ, {"LUBAN_HTTP_POOL_CONNECTIONS": "2", "LUBAN_HTTP_POOL_MAXSIZE": "32"}
+        ):
+            session = build_session()
+        adapter = session.get_adapter("https://api.github.com")
+        self.assertEqual(adapter._pool_connections, 2)
+        self.assertEqual(adapter._pool_maxsize, 32)
+
+    def test_providers_share_one_session(self):
+        session = MagicMock()
+        session.request.return_value = _response(200, {"id": "proj-id"})
+
+        github = GitHubProvider("TOKEN", "acme", session=session)
+        azure = AzureProvider("TOKEN", "org", "proj", session=session)
+
+        self.assertTrue(github.repo_exists("repo"))
+        self.assertTrue(azure.repo_exists("repo"))
+
+        self.assertEqual(session.request.call_count, 2)
+        github_call, azure_call = session.request.call_args_list
+        self.assertEqual(github_call.args[0], "GET")
+        self.assertEqual(github_call.kwargs["headers"]["Authorization"], "token TOKEN")
+        self.assertEqual(azure_call.kwargs["auth"], ("", "TOKEN"))
+
+
+class TestAzureLookupCache(unittest.TestCase):
+    def _provider(self, responses):
+        session = MagicMock()
+
+        def request(method, url, **kwargs):
+            for fragment, resp in responses:
+                if fragment in url:
+                    return resp
+            raise AssertionError(f"Unexpected request {method} {url}")
+
+        session.request.side_effect = request
+        return AzureProvider("TOKEN", "org", "proj", session=session), session
+
+    def _gets(self, session, fragment):
+        return [
+            c
+            for c in session.request.call_args_list
+            if c.args[0] == "GET" and fragment in c.args[1]
+        ]
+
+    def test_lookups_are_issued_once_per_run(self):
+        provider, session = self._provider(
+            [
+                ("/_apis/projects/proj", _response(200, {"id": "project-id"})),
+                ("/_apis/git/repositories/app-gitops", _response(200, {"id": "repo-id"})),
+                ("/_apis/git/repositories/repo-id", _response(200)),
+                (
+                    "/_apis/policy/types",
+                    _response(
+                        200,
+                        {
+                            "value": [
+                                {"displayName": "Minimum number of reviewers", "id": "policy-id"}
+                            ]
+                        },
+                    ),
+                ),
+                ("/_apis/policy/configurations", _response(201)),
+                ("/_apis/hooks/subscriptions", _response(200, {"value": []})),
+            ]
+        )
+
+        self.assertTrue(provider.repo_exists("app-gitops"))
+        provider.set_default_branch("app-gitops", "develop")
+        provider.enable_branch_protection("app-gitops", "main")
+        provider.enable_branch_protection("app-gitops", "develop")
+        provider.create_webhook("app-gitops", "https://hooks.example.com")
+        provider.create_webhook("app-gitops", "https://hooks.example.com")
+
+        self.assertEqual(len(self._gets(session, "/_apis/git/repositories/app-gitops")), 1)
+        self.assertEqual(len(self._gets(session, "/_apis/policy/types")), 1)
+        self.assertEqual(len(self._gets(session, "/_apis/projects/proj")), 1)
+
+    def test_missing_lookups_are_not_cached(self):
+        provider, session = self._provider([("/_apis/git/repositories/app", _response(404))])
+
+        self.assertFalse(provider.repo_exists("app"))
+        self.assertFalse(provider.repo_exists("app"))
+        self.assertEqual(session.request.call_count, 2)
+
+
+class TestWebhookLookup(unittest.TestCase):
+    def test_github_pages_through_hooks_and_indexes_them(self):
+        session = MagicMock()
+        first = _response(200, [{"config": {"url": f"https://other/{i}"}} for i in range(100)])
+        first.links = {"next": {"url": "https://api.github.com/repos/acme/app/hooks?page=2"}}
+        second = _response(200, [{"config": {"url": "https://other/100"}}])
+        created = _response(
+            201, {"id": 1, "config": {"url": "https://hooks.example.com/github/push"}}
+        )
+        session.request.side_effect = [first, second, created]
+        provider = GitHubProvider("TOKEN", "acme", session=session)
+
+        provider.create_webhook("app", "https://hooks.example.com", "secret")
+        hook = provider.create_webhook("app", "https://hooks.example.com", "secret")
+
+        self.assertEqual(hook["id"], 1)
+        methods = [c.args[0] for c in session.request.call_args_list]
+        self.assertEqual(methods, ["GET", "GET", "POST"])
+        self.assertEqual(session.request.call_args_list[0].kwargs["params"], {"per_page": 100})
+        self.assertIsNone(session.request.call_args_list[1].kwargs["params"])
+
+    def test_github_failed_hook_listing_is_not_cached(self):
+        session = MagicMock()
+        first = _response(200, [{"config": {"url": "https://other/0"}}])
+        first.links = {"next": {"url": "https://api.github.com/repos/acme/app/hooks?page=2"}}
+        existing = {"id": 7, "config": {"url": "https://hooks.example.com/github/push"}}
+        session.request.side_effect = [first, _response(500), first, _response(200, [existing])]
+        provider = GitHubProvider("TOKEN", "acme", session=session)
+
+        target = "https://hooks.example.com/github/push"
+        self.assertIsNone(provider._find_hook("acme", "app", target))
+        self.assertNotIn(("hooks", "acme", "app"), provider._lookup_cache)
+        # The next lookup lists the hooks again and finds the existing one.
+        self.assertEqual(provider._find_hook("acme", "app", target), existing)
+
+    def test_github_skips_hook_listing_for_new_repo(self):
+        session = MagicMock()
+        session.request.side_effect = [
+            _response(201, {"name": "app", "owner": {"login": "acme"}}),
+            _response(201, {"id": 1}),
+        ]
+        provider = GitHubProvider("TOKEN", "acme", session=session)
+
+        repo = provider.create_repo("app")
+        provider.create_webhook(repo, "https://hooks.example.com", "secret")
+
+        self.assertEqual([c.args[0] for c in session.request.call_args_list], ["POST", "POST"])
+
+    def test_azure_queries_project_subscriptions_once(self):
+        session = MagicMock()
+        existing = {
+            "publisherInputs": {"repository": "repo-a"},
+            "consumerInputs": {"url": "https://hooks.example.com/azure/push"},
+        }
+
+        def request(method, url, **kwargs):
+            if "/_apis/projects/proj" in url:
+                return _response(200, {"id": "project-id"})
+            if "/_apis/hooks/subscriptionsquery" in url:
+                return _response(200, {"results": [existing]})
+            if "/_apis/hooks/subscriptions" in url:
+                return _response(200, {"id": "new"})
+            raise AssertionError(f"Unexpected request {method} {url}")
+
+        session.request.side_effect = request
+        provider = AzureProvider("TOKEN", "org", "proj", session=session)
+
+        self.assertIs(
+            provider.create_webhook({"id": "repo-a"}, "https://hooks.example.com"), existing
+        )
+        self.assertEqual(
+            provider.create_webhook({"id": "repo-b"}, "https://hooks.example.com"), {"id": "new"}
+        )
+        self.assertEqual(
+            provider.create_webhook({"id": "repo-b"}, "https://hooks.example.com"), {"id": "new"}
+        )
+
+        queries = [c for c in session.request.call_args_list if "subscriptionsquery" in c.args[1]]
+        self.assertEqual(len(queries), 1)
+        condition = queries[0].kwargs["json"]["publisherInputFilters"][0]["conditions"][0]
+        self.assertEqual(condition["inputValue"], "project-id")
+
+
+class TestWait(unittest.TestCase):
+    def test_backoff_grows_to_cap(self):
+        delays = backoff_delays(initial=1, maximum=8, jitter=0)
+        self.assertEqual([next(delays) for _ in range(5)], [1, 2, 4, 8, 8])
+
+    def test_wait_until_stops_on_first_value(self):
+        results = iter([None, None, "ready"])
+        with patch("luban_provisioner.providers.wait.time.sleep") as sleep:
+            result = wait_until(lambda: next(results), timeout=60, initial=1, jitter=0)
+        self.assertEqual((result.value, result.attempts), ("ready", 3))
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1, 2])
+
+    def test_wait_until_times_out(self):
+        with patch("luban_provisioner.providers.wait.time.sleep"):
+            result = wait_until(lambda: None, timeout=0)
+        self.assertTrue(result.timed_out)
+        self.assertEqual(result.attempts, 1)
+
+    def test_azure_create_project_polls_operation(self):
+        session = MagicMock()
+        operation_url = "https://dev.azure.com/org/_apis/operations/op-1"
+        statuses = iter(["queued", "inProgress", "succeeded"])
+        project_lookups = iter([_response(404), _response(200, {"id": "project-id"})])
+
+        def request(method, url, **kwargs):
+            if method == "POST" and "/_apis/projects" in url:
+                return _response(202, {"id": "op-1", "url": operation_url})
+            if "/_apis/projects/proj" in url:
+                return next(project_lookups)
+            if "/_apis/process/processes" in url:
+                return _response(200, {"value": []})
+            if url.startswith(operation_url):
+                return _response(200, {"id": "op-1", "status": next(statuses)})
+            if "/_apis/git/repositories" in url:
+                return _response(200, {"value": []})
+            raise AssertionError(f"Unexpected request {method} {url}")
+
+        session.request.side_effect = request
+        provider = AzureProvider("TOKEN", "org", "proj", session=session)
+
+        with patch("luban_provisioner.providers.wait.time.sleep") as sleep:
+            self.assertEqual(provider.create_project("proj")["id"], "op-1")
+
+        self.assertEqual(sleep.call_count, 2)
+        polls = [c for c in session.request.call_args_list if "/_apis/operations/" in c.args[1]]
+        self.assertEqual(len(polls), 3)
+
+    def test_azure_create_project_reports_failed_operation(self):
+        session = MagicMock()
+        operation_url = "https://dev.azure.com/org/_apis/operations/op-1"
+        statuses = iter(["inProgress", "failed"])
+
+        def request(method, url, **kwargs):
+            if method == "POST" and "/_apis/projects" in url:
+                return _response(202, {"id": "op-1", "url": operation_url})
+            if "/_apis/projects/proj" in url:
+                return _response(404)
+            if "/_apis/process/processes" in url:
+                return _response(200, {"value": []})
+            if url.startswith(operation_url):
+                return _response(
+                    200,
+                    {"id": "op-1", "status": next(statuses), "resultMessage": "Name is reserved"},
+                )
+            raise AssertionError(f"Unexpected request {method} {url}")
+
+        session.request.side_effect = request
+        provider = AzureProvider("TOKEN", "org", "proj", session=session)
+
+        with (
+            patch("luban_provisioner.providers.wait.time.sleep"),
+            patch("luban_provisioner.providers.azure.click.echo") as echo,
+        ):
+            self.assertIsNone(provider.create_project("proj"))
+
+        output = "\n".join(str(c.args[0]) for c in echo.call_args_list)
+        self.assertIn("Operation op-1 failed", output)
+        self.assertIn("Name is reserved", output)
+        self.assertIn("Project 'proj' creation failed.", output)
+        self.assertNotIn("Timeout", output)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch.multiple(
+            "luban_provisioner.providers.http.time",
+            monotonic=self.clock.monotonic,
+            time=self.clock.time,
+            sleep=self.clock.sleep,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bucket_paces_after_burst(self):
+        limiter = RateLimiter(rate=2, burst=2)
+        for _ in range(4):
+            limiter.acquire()
+        self.assertAlmostEqual(self.clock.now, 1001.0)
+
+    def test_low_budget_spreads_requests_until_reset(self):
+        limiter = RateLimiter(rate=10, burst=1)
+        limiter.update({"X-RateLimit-Remaining": "5", "X-RateLimit-Reset": "1010"})
+        self.assertEqual(limiter.status()["remaining"], 5)
+        self.assertAlmostEqual(limiter.rate, 0.5)
+
+        limiter.update({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "1030"})
+        limiter.acquire()
+        self.assertAlmostEqual(self.clock.now, 1030.0)
+
+    def test_healthy_budget_keeps_configured_rate(self):
+        limiter = RateLimiter(rate=10, burst=1)
+        limiter.update(
+            {
+                "X-RateLimit-Limit": "5000",
+                "X-RateLimit-Remaining": "4990",
+                "X-RateLimit-Reset": "4500",
+            }
+        )
+        self.assertEqual(limiter.rate, 10)
+
+        limiter.update({"X-RateLimit-Remaining": "350", "X-RateLimit-Reset": "4500"})
+        self.assertAlmostEqual(limiter.rate, 0.2)
+
+    def test_graphql_and_rest_budgets_are_separate(self):
+        session = MagicMock()
+        session.request.side_effect = [
+            _response(
+                200,
+                {"data": {}},
+                headers={
+                    "X-RateLimit-Resource": "graphql",
+                    "X-RateLimit-Limit": "5000",
+                    "X-RateLimit-Remaining": "10",
+                    "X-RateLimit-Reset": "1100",
+                },
+            ),
+            _response(
+                200,
+                {"login": "bot"},
+                headers={
+                    "X-RateLimit-Resource": "core",
+                    "X-RateLimit-Limit": "5000",
+                    "X-RateLimit-Remaining": "4999",
+                    "X-RateLimit-Reset": "1100",
+                },
+            ),
+        ]
+        provider = GitHubProvider("TOKEN", "acme", session=session)
+
+        with patch.dict(http._LIMITERS, clear=True):
+            provider._send("POST", "https://api.github.com/graphql", json={})
+            provider.get_current_user()
+            status = http.rate_limit_status()
+
+        self.assertAlmostEqual(status["api.github.com (graphql)"]["rate"], 0.2)
+        self.assertEqual(status["api.github.com"]["rate"], RateLimiter().base_rate)
+
+    def test_provider_retries_after_retry_after(self):
+        session = MagicMock()
+        throttled = _response(429, headers={"Retry-After": "7"})
+        session.request.side_effect = [throttled, _response(200, {"login": "bot"})]
+        provider = GitHubProvider("TOKEN", "acme", session=session)
+
+        with patch.dict(http._LIMITERS, clear=True):
+            self.assertEqual(provider.get_current_user(), "bot")
+
+        self.assertEqual(session.request.call_count, 2)
+        self.assertAlmostEqual(self.clock.now, 1007.0)
+
+
+def _http_response(status_code, payload=None, headers=None):
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp.headers.update(headers or {})
+    resp._content = json.dumps(payload).encode() if payload is not None else b""
+    resp.url = "https://api.github.com/user"
+    return resp
+
+
+class TestETagCache(unittest.TestCase):
+    def setUp(self):
+        cache_dir = self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        env = patch.dict(os.environ, {"LUBAN_HTTP_CACHE_DIR": cache_dir})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def test_not_modified_is_served_from_cache(self):
+        session = MagicMock()
+        session.request.side_effect = [
+            _http_response(200, {"login": "bot"}, {"ETag": '"v1"'}),
+            _http_response(304, headers={"ETag": '"v1"', "X-RateLimit-Remaining": "4999"}),
+        ]
+
+        self.assertEqual(GitHubProvider("TOKEN", "acme", session=session).get_current_user(), "bot")
+        self.assertEqual(GitHubProvider("TOKEN", "acme", session=session).get_current_user(), "bot")
+
+        first, second = session.request.call_args_list
+        self.assertNotIn("If-None-Match", first.kwargs["headers"])
+        self.assertEqual(second.kwargs["headers"]["If-None-Match"], '"v1"')
+
+    def test_cache_is_keyed_by_credential(self):
+        session = MagicMock()
+        session.request.side_effect = [
+            _http_response(200, {"login": "bot"}, {"ETag": '"v1"'}),
+            _http_response(200, {"login": "other"}, {"ETag": '"v2"'}),
+        ]
+
+        GitHubProvider("TOKEN", "acme", session=session).get_current_user()
+        self.assertEqual(
+            GitHubProvider("OTHER", "acme", session=session).get_current_user(), "other"
+        )
+        self.assertNotIn("If-None-Match", session.request.call_args_list[1].kwargs["headers"])
+
+    def test_cache_files_are_private(self):
+        os.chmod(self.cache_dir, 0o755)
+        session = MagicMock()
+        session.request.return_value = _http_response(200, {"login": "bot"}, {"ETag": '"v1"'})
+
+        GitHubProvider("TOKEN", "acme", session=session).get_current_user()
+
+        self.assertEqual(os.stat(self.cache_dir).st_mode & 0o777, 0o700)
+        (shard,) = os.listdir(self.cache_dir)
+        shard = os.path.join(self.cache_dir, shard)
+        self.assertEqual(os.stat(shard).st_mode & 0o777, 0o700)
+        (entry,) = os.listdir(shard)
+        self.assertEqual(os.stat(os.path.join(shard, entry)).st_mode & 0o777, 0o600)
+
+    def test_expired_and_least_recently_used_entries_are_dropped(self):
+        cache = http.ETagCache(self.cache_dir, max_age=3600, max_entries=2)
+        keys = [
+            cache.key(f"https://api.github.com/repos/acme/r{i}", None, "TOKEN") for i in range(4)
+        ]
+        now = time.time()
+        for i, key in enumerate(keys):
+            cache.store(key, _http_response(200, {"i": i}, {"ETag": f'"v{i}"'}))
+            # r0 is expired, r1 is the oldest of the rest
+            age = 7200 if i == 0 else 300 - i
+            os.utime(cache._path(key), (now - age, now - age))
+
+        self.assertIsNone(cache.load(keys[0]))
+        self.assertFalse(os.path.exists(cache._path(keys[0])))
+
+        cache.prune()
+        self.assertEqual([cache.load(key) is not None for key in keys], [False, False, True, True])
+
+
+class TestRepoIndex(unittest.TestCase):
+    def test_github_existence_checks_use_inventory(self):
+        session = MagicMock()
+        page = _response(200, [{"name": "Orders"}, {"name": "billing-gitops"}])
+        session.request.side_effect = [
+            page,
+            _response(201, {"name": "new-app", "owner": {"login": "acme"}}),
+        ]
+        provider = GitHubProvider("TOKEN", "acme", session=session)
+
+        self.assertEqual(len(provider.load_repo_index()), 2)
+        self.assertTrue(provider.repo_exists("orders"))
+        self.assertFalse(provider.repo_exists("new-app"))
+        provider.create_repo("new-app")
+        self.assertTrue(provider.repo_exists("new-app"))
+
+        list_call = session.request.call_args_list[0]
+        self.assertTrue(list_call.args[1].endswith("/orgs/acme/repos"))
+        self.assertEqual(list_call.kwargs["params"], {"per_page": 100, "type": "all"})
+        self.assertEqual(session.request.call_count, 2)
+
+    def test_github_failed_page_is_not_indexed(self):
+        session = MagicMock()
+        first = _response(200, [{"name": "orders"}])
+        first.links = {"next": {"url": "https://api.github.com/orgs/acme/repos?page=2"}}
+        session.request.side_effect = [
+            first,
+            _response(502),
+            _response(200, {"login": "someone"}),
+            _response(200, {"name": "billing"}),
+        ]
+        provider = GitHubProvider("TOKEN", "acme", session=session)
+
+        self.assertIsNone(provider.load_repo_index())
+        self.assertIsNone(provider._fresh_repo_index())
+        # Existence falls back to a direct lookup instead of a partial index.
+        self.assertTrue(provider.repo_exists("billing"))
+        self.assertTrue(session.request.call_args_list[3].args[1].endswith("/repos/acme/billing"))
+
+    def test_expired_index_falls_back_to_lookups(self):
+        session = MagicMock()
+        session.request.side_effect = [
+            _response(200, {"value": [{"name": "app", "id": "repo-id"}]}),
+            _response(404),
+        ]
+        provider = AzureProvider("TOKEN", "org", "proj", session=session)
+        provider.load_repo_index()
+        self.assertEqual(provider._get_repo_id("app"), "repo-id")
+
+        # time.monotonic is patched process-wide, so keep the skewed clock out
+        # of the shared rate limiters.
+        with (
+            patch.dict(os.environ, {"LUBAN_REPO_INDEX_TTL": "0"}),
+            patch.dict(http._LIMITERS, clear=True),
+        ):
+            with patch("luban_provisioner.providers.base.time.monotonic", return_value=1e12):
+                self.assertFalse(provider.repo_exists("app"))
+        self.assertEqual(session.request.call_count, 2)
+
+
+class TestUpdateFiles(unittest.TestCase):
+    def _github_commit_responses(self, tip, text, commit, ref_update):
+        return [
+            _response(200, {"object": {"sha": tip}}),
+            _response(200, {"content": base64.b64encode(text.encode()).decode()}),
+            _response(200, {"tree": {"sha": f"tree-{tip}"}}),
+            _response(201, {"sha": f"blob-{commit}"}),
+            _response(201, {"sha": f"tree-{commit}"}),
+            _response(201, {"sha": commit}),
+            ref_update,
+        ]
+
+    def test_github_git_data_api_retries_on_non_fast_forward(self):
+        rejected = _response(422, {"message": "Update is not a fast forward"})
+        rejected.text = '{"message": "Update is not a fast forward"}'
+        session = MagicMock()
+        session.request.side_effect = self._github_commit_responses(
+            "tip-1", "tag: v1\n", "c1", rejected
+        ) + self._github_commit_responses(
+            "tip-2", "tag: v1\nother: x\n", "c2", _response(200, {"object": {"sha": "c2"}})
+        )
+        provider = GitHubProvider("TOKEN", "acme", session=session)
+
+        with patch("luban_provisioner.providers.base.time.sleep"):
+            commit = provider.update_file(
+                "app-gitops",
+                "develop",
+                "app/overlays/prd/kustomization.yaml",
+                lambda text: text.replace("v1", "v2"),
+                "Promote",
+            )
+
+        self.assertEqual(commit, "c2")
+        calls = session.request.call_args_list[7:]
+        self.assertTrue(calls[0].args[1].endswith("/repos/acme/app-gitops/git/ref/heads/develop"))
+        self.assertEqual(calls[1].kwargs["params"], {"ref": "tip-2"})
+        self.assertEqual(calls[3].kwargs["json"]["content"], "tag: v2\nother: x\n")
+        tree = calls[4].kwargs["json"]
+        self.assertEqual(tree["base_tree"], "tree-tip-2")
+        self.assertEqual(
+            tree["tree"],
+            [
+                {
+                    "path": "app/overlays/prd/kustomization.yaml",
+                    "mode": "100644",
+                    "type": "blob",
+                    "sha": "blob-c2",
+                }
+            ],
+        )
+        self.assertEqual(calls[5].kwargs["json"]["parents"], ["tip-2"])
+        self.assertEqual(calls[6].args[0], "PATCH")
+        self.assertTrue(calls[6].args[1].endswith("/git/refs/heads/develop"))
+        self.assertEqual(calls[6].kwargs["json"], {"sha": "c2", "force": False})
+
+    def test_github_other_ref_update_errors_are_not_retried(self):
+        failed = _response(422)
+        failed.text = '{"message": "Reference cannot be updated"}'
+        session = MagicMock()
+        session.request.side_effect = self._github_commit_responses("tip-1", "a: 1\n", "c1", failed)
+        provider = GitHubProvider("TOKEN", "acme", session=session)
+
+        with self.assertRaisesRegex(RuntimeError, "Reference cannot be updated"):
+            provider.update_file("repo", "main", "x.yaml", lambda text: "a: 2\n", "m")
+        self.assertEqual(session.request.call_count, 7)
+
+    def test_azure_pushes_all_changes_against_read_tip(self):
+        session = MagicMock()
+        session.request.side_effect = [
+            _response(200, {"id": "repo-id"}),
+            _response(200, {"value": [{"name": "refs/heads/develop", "objectId": "tip-1"}]}),
+            _response(200, {"content": "load_from: []\n"}),
+            _response(404),
+            _response(201, {"commits": [{"commitId": "c1"}]}),
+        ]
+        provider = AzureProvider("TOKEN", "org", "proj", session=session)
+
+        commit = provider.update_files(
+            "platform-gitops",
+            "develop",
+            ["ws.yaml", "new.yaml"],
+            lambda files: {"ws.yaml": "load_from: [a]\n", "new.yaml": "x: 1\n"},
+            "Register",
+        )
+
+        self.assertEqual(commit, "c1")
+        push = session.request.call_args_list[4]
+        self.assertIn("/_apis/git/repositories/repo-id/pushes", push.args[1])
+        payload = push.kwargs["json"]
+        self.assertEqual(payload["refUpdates"][0]["oldObjectId"], "tip-1")
+        changes = payload["commits"][0]["changes"]
+        self.assertEqual([c["changeType"] for c in changes], ["edit", "add"])
+        self.assertEqual(changes[1]["item"]["path"], "/new.yaml")
+
+    def test_unchanged_content_is_not_written(self):
+        session = MagicMock()
+        session.request.side_effect = [_response(200, {"object": {"sha": "tip"}}), _response(404)]
+        provider = GitHubProvider("TOKEN", "acme", session=session)
+
+        self.assertIsNone(provider.update_file("repo", "main", "x.yaml", lambda text: text, "m"))
+        self.assertEqual(session.request.call_count, 2)
+
+
+class TestGitHubGraphQL(unittest.TestCase):
+    def test_factory_selects_graphql_mode(self):
+        with patch.dict(os.environ, {"GITHUB_API_MODE": "graphql"}):
+            provider = get_git_provider("github", "TOKEN", organization="acme")
+        self.assertIsInstance(provider, GitHubGraphQLProvider)
+        self.assertEqual(provider.graphql_url, "https://api.github.com/graphql")
+
+    def test_create_and_protect_with_mutations(self):
+        session = MagicMock()
+        session.request.side_effect = [
+            _response(
+                200,
+                {"data": {"viewer": {"login": "bot", "id": "U1"}, "organization": {"id": "O1"}}},
+            ),
+            _response(
+                200,
+                {
+                    "data": {
+                        "createRepository": {
+                            "repository": {
+                                "id": "R1",
+                                "name": "app-gitops",
+                                "nameWithOwner": "acme/app-gitops",
+                                "url": "https://github.com/acme/app-gitops",
+                                "owner": {"login": "acme"},
+                            }
+                        }
+                    }
+                },
+            ),
+            _response(
+                200,
+                {"data": {"createBranchProtectionRule": {"branchProtectionRule": {"id": "P1"}}}},
+            ),
+        ]
+        provider = GitHubGraphQLProvider("TOKEN", "acme", session=session)
+
+        repo = provider.create_repo("app-gitops", description="GitOps")
+        self.assertEqual(repo["full_name"], "acme/app-gitops")
+        self.assertTrue(provider.enable_branch_protection(repo, "main"))
+
+        calls = session.request.call_args_list
+        self.assertEqual([c.args[0] for c in calls], ["POST", "POST", "POST"])
+        create_input = calls[1].kwargs["json"]["variables"]["input"]
+        self.assertEqual(create_input["ownerId"], "O1")
+        rule_input = calls[2].kwargs["json"]["variables"]["input"]
+        self.assertEqual((rule_input["repositoryId"], rule_input["pattern"]), ("R1", "main"))
+
+    def test_user_owner_when_not_an_org(self):
+        session = MagicMock()
+        session.request.return_value = _response(
+            200,
+            {
+                "data": {"viewer": {"login": "bot", "id": "U1"}, "organization": None},
+                "errors": [{"type": "NOT_FOUND"}],
+            },
+        )
+        provider = GitHubGraphQLProvider("TOKEN", "someone-else", session=session)
+        self.assertIsNone(provider.create_repo("app"))
+        self.assertEqual(session.request.call_count, 1)
+
+
+class TestAsyncProvider(unittest.TestCase):
+    def test_independent_calls_overlap(self):
+        # Both calls block until the other has started, so this only finishes
+        # if they run concurrently.
+        barrier = threading.Barrier(2, timeout=5)
+        provider = MagicMock()
+        provider.set_default_branch.side_effect = lambda *a, **k: barrier.wait() is not None
+        provider.enable_branch_protection.side_effect = lambda *a, **k: barrier.wait() is not None
+
+        async_provider = AsyncGitProvider(provider)
+        results = run_concurrently(
+            async_provider.set_default_branch("repo", "develop"),
+            async_provider.enable_branch_protection("repo", "main"),
+        )
+
+        self.assertEqual(results, [True, True])
+        provider.enable_branch_protection.assert_called_once_with("repo", "main", min_reviewers=1)
+
+    def test_plain_callables_run_in_threads(self):
+        self.assertEqual(run_concurrently(lambda: 1, lambda: 2), [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
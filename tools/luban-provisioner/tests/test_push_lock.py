@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest.mock import patch
+
+from luban_provisioner import utils
+from luban_provisioner.utils import LeaseLock, commit_and_push
+
+
+class FakeLeaseStore:
+    """In-memory stand-in for the kubectl calls LeaseLock makes."""
+
+    def __init__(self):
+        self.lease = None
+        self.version = 0
+
+    def _result(self, code, stdout="", stderr=""):
+        return subprocess.CompletedProcess([], code, stdout=stdout, stderr=stderr)
+
+    def kubectl(self, *args, manifest=None):
+        if args[0] == "get":
+            if self.lease is None:
+                return self._result(1, stderr='Error from server (NotFound): leases "x" not found')
+            return self._result(0, stdout=json.dumps(self.lease))
+        if args[0] == "create" and self.lease is not None:
+            return self._result(1, stderr="Error from server (AlreadyExists)")
+        if args[0] == "replace":
+            if manifest["metadata"]["resourceVersion"] != self.lease["metadata"]["resourceVersion"]:
+                return self._result(1, stderr="Error from server (Conflict)")
+        self.version += 1
+        self.lease = json.loads(json.dumps(manifest))
+        self.lease["metadata"]["resourceVersion"] = str(self.version)
+        return self._result(0, stdout=json.dumps(self.lease))
+
+
+class TestLeaseLock(unittest.TestCase):
+    def setUp(self):
+        self.store = FakeLeaseStore()
+        patcher = patch.object(LeaseLock, "_kubectl", self.store.kubectl)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _lock(self, holder):
+        return LeaseLock("luban-push-test", namespace="luban-ci", holder=holder, timeout=0)
+
+    def test_second_holder_waits_until_release(self):
+        first, second = self._lock("pod-a"), self._lock("pod-b")
+        first.acquire()
+        self.assertEqual(self.store.lease["spec"]["holderIdentity"], "pod-a")
+        with patch("luban_provisioner.utils.time.sleep"):
+            with self.assertRaises(TimeoutError):
+                second.acquire()
+
+        first.release()
+        self.assertIsNone(self.store.lease["spec"]["holderIdentity"])
+        second.acquire()
+        self.assertEqual(self.store.lease["spec"]["holderIdentity"], "pod-b")
+        second.release()
+
+    def test_expired_lease_is_taken_over(self):
+        stale = self._lock("pod-a")
+        self.store.kubectl("create", manifest=stale._manifest(None, "pod-a"))
+        expired = utils._utcnow() - timedelta(seconds=120)
+        self.store.lease["spec"]["renewTime"] = utils._format_micro_time(expired)
+
+        lock = self._lock("pod-b")
+        lock.acquire()
+        self.assertEqual(self.store.lease["spec"]["holderIdentity"], "pod-b")
+        lock.release()
+
+
+@unittest.skipUnless(shutil.which("git"), "git is required")
+class TestPushMetrics(unittest.TestCase):
+    def test_commit_and_push_appends_metrics(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        origin = os.path.join(tmp, "origin.git")
+        repo = os.path.join(tmp, "repo")
+        metrics_file = os.path.join(tmp, "metrics.jsonl")
+        env = {
+            "GIT_AUTHOR_NAME": "Test",
+            "GIT_AUTHOR_EMAIL": "test@example.com",
+            "GIT_COMMITTER_NAME": "Test",
+            "GIT_COMMITTER_EMAIL": "test@example.com",
+            "GIT_CONFIG_GLOBAL": os.devnull,
+            "LUBAN_PUSH_LOCK": "",
+            "LUBAN_PUSH_METRICS_FILE": metrics_file,
+        }
+        with patch.dict(os.environ, env):
+            subprocess.run(["git", "init", "--bare", "-b", "main", origin], check=True)
+            subprocess.run(["git", "init", "-b", "main", repo], check=True)
+            subprocess.run(["git", "remote", "add", "origin", origin], cwd=repo, check=True)
+            with open(os.path.join(repo, "README.md"), "w") as f:
+                f.write("hello\n")
+            commit_and_push(repo, "Initial", branch="main")
+
+        with open(metrics_file, encoding="utf-8") as f:
+            (line,) = f.read().splitlines()
+        metrics = json.loads(line)
+        self.assertEqual(metrics["lock"], "none")
+        self.assertEqual(metrics["attempts"], 1)
+        self.assertEqual(metrics["result"], "ok")
+
+
+if __name__ == "__main__":
+    unittest.main()
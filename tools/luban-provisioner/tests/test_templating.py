@@ -0,0 +1,166 @@
+import filecmp
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from cookiecutter.exceptions import OutputDirExistsException
+from cookiecutter.main import cookiecutter
+
+from luban_provisioner import templating
+from luban_provisioner.bundle import build_bundle
+from luban_provisioner.utils import render_template
+
+TEMPLATES = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "templates"))
+CONTEXT = {
+    "project_name": "orders",
+    "admin_group": "admins",
+    "developer_group": "devs",
+    "git_organization": "acme",
+    "git_provider": "github",
+}
+
+
+def _tree(root):
+    return sorted(
+        os.path.relpath(os.path.join(dirpath, name), root)
+        for dirpath, _, files in os.walk(root)
+        for name in files
+    )
+
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        # Work on a copy so the test can edit the template.
+        self.template = os.path.join(self.tmp, "infra-ci-overlay")
+        shutil.copytree(os.path.join(TEMPLATES, "infra-ci-overlay"), self.template)
+        cache = patch.dict(templating._COMPILED, clear=True)
+        cache.start()
+        self.addCleanup(cache.stop)
+
+    def test_output_matches_cookiecutter(self):
+        expected = os.path.join(self.tmp, "expected")
+        actual = os.path.join(self.tmp, "actual")
+        cookiecutter(self.template, no_input=True, output_dir=expected, extra_context=CONTEXT)
+        stats = templating.render_cached(self.template, actual, CONTEXT)
+
+        self.assertEqual(stats.project_dir, os.path.join(actual, "ci-orders"))
+        self.assertEqual(_tree(expected), _tree(actual))
+        for rel in _tree(expected):
+            self.assertTrue(
+                filecmp.cmp(os.path.join(expected, rel), os.path.join(actual, rel), shallow=False),
+                rel,
+            )
+
+    def test_rerender_writes_only_changed_files(self):
+        out = os.path.join(self.tmp, "out")
+        first = templating.render_cached(self.template, out, CONTEXT)
+        compiled = templating.get_compiled_template(self.template)
+
+        again = templating.render_cached(self.template, out, CONTEXT, overwrite=True)
+        self.assertEqual(again.written, [])
+        self.assertEqual(again.unchanged, len(first.written))
+        self.assertIs(templating.get_compiled_template(self.template), compiled)
+
+        changed = templating.render_cached(
+            self.template, out, {**CONTEXT, "developer_group": "engineers"}, overwrite=True
+        )
+        self.assertEqual(
+            [os.path.basename(path) for path in changed.written], ["project-users-patch.yaml"]
+        )
+
+    def test_template_edit_recompiles(self):
+        compiled = templating.get_compiled_template(self.template)
+        path = os.path.join(self.template, "{{cookiecutter.namespace}}", "namespace.yaml")
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("# edited\n")
+
+        self.assertIsNot(templating.get_compiled_template(self.template), compiled)
+        out = os.path.join(self.tmp, "out")
+        templating.render_cached(self.template, out, CONTEXT)
+        with open(os.path.join(out, "ci-orders", "namespace.yaml"), encoding="utf-8") as f:
+            self.assertTrue(f.read().endswith("# edited\n"))
+
+    def test_existing_output_requires_overwrite(self):
+        out = os.path.join(self.tmp, "out")
+        render_template(self.template, out, CONTEXT)
+        with self.assertRaises(OutputDirExistsException):
+            render_template(self.template, out, CONTEXT)
+
+    def test_templates_with_hooks_use_cookiecutter(self):
+        os.makedirs(os.path.join(self.template, "hooks"))
+        with patch("luban_provisioner.utils.cookiecutter") as run:
+            render_template(self.template, os.path.join(self.tmp, "out"), CONTEXT)
+        run.assert_called_once()
+
+
+class TestTemplateBundle(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.bundle_path = os.path.join(self.tmp, "templates.zip")
+        build_bundle(TEMPLATES, self.bundle_path)
+        for cache in (templating._COMPILED, templating._BUNDLES):
+            p = patch.dict(cache, clear=True)
+            p.start()
+            self.addCleanup(p.stop)
+        for p in (
+            patch.object(templating, "TEMPLATES_DIR", os.path.join(self.tmp, "missing")),
+            patch.dict(os.environ, {"LUBAN_TEMPLATE_BUNDLE": self.bundle_path}),
+        ):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_bundled_render_matches_directory_render(self):
+        bundled = templating.resolve_template("infra-ci-base")
+        self.assertIsInstance(bundled, templating.BundledTemplate)
+
+        from_bundle = os.path.join(self.tmp, "bundle")
+        from_dir = os.path.join(self.tmp, "dir")
+        templating.render_cached(bundled, from_bundle, CONTEXT)
+        templating.render_cached(os.path.join(TEMPLATES, "infra-ci-base"), from_dir, CONTEXT)
+        self.assertEqual(_tree(from_dir), _tree(from_bundle))
+        for rel in _tree(from_dir):
+            expected, actual = os.path.join(from_dir, rel), os.path.join(from_bundle, rel)
+            self.assertTrue(filecmp.cmp(expected, actual, shallow=False), rel)
+            self.assertEqual(os.stat(expected).st_mode, os.stat(actual).st_mode, rel)
+
+    def test_build_is_deterministic(self):
+        again = os.path.join(self.tmp, "again.zip")
+        build_bundle(TEMPLATES, again)
+        with open(self.bundle_path, "rb") as a, open(again, "rb") as b:
+            self.assertEqual(a.read(), b.read())
+
+    def test_resolve_order(self):
+        local = os.path.join(self.tmp, "tools", "luban-provisioner", "templates", "infra-ci-base")
+        shutil.copytree(os.path.join(TEMPLATES, "infra-ci-base"), local)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.tmp)
+
+        self.assertIsInstance(
+            templating.resolve_template("infra-ci-base"), templating.BundledTemplate
+        )
+        self.assertIsNone(templating.resolve_template("no-such-template"))
+        with patch.dict(os.environ, {"LUBAN_TEMPLATE_BUNDLE": "off"}):
+            self.assertEqual(
+                os.path.realpath(templating.resolve_template("infra-ci-base")),
+                os.path.realpath(local),
+            )
+
+    def test_bundled_templates_with_hooks_are_extracted_for_cookiecutter(self):
+        name = "source/luban-dagster-dbt-starrocks-code-location-source-template"
+        bundled = templating.resolve_template(name)
+        self.assertTrue(templating.has_hooks(bundled))
+
+        with patch("luban_provisioner.utils.cookiecutter") as run:
+            render_template(bundled, os.path.join(self.tmp, "out"), CONTEXT)
+        extracted = run.call_args.args[0]
+        self.addCleanup(shutil.rmtree, extracted)
+        self.assertEqual(_tree(extracted), _tree(os.path.join(TEMPLATES, name)))
+
+
+if __name__ == "__main__":
+    unittest.main()